@@ -55,9 +55,15 @@ setup(
     install_requires=[
         'botocore>=1.6.5',
         'click>=6.7,<7.0',
+        'futures>=3.1.1; python_version < "3"',
+        'scandir>=1.7; python_version < "3.5"',
         'thrift==0.10.0',
         'typing==3.6.4',
     ],
+    extras_require={
+        'hive': ['hmsclient'],
+        'inventory': ['pyarrow'],
+    },
     entry_points={
         'console_scripts': [
             'pdsm = pdsm.cli:main',
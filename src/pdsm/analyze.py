@@ -0,0 +1,198 @@
+import heapq
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+from typing import Tuple     # noqa: F401
+from typing import TYPE_CHECKING
+
+from .dataset import NAME_VERSION
+from .keys import KeyClassifier
+from .storage import get_storage
+from .trace import span
+from .utils import ensure_trailing_slash
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .parquet.ttypes import FileMetaData  # noqa: F401
+
+MB = 1024 * 1024
+
+# upper bounds of the file size histogram buckets, the last one is open
+SIZE_BUCKETS = [1 * MB, 16 * MB, 64 * MB, 128 * MB, 256 * MB, 1024 * MB]
+
+
+def size_bucket(size):
+    # type: (int) -> int
+    for idx, limit in enumerate(SIZE_BUCKETS):
+        if size < limit:
+            return idx
+    return len(SIZE_BUCKETS)
+
+
+def bucket_label(idx):
+    # type: (int) -> Text
+    if idx == len(SIZE_BUCKETS):
+        return u'>={}M'.format(SIZE_BUCKETS[-1] // MB)
+    return u'<{}M'.format(SIZE_BUCKETS[idx] // MB)
+
+
+class LayoutStats(object):
+    __slots__ = ['files', 'total_size', 'small_files', 'histogram', 'sampled', 'row_groups', 'row_group_size',
+                 'rows']
+
+    def __init__(self):
+        # type: () -> None
+        self.files = 0
+        self.total_size = 0
+        self.small_files = 0
+        self.histogram = [0] * (len(SIZE_BUCKETS) + 1)
+        self.sampled = []  # type: List[Tuple[Text, int]]
+        self.row_groups = 0
+        self.row_group_size = 0
+        self.rows = 0
+
+    def add(self, size, small_file_size):
+        # type: (int, int) -> None
+        self.files += 1
+        self.total_size += size
+        if size < small_file_size:
+            self.small_files += 1
+        self.histogram[size_bucket(size)] += 1
+
+    def add_footer(self, metadata):
+        # type: (FileMetaData) -> None
+        for row_group in metadata.row_groups or []:
+            self.row_groups += 1
+            self.row_group_size += row_group.total_byte_size
+            self.rows += row_group.num_rows
+
+    def merge(self, other):
+        # type: (LayoutStats) -> None
+        self.files += other.files
+        self.total_size += other.total_size
+        self.small_files += other.small_files
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        self.row_groups += other.row_groups
+        self.row_group_size += other.row_group_size
+        self.rows += other.rows
+
+    def small_file_ratio(self):
+        # type: () -> float
+        return float(self.small_files) / self.files if self.files else 0.0
+
+    def mean_row_group_size(self):
+        # type: () -> Optional[int]
+        return self.row_group_size // self.row_groups if self.row_groups else None
+
+    def excess_files(self, target_size):
+        # type: (int) -> int
+        # the number of files compacting into target sized files would remove
+        ideal = max(1, -(-self.total_size // target_size))
+        return max(0, self.files - ideal) if self.small_files > 1 else 0
+
+
+class LayoutReport(object):
+    __slots__ = ['location', 'small_file_size', 'sample', 'dataset', 'partitions', 'lock']
+
+    def __init__(self, location, small_file_size=128 * MB, sample=1):
+        # type: (Text, int, int) -> None
+        self.location = location
+        self.small_file_size = small_file_size
+        self.sample = sample
+        self.dataset = LayoutStats()
+        self.partitions = {}  # type: Dict[Text, LayoutStats]
+        self.lock = threading.Lock()
+
+    def add(self, partition_name, summary):
+        # type: (Text, Dict[Text, Any]) -> None
+        # per partition state is a fixed number of counters plus at most
+        # `sample` keys, independent of the number of objects listed
+        stats = self.partitions.get(partition_name)
+        if stats is None:
+            stats = self.partitions[partition_name] = LayoutStats()
+        stats.add(summary['Size'], self.small_file_size)
+        if len(stats.sampled) < self.sample:
+            stats.sampled.append((summary['Key'], summary['Size']))
+
+    def read_footers(self, storage, bucket, workers=16):
+        # type: (Any, Text, int) -> None
+        def read_footer(item):
+            # type: (Tuple[LayoutStats, Text, int]) -> None
+            stats, key, size = item
+            metadata = storage.read_metadata(bucket, key, size)
+            with self.lock:
+                stats.add_footer(metadata)
+
+        items = [(stats, key, size) for stats in self.partitions.values() for key, size in stats.sampled]
+        with span('read_footers', count=len(items)):
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for _ in executor.map(read_footer, items):
+                    pass
+        for stats in self.partitions.values():
+            stats.sampled = []
+            self.dataset.merge(stats)
+
+    def candidates(self, limit=None):
+        # type: (Optional[int]) -> List[Tuple[Text, LayoutStats]]
+        scored = ((stats.excess_files(self.small_file_size), name, stats) for name, stats in self.partitions.items())
+        scored = (item for item in scored if item[0] > 0)
+        if limit is None:
+            ranked = sorted(scored, reverse=True)
+        else:
+            ranked = heapq.nlargest(limit, scored)
+        return [(name, stats) for _, name, stats in ranked]
+
+    def format(self, limit=None):
+        # type: (Optional[int]) -> Iterable[Text]
+        yield format_stats(self.location, self.dataset)
+        yield u'  sizes: {}'.format(u' '.join(
+            u'{}={}'.format(bucket_label(idx), count) for idx, count in enumerate(self.dataset.histogram)))
+        for name in sorted(self.partitions):
+            yield u'  ' + format_stats(name or u'(unpartitioned)', self.partitions[name])
+        candidates = self.candidates(limit)
+        if candidates:
+            yield u'compaction candidates:'
+            for name, stats in candidates:
+                yield u'  {} excess_files={} small_files={} size={}'.format(
+                    name or u'(unpartitioned)', stats.excess_files(self.small_file_size), stats.small_files,
+                    stats.total_size)
+
+
+def format_stats(name, stats):
+    # type: (Text, LayoutStats) -> Text
+    line = u'{} files={} size={} mean_size={} small_ratio={:.2f}'.format(
+        name, stats.files, stats.total_size, stats.total_size // stats.files if stats.files else 0,
+        stats.small_file_ratio())
+    mean_row_group_size = stats.mean_row_group_size()
+    if mean_row_group_size is not None:
+        line += u' row_groups={} mean_row_group_size={}'.format(stats.row_groups, mean_row_group_size)
+    return line
+
+
+def analyze(location, small_file_size=128 * MB, sample=1, summaries=None):
+    # type: (Text, int, int, Optional[Iterable[Dict[Text, Any]]]) -> Optional[LayoutReport]
+    location = ensure_trailing_slash(location)
+    storage = get_storage(location)
+    bucket, prefix = storage.split(location)
+    if not re.search(NAME_VERSION, prefix):
+        return None
+
+    report = LayoutReport(location, small_file_size, sample)
+    if summaries is None:
+        summaries = storage.list_objects(bucket, prefix)
+    classifier = KeyClassifier(prefix)
+    with span('list_objects', location=location):
+        for summary in summaries:
+            partition_name = classifier.classify(summary['Key'], summary['Size'])
+            if partition_name is not None:
+                report.add(partition_name, summary)
+    if not report.partitions:
+        return None
+
+    report.read_footers(storage, bucket)
+    return report
@@ -0,0 +1,326 @@
+from typing import Any       # noqa: F401
+from typing import Callable  # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+
+from .glue import Table
+from .models import Column
+from .models import Partition
+from .models import STORAGE_DESCRIPTOR_TEMPLATE
+from .trace import span
+from .utils import chunks
+from .utils import ensure_trailing_slash
+from .utils import remove_trailing_slash
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue  # type: ignore
+
+METASTORE_ERRORS = [
+    'AlreadyExistsException',
+    'InvalidObjectException',
+    'InvalidOperationException',
+    'MetaException',
+    'NoSuchObjectException',
+]
+
+
+class CatalogError(Exception):
+    pass
+
+
+class Catalog(object):
+    __slots__ = []  # type: List[str]
+
+    def get_table(self, database_name, name):
+        # type: (Text, Text) -> Optional[Table]
+        raise NotImplementedError
+
+    def create_table(self, database_name, name, columns, location, partition_keys, parameters=None):
+        # type: (Text, Text, List[Column], Text, List[Column], Optional[Dict[Text, Text]]) -> Table
+        raise NotImplementedError
+
+    def update_table(self, database_name, name, columns, location, partition_keys, parameters=None):
+        # type: (Text, Text, List[Column], Text, List[Column], Optional[Dict[Text, Text]]) -> Table
+        raise NotImplementedError
+
+    def drop_table(self, database_name, name):
+        # type: (Text, Text) -> None
+        raise NotImplementedError
+
+    def list_partitions(self, table, segment=None, total_segments=None):
+        # type: (Table, Optional[int], Optional[int]) -> Iterable[Partition]
+        raise NotImplementedError
+
+    def add_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        raise NotImplementedError
+
+    def update_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        # changes existing partitions in place, they stay readable throughout
+        raise NotImplementedError
+
+    def recreate_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        # the partitions are missing between the delete and the add
+        self.delete_partitions(table, partitions)
+        self.add_partitions(table, partitions)
+
+    def delete_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        raise NotImplementedError
+
+    def update_column_statistics(self, table, partition, statistics):
+        # type: (Table, Partition, List[Dict[Text, Any]]) -> None
+        raise NotImplementedError
+
+
+class GlueCatalog(Catalog):
+    __slots__ = ['region_name']
+
+    def __init__(self, region_name=None):
+        # type: (Optional[Text]) -> None
+        self.region_name = region_name
+
+    def get_table(self, database_name, name):
+        # type: (Text, Text) -> Optional[Table]
+        return Table.get(database_name, name, self.region_name)
+
+    def create_table(self, database_name, name, columns, location, partition_keys, parameters=None):
+        # type: (Text, Text, List[Column], Text, List[Column], Optional[Dict[Text, Text]]) -> Table
+        return Table.create(database_name, name, columns, location, partition_keys, parameters, self.region_name)
+
+    def update_table(self, database_name, name, columns, location, partition_keys, parameters=None):
+        # type: (Text, Text, List[Column], Text, List[Column], Optional[Dict[Text, Text]]) -> Table
+        return Table.update(database_name, name, columns, location, partition_keys, parameters, self.region_name)
+
+    def drop_table(self, database_name, name):
+        # type: (Text, Text) -> None
+        Table.drop(database_name, name, self.region_name)
+
+    def list_partitions(self, table, segment=None, total_segments=None):
+        # type: (Table, Optional[int], Optional[int]) -> Iterable[Partition]
+        return table.list_partitions(segment, total_segments)
+
+    def add_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        table.add_partitions(partitions)
+
+    def update_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        table.update_partitions(partitions)
+
+    def recreate_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        table.recreate_partitions(partitions)
+
+    def delete_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        table.delete_partitions(partitions)
+
+    def update_column_statistics(self, table, partition, statistics):
+        # type: (Table, Partition, List[Dict[Text, Any]]) -> None
+        table.update_column_statistics(partition, statistics)
+
+
+def load_hive_ttypes():
+    # type: () -> Any
+    try:
+        from hmsclient.genthrift.hive_metastore import ttypes
+    except ImportError:
+        raise CatalogError('the hive metastore catalog requires hmsclient')
+    return ttypes
+
+
+def connect_metastore(host, port):
+    # type: (Text, int) -> Any
+    try:
+        from hmsclient.genthrift.hive_metastore import ThriftHiveMetastore
+    except ImportError:
+        raise CatalogError('the hive metastore catalog requires hmsclient')
+    from thrift.protocol import TBinaryProtocol
+    from thrift.transport import TSocket
+    from thrift.transport import TTransport
+
+    transport = TTransport.TBufferedTransport(TSocket.TSocket(host, port))
+    transport.open()
+    return ThriftHiveMetastore.Client(TBinaryProtocol.TBinaryProtocol(transport))
+
+
+def close_metastore(client):
+    # type: (Any) -> None
+    # the generated client keeps its transport on the protocols
+    protocol = getattr(client, '_oprot', None)
+    if protocol is None:
+        return
+    try:
+        protocol.trans.close()
+    except Exception:  # pragma: no cover
+        pass
+
+
+class HiveMetastoreCatalog(Catalog):
+    __slots__ = ['host', 'port', 'pool', 'client_factory', 'ttypes', 'errors', 'batch_size']
+
+    def __init__(self, host, port=9083, pool_size=4, client_factory=None, ttypes=None, batch_size=1000):
+        # type: (Text, int, int, Optional[Callable[[], Any]], Any, int) -> None
+        self.host = host
+        self.port = port
+        self.client_factory = client_factory or (lambda: connect_metastore(host, port))
+        self.ttypes = ttypes or load_hive_ttypes()
+        self.errors = tuple(getattr(self.ttypes, name) for name in METASTORE_ERRORS if hasattr(self.ttypes, name))
+        self.batch_size = batch_size
+        self.pool = queue.Queue()  # type: queue.Queue
+        for _ in range(pool_size):
+            self.pool.put(None)
+
+    def call(self, method, *args):
+        # type: (Text, *Any) -> Any
+        # connections are opened lazily and only go back into the pool when
+        # the call completed or failed with a metastore level error, any
+        # other failure may have left a half read response on the socket so
+        # the connection is closed and the next call opens a new one
+        client = self.pool.get()
+        healthy = False
+        try:
+            if client is None:
+                client = self.client_factory()
+            with span(method, cat='hive'):
+                result = getattr(client, method)(*args)
+            healthy = True
+            return result
+        except self.errors:
+            healthy = True
+            raise
+        finally:
+            if not healthy and client is not None:
+                close_metastore(client)
+            self.pool.put(client if healthy else None)
+
+    def to_storage_descriptor(self, columns, location):
+        # type: (List[Column], Text) -> Any
+        ttypes = self.ttypes
+        template = STORAGE_DESCRIPTOR_TEMPLATE
+        return ttypes.StorageDescriptor(
+            cols=[ttypes.FieldSchema(name=c.name, type=c.type, comment=None) for c in columns],
+            location=remove_trailing_slash(location),
+            inputFormat=template['InputFormat'],
+            outputFormat=template['OutputFormat'],
+            compressed=template['Compressed'],
+            numBuckets=template['NumberOfBuckets'],
+            serdeInfo=ttypes.SerDeInfo(
+                name=None,
+                serializationLib=template['SerdeInfo']['SerializationLibrary'],
+                parameters=dict(template['SerdeInfo']['Parameters']),
+            ),
+            bucketCols=[],
+            sortCols=[],
+            parameters={},
+        )
+
+    def to_hive_table(self, table):
+        # type: (Table) -> Any
+        parameters = {'EXTERNAL': 'TRUE'}
+        parameters.update(table.parameters)
+        return self.ttypes.Table(
+            tableName=table.name,
+            dbName=table.database_name,
+            owner='hadoop',
+            sd=self.to_storage_descriptor(table.columns, table.location),
+            partitionKeys=[self.ttypes.FieldSchema(name=c.name, type=c.type, comment=None)
+                           for c in table.partition_keys],
+            parameters=parameters,
+            tableType='EXTERNAL_TABLE',
+        )
+
+    def to_hive_partition(self, table, partition):
+        # type: (Table, Partition) -> Any
+        return self.ttypes.Partition(
+            values=partition.values,
+            dbName=table.database_name,
+            tableName=table.name,
+            sd=self.to_storage_descriptor(partition.columns, partition.location),
+            parameters=dict(partition.parameters),
+        )
+
+    def get_table(self, database_name, name):
+        # type: (Text, Text) -> Optional[Table]
+        try:
+            data = self.call('get_table', database_name, name)
+        except self.ttypes.NoSuchObjectException:
+            return None
+        return Table(
+            database_name=database_name,
+            name=data.tableName,
+            columns=[Column(c.name, c.type) for c in data.sd.cols],
+            location=ensure_trailing_slash(data.sd.location),
+            partition_keys=[Column(c.name, c.type) for c in data.partitionKeys],
+            parameters=dict(data.parameters or {}),
+        )
+
+    def create_table(self, database_name, name, columns, location, partition_keys, parameters=None):
+        # type: (Text, Text, List[Column], Text, List[Column], Optional[Dict[Text, Text]]) -> Table
+        table = Table(database_name, name, columns, location, partition_keys, parameters)
+        self.call('create_table', self.to_hive_table(table))
+        return table
+
+    def update_table(self, database_name, name, columns, location, partition_keys, parameters=None):
+        # type: (Text, Text, List[Column], Text, List[Column], Optional[Dict[Text, Text]]) -> Table
+        table = Table(database_name, name, columns, location, partition_keys, parameters)
+        self.call('alter_table', database_name, name, self.to_hive_table(table))
+        return table
+
+    def drop_table(self, database_name, name):
+        # type: (Text, Text) -> None
+        self.call('drop_table', database_name, name, False)
+
+    def list_partitions(self, table, segment=None, total_segments=None):
+        # type: (Table, Optional[int], Optional[int]) -> Iterable[Partition]
+        names = self.call('get_partition_names', table.database_name, table.name, -1)
+        for idx, names_chunk in enumerate(chunks(names, self.batch_size)):
+            if total_segments and idx % total_segments != segment:
+                continue
+            for data in self.call('get_partitions_by_names', table.database_name, table.name, names_chunk):
+                yield Partition(
+                    values=list(data.values),
+                    columns=[Column(c.name, c.type) for c in data.sd.cols],
+                    location=ensure_trailing_slash(data.sd.location),
+                    parameters=dict(data.parameters or {}),
+                )
+
+    def add_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        for partition_chunk in chunks(partitions, self.batch_size):
+            self.call('add_partitions', [self.to_hive_partition(table, p) for p in partition_chunk])
+
+    def update_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        for partition_chunk in chunks(partitions, self.batch_size):
+            self.call('alter_partitions', table.database_name, table.name,
+                      [self.to_hive_partition(table, p) for p in partition_chunk])
+
+    def delete_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        for partition in partitions:
+            self.call('drop_partition', table.database_name, table.name, partition.values, False)
+
+
+def get_catalog(name, metastore=None, region_name=None):
+    # type: (Text, Optional[Text], Optional[Text]) -> Catalog
+    if name == 'glue':
+        return GlueCatalog(region_name)
+    if name == 'hive':
+        if region_name:
+            raise CatalogError('the hive catalog has no regions')
+        if not metastore:
+            raise CatalogError('the hive catalog requires a metastore address')
+        host, _, port = metastore.partition(':')
+        if not host or not (port or '9083').isdigit():
+            raise CatalogError('invalid metastore address {}, expected host[:port]'.format(metastore))
+        return HiveMetastoreCatalog(host, int(port or 9083))
+    raise CatalogError('unknown catalog {}'.format(name))
@@ -1,40 +1,165 @@
+import functools
 import logging
+import os
+import socket
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any       # noqa: F401
+from typing import Callable  # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import List      # noqa: F401
 from typing import Optional  # noqa: F401
 from typing import Text      # noqa: F401
+from typing import Tuple     # noqa: F401
 
 import click
 
+from . import metrics
+from . import trace
+from .analyze import analyze as analyze_layout
+from .analyze import MB
+from .catalog import Catalog  # noqa: F401
+from .catalog import CatalogError
+from .catalog import get_catalog
+from .catalog import GlueCatalog
+from .clients import preload
 from .dataset import Dataset
-from .dataset import get_datasets
 from .dataset import get_versions
-from .glue import Table
+from .dataset import NAME_VERSION
+from .dataset import PartitionStream
+from .dataset import version_key
+from .ddl import DDLCatalog
+from .ddl import STATEMENT_LIMITS
+from .discover import compile_matcher
+from .discover import discover_datasets
+from .inventory import Inventory
+from .listing import configure_fast_list
+from .mirror import Mirror
+from .registry import DatasetRegistry
+from .schema import configure_footer_cache
+from .stats import StatsCollector
+from .sync import DEFAULT_DATABASE
+from .sync import DesiredState
+from .sync import is_unchanged
+from .sync import PrunePolicy
+from .sync import store_fingerprint
+from .sync import sync_targets
+from .sync import SyncError
+from .sync import Target
+from .trace import span
 from .utils import ensure_trailing_slash
+from .utils import remove_trailing_slash
+from .utils import split_s3_bucket_key
 from .utils import underscore
 
-logging.basicConfig(
-    format='time="%(asctime)s" level=%(levelname)s name=%(name)s msg="%(message)s"',
-    datefmt="%Y-%m-%dT%H:%M:%SZ",
-    level=logging.INFO,
-)
-logging.Formatter.converter = time.gmtime
 logger = logging.getLogger(__name__)
 
 
-def run(src, version=None, alias=None):
-    # type: (Text, Optional[Text], Optional[Text]) -> None
+def configure_logging():
+    # type: () -> None
+    logging.basicConfig(
+        format='time="%(asctime)s" level=%(levelname)s name=%(name)s msg="%(message)s"',
+        datefmt="%Y-%m-%dT%H:%M:%SZ",
+        level=logging.INFO,
+    )
+    logging.Formatter.converter = time.gmtime
+
+
+class RunOptions(object):
+    __slots__ = ['catalog', 'inventory', 'inventory_live', 'projection', 'spill_threshold', 'mirror', 'stats',
+                 'stats_sample', 'column_stats', 'skip_unchanged', 'targets', 'prune']
+
+    def __init__(self, catalog=None, inventory=None, inventory_live=False, projection=False, spill_threshold=None,
+                 mirror=None):
+        # type: (Optional[Catalog], Optional[Inventory], bool, bool, Optional[int], Optional[Mirror]) -> None
+        self.catalog = catalog or GlueCatalog()
+        self.inventory = inventory
+        self.inventory_live = inventory_live
+        self.projection = projection
+        self.spill_threshold = spill_threshold
+        self.mirror = mirror
+        self.stats = False
+        self.stats_sample = None  # type: Optional[int]
+        self.column_stats = False
+        self.skip_unchanged = False
+        self.targets = []  # type: List[Target]
+        self.prune = None  # type: Optional[PrunePolicy]
+
+    def get_targets(self):
+        # type: () -> List[Target]
+        return self.targets or [Target(self.catalog, mirror=self.mirror)]
+
+
+def run(src, version=None, alias=None, options=None, versions=None):
+    # type: (Text, Optional[Text], Optional[Text], Optional[RunOptions], Optional[List[Text]]) -> None
+    src = ensure_trailing_slash(src)
+    with span('run', cat='dataset', src=src, version=version, alias=alias):
+        _run(src, version, alias, options or RunOptions(), versions)
+
+
+def run_all_versions(src, alias=None, options=None, versions=None, jobs=4):
+    # type: (Text, Optional[Text], Optional[RunOptions], Optional[List[Text]], int) -> None
+    # versions are listed once and the newest also syncs the alias table, the
+    # clients and request limits are shared by every version while each one
+    # lists and reads the footers under its own prefix
     src = ensure_trailing_slash(src)
+    if versions is None:
+        with span('get_versions'):
+            versions = list(get_versions(src))
+    locations = sorted(versions, key=version_key)
+    if not locations:
+        return
+
+    def run_version(location):
+        # type: (Text) -> None
+        if location == locations[-1]:
+            run(src, alias=alias, options=options, versions=[location])
+        else:
+            run(src, version=remove_trailing_slash(location[len(src):]), alias=alias, options=options)
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [(location, executor.submit(trace.profile_thread(run_version), location)) for location in locations]
+        for location, future in futures:
+            try:
+                future.result()
+            except Exception as ex:
+                logger.exception('Failed to sync %s', location)
+                errors.append(ex)
+    if errors:
+        raise errors[0]
 
+
+def _run(src, version, alias, options, versions):
+    # type: (Text, Optional[Text], Optional[Text], RunOptions, Optional[List[Text]]) -> None
     if version:
         location = u'{}{}/'.format(src, version)
     else:
-        locations = sorted(get_versions(src))
+        if versions is None:
+            with span('get_versions'):
+                versions = list(get_versions(src))
+        locations = sorted(versions, key=version_key)
         if not locations:
             return
         location = locations[-1]
 
+    targets = options.get_targets()
+    if options.skip_unchanged:
+        table_names = get_table_names(location, alias, versioned_only=bool(version))
+        if table_names and all(is_unchanged(t.catalog, location, table_names, t.database_name) for t in targets):
+            logger.info('Skipping %s, unchanged since the last sync', location)
+            return
+
     logger.info('Loading dataset from %s', location)
-    dataset = Dataset.get(location)
+    summaries = None
+    if options.inventory is not None:
+        bucket, prefix = split_s3_bucket_key(location)
+        summaries = options.inventory.list_object_summaries(bucket, prefix, live=options.inventory_live)
+    stats = StatsCollector(sample=options.stats_sample) if options.stats else None
+    with span('load_dataset', location=location):
+        dataset = Dataset.get(location, summaries=summaries, spill_threshold=options.spill_threshold, stats=stats)
     if dataset is None:
         logger.info('Skipping %s, no parquet files found', location)
         return
@@ -45,77 +170,343 @@ def run(src, version=None, alias=None):
     if not version:
         table_names.append(underscore(alias or dataset.name))
 
-    for table_name in table_names:
-        table = Table.get('telemetry', table_name)
-
-        if not table:
-            logger.info('Creating %s', table_name)
-            table = Table.create(
-                database_name='telemetry',
-                name=table_name,
-                columns=dataset.columns,
-                location=dataset.location,
-                partition_keys=dataset.partition_keys,
-            )
-
-        elif table.location != dataset.location:
-            logger.info('Recreating %s', table_name)
-            Table.drop('telemetry', table.name)
-            table = Table.create(
-                database_name='telemetry',
-                name=table_name,
-                columns=dataset.columns,
-                location=dataset.location,
-                partition_keys=dataset.partition_keys,
-            )
-
-        elif set(dataset.columns) != set(table.columns):
-            logger.info('Updating %s', table_name)
-            table = Table.update(
-                database_name=table.database_name,
-                name=table.name,
-                columns=dataset.columns,
-                location=dataset.location,
-                partition_keys=dataset.partition_keys,
-            )
-
-        columns_set = set(dataset.columns)
-
-        different = []
-        missing = set(dataset.partitions)
-
-        for table_partition in table.list_partitions():
-            if columns_set != set(table_partition.columns):
-                table_partition.columns = dataset.columns
-                different.append(table_partition)
-
-            missing.discard(table_partition)
-
-            if len(different) == 100:
-                logger.info('Recreating %d partitions on %s', len(different), table_name)
-                table.recreate_partitions(different)
-                different = []
-
-        if different:
-            logger.info('Recreating %d partitions on %s', len(different), table_name)
-            table.recreate_partitions(different)
-
-        if missing:
-            logger.info('Adding %d partitions to %s', len(missing), table_name)
-            table.add_partitions(sorted(missing))
+    prune = options.prune
+    if prune is not None and options.inventory is not None:
+        # an inventory can predate partitions that were added since
+        prune = prune.probing()
+
+    try:
+        desired = DesiredState(dataset, projection=options.projection, spill_threshold=options.spill_threshold,
+                               column_stats=options.column_stats, prune=prune)
+        results = sync_targets(desired, table_names, targets)
+        if options.skip_unchanged and dataset.fingerprint is not None:
+            for result in results:
+                if result.error is None:
+                    store_fingerprint(result.target.catalog, result.tables, dataset.fingerprint)
+    finally:
+        if isinstance(dataset.partitions, PartitionStream):
+            dataset.partitions.close()
 
+    failed = [result.target.name for result in results if result.error is not None]
+    if failed:
+        raise SyncError('failed to sync {} to {}'.format(location, ', '.join(failed)))
     logger.info('Finished processing %s', location)
 
 
-@click.command()
-@click.argument('src')
+def get_table_names(location, alias=None, versioned_only=False):
+    # type: (Text, Optional[Text], bool) -> List[Text]
+    matches = NAME_VERSION.search(split_s3_bucket_key(location)[1])
+    if not matches or not matches.group(2):
+        return []
+    name, version = matches.groups()
+    table_names = [underscore(alias or name) + '_' + version]
+    if not versioned_only:
+        table_names.append(underscore(alias or name))
+    return table_names
+
+
+def profile_path(profile_dir, src):
+    # type: (Text, Text) -> Text
+    name = remove_trailing_slash(src).split('://')[-1].replace('/', '.')
+    return os.path.join(profile_dir, '{}.prof'.format(name))
+
+
+def process(locations, execute, jobs=1, registry=None, registry_jobs=8):
+    # type: (Iterable[Text], Callable[..., None], int, Optional[DatasetRegistry], int) -> None
+    def process_location(location):
+        # type: (Text) -> None
+        if registry is None:
+            execute(src=location)
+            return
+        if registry.is_unchanged(location):
+            logger.info('Skipping %s, unchanged since last run', location)
+            return
+        execute(src=location, versions=registry.versions(location))
+        registry.mark_synced(location)
+        registry.save()
+
+    # refreshing only lists the datasets, so it is bounded on its own rather
+    # than by the number of datasets synced at once
+    refresher = None
+    if registry is not None:
+        refresher = ThreadPoolExecutor(max_workers=registry_jobs)
+        locations = refresher.map(registry.refresh_location, locations)
+
+    try:
+        if jobs <= 1:
+            for location in locations:
+                process_location(location)
+            return
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(process_location, location) for location in locations]
+            for future in futures:
+                future.result()
+    finally:
+        if refresher is not None:
+            refresher.shutdown(wait=True)
+
+
+class DefaultGroup(click.Group):  # type: ignore
+    # keeps `pdsm SRC ...` working by falling back to the sync command
+    def parse_args(self, ctx, args):
+        # type: (click.Context, List[Text]) -> List[Text]
+        if not args or (args[0] not in self.commands and args[0] not in ctx.help_option_names):
+            args = ['sync'] + list(args)
+        remaining = super(DefaultGroup, self).parse_args(ctx, args)  # type: List[Text]
+        return remaining
+
+
+SYNC_OPTIONS = [
+    click.option('--catalog', 'catalog_name', type=click.Choice(['glue', 'hive']), default='glue',
+                 help='Catalog to register tables and partitions in.'),
+    click.option('--metastore', help='Hive Metastore thrift address (host:port) for --catalog hive.'),
+    click.option('--target', 'targets', multiple=True, metavar='[CATALOG:]DATABASE[@REGION]',
+                 help='Register tables in this database, repeat to sync to several (default: {}).'.format(
+                     DEFAULT_DATABASE)),
+    click.option('--projection', is_flag=True,
+                 help='Configure Athena partition projection instead of registering partitions.'),
+    click.option('--spill-threshold', type=int,
+                 help='Stream partitions through disk-backed sorted runs of at most this many entries.'),
+    click.option('--mirror', 'mirror_path', type=click.Path(dir_okay=False),
+                 help='Diff against a local sqlite mirror of the Glue partitions kept in this file.'),
+    click.option('--mirror-ttl', type=float, default=86400,
+                 help='Seconds before all partitions of a mirrored table are listed from Glue again.'),
+    click.option('--stats', is_flag=True,
+                 help='Publish numRows, totalSize and numFiles as table and partition parameters.'),
+    click.option('--stats-sample', type=int,
+                 help='Read at most this many footers per partition for --stats and extrapolate numRows.'),
+    click.option('--column-stats', is_flag=True,
+                 help='Publish column min, max and null counts from the footers of new partitions to Glue.'),
+    click.option('--skip-unchanged', is_flag=True,
+                 help='Skip datasets whose newest partition is unchanged since the fingerprint of the last sync.'),
+    click.option('--prune', is_flag=True,
+                 help='Delete catalog partitions without live objects in the listing.'),
+    click.option('--prune-probe', is_flag=True,
+                 help='Confirm each partition --prune would delete with a single key S3 listing first.'),
+    click.option('--prune-threshold', type=float, default=0.1,
+                 help='Refuse to prune more than this fraction of the partitions of a table.'),
+    click.option('--prune-dry-run', is_flag=True,
+                 help='Log the partitions --prune would delete without deleting them.'),
+    click.option('--fast-list', is_flag=True,
+                 help='Parse S3 listings with a lean parser that only keeps key, size, last modified and etag.'),
+]
+
+
+def sync_options(f):
+    # type: (Callable) -> Callable
+    for option in reversed(SYNC_OPTIONS):
+        f = option(f)
+    return f
+
+
+def parse_target(spec, default_catalog):
+    # type: (Text, Text) -> Tuple[Text, Text, Optional[Text]]
+    catalog_name, _, rest = spec.rpartition(':')
+    database_name, _, region_name = rest.partition('@')
+    if not database_name:
+        raise click.UsageError('invalid target {}'.format(spec))
+    return catalog_name or default_catalog, database_name, region_name or None
+
+
+def build_options(kwargs, ddl_out=None):
+    # type: (Dict[Text, Any], Any) -> RunOptions
+    # targets in the same catalog and region share a catalog and a mirror,
+    # the mirror is keyed by database and table name only
+    catalogs = {}  # type: Dict[Tuple[Text, Optional[Text]], Catalog]
+    mirrors = {}  # type: Dict[Tuple[Text, Optional[Text]], Mirror]
+    targets = []  # type: List[Target]
+    ddl_lock = threading.Lock()
+    for spec in kwargs['targets'] or [DEFAULT_DATABASE]:
+        catalog_name, database_name, region_name = parse_target(spec, kwargs['catalog_name'])
+        key = (catalog_name, region_name)
+        if key not in catalogs:
+            try:
+                catalog = get_catalog(catalog_name, kwargs['metastore'], region_name)
+            except CatalogError as ex:
+                raise click.UsageError(str(ex))
+            if kwargs['column_stats'] and (catalog_name != 'glue' or ddl_out is not None):
+                raise click.UsageError('--column-stats requires the glue catalog')
+            if ddl_out is not None:
+                if kwargs['mirror_path']:
+                    raise click.UsageError('--ddl cannot be combined with --mirror')
+                catalog = DDLCatalog(catalog, ddl_out, dialect=kwargs['ddl_dialect'], lock=ddl_lock)
+            catalogs[key] = catalog
+            if kwargs['mirror_path']:
+                path = kwargs['mirror_path']
+                if key != (kwargs['catalog_name'], None):
+                    path = '{}.{}'.format(path, '.'.join(k for k in key if k))
+                mirrors[key] = Mirror(path, ttl=kwargs['mirror_ttl'])
+        targets.append(Target(catalogs[key], database_name, mirrors.get(key), name=spec))
+
+    options = RunOptions(
+        catalog=targets[0].catalog,
+        projection=kwargs['projection'],
+        spill_threshold=kwargs['spill_threshold'],
+        mirror=targets[0].mirror,
+    )
+    options.targets = targets
+    options.stats = kwargs['stats']
+    options.stats_sample = kwargs['stats_sample']
+    options.column_stats = kwargs['column_stats']
+    options.skip_unchanged = kwargs['skip_unchanged']
+    if kwargs['prune']:
+        options.prune = PrunePolicy(probe=kwargs['prune_probe'], threshold=kwargs['prune_threshold'],
+                                    dry_run=kwargs['prune_dry_run'])
+    return options
+
+
+@click.group(cls=DefaultGroup)
+def main():
+    # type: () -> None
+    configure_logging()
+
+
+@main.command(help='Register datasets and their partitions in the catalog (the default command).')
+@click.argument('src', nargs=-1, required=True)
 @click.option('--version')
 @click.option('--alias')
 @click.option('--discover', is_flag=True)
-def main(src, version, alias, discover):
-    # type: (Text, Text, Text, bool) -> None
-    if discover:
-        for location in get_datasets(src):
-            run(src=location)
+@click.option('--include', multiple=True, help='Only discover datasets whose location matches this glob.')
+@click.option('--exclude', multiple=True, help='Skip discovered datasets whose location matches this glob.')
+@click.option('--jobs', type=int, default=1, help='Number of datasets to process concurrently.')
+@click.option('--bucket-concurrency', type=int, default=4, help='Concurrent discovery listings per bucket.')
+@click.option('--ddl', 'ddl_out', type=click.File('w'),
+              help='Write the changes as SQL statements to this file ("-" for stdout) instead of applying them.')
+@click.option('--ddl-dialect', type=click.Choice(sorted(STATEMENT_LIMITS)), default='athena',
+              help='SQL dialect and statement size limits for --ddl.')
+@click.option('--trace', 'trace_path', type=click.Path(dir_okay=False, writable=True),
+              help='Write a Chrome trace-event JSON file of the run.')
+@click.option('--metrics', 'metrics_path', type=click.Path(dir_okay=False, writable=True),
+              help='Write request counts and the current S3 concurrency limits as JSON to this file.')
+@click.option('--profile', 'profile_dir', type=click.Path(file_okay=False),
+              help='Write a cProfile dump per dataset to this directory.')
+@click.option('--inventory', 'inventory_location',
+              help='Discover objects from an S3 Inventory manifest (local path or s3:// prefix).')
+@click.option('--inventory-live', is_flag=True,
+              help='Relist the partitions that may have changed since the inventory was taken.')
+@click.option('--all-versions', is_flag=True, help='Sync every version of each dataset, not just the newest.')
+@click.option('--version-jobs', type=int, default=4, help='Number of versions to process concurrently.')
+@click.option('--footer-cache', type=int,
+              help='Number of parquet footers to keep in memory (default: 10000 with --stats or --column-stats).')
+@click.option('--registry', 'registry_path', type=click.Path(dir_okay=False),
+              help='Cache discovered datasets and versions in this file and skip unchanged datasets.')
+@click.option('--registry-jobs', type=int, default=8, help='Number of datasets the registry lists concurrently.')
+@sync_options
+def sync(src, version, alias, discover, **kwargs):
+    # type: (Tuple[Text, ...], Text, Text, bool, **Any) -> None
+    if not discover and len(src) > 1:
+        raise click.UsageError('multiple SRC locations require --discover')
+    if kwargs['all_versions'] and version:
+        raise click.UsageError('--all-versions cannot be combined with --version')
+
+    trace_path = kwargs['trace_path']
+    profile_dir = kwargs['profile_dir']
+    if trace_path:
+        trace.enable()
+    if profile_dir and not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir)
+
+    options = build_options(kwargs, kwargs['ddl_out'])
+    options.inventory_live = kwargs['inventory_live']
+    if kwargs['inventory_location']:
+        options.inventory = Inventory.load(kwargs['inventory_location'])
+        logger.info('Using inventory %s created at %s', options.inventory.location,
+                    options.inventory.created.isoformat())
+
+    # footers are only read more than once when statistics reread them, the
+    # stats of every partition and the column stats of every table and target
+    footer_cache = kwargs['footer_cache']
+    if footer_cache is None:
+        footer_cache = 10000 if kwargs['stats'] or kwargs['column_stats'] else 0
+    configure_footer_cache(footer_cache)
+    configure_fast_list(kwargs['fast_list'])
+
+    def execute(**run_kwargs):
+        # type: (**Any) -> None
+        func = run  # type: Callable[..., None]
+        if kwargs['all_versions']:
+            func = functools.partial(run_all_versions, jobs=kwargs['version_jobs'])
+            run_kwargs.pop('version', None)
+        if profile_dir:
+            trace.profiled(profile_path(profile_dir, run_kwargs['src']), func, options=options, **run_kwargs)
+        else:
+            func(options=options, **run_kwargs)
+
+    try:
+        if discover:
+            registry = None
+            if kwargs['registry_path']:
+                registry = DatasetRegistry.load(kwargs['registry_path'])
+            matcher = compile_matcher(kwargs['include'], kwargs['exclude'])
+            locations = discover_datasets(list(src), matcher, bucket_concurrency=kwargs['bucket_concurrency'])
+            process(locations, execute, jobs=kwargs['jobs'], registry=registry,
+                    registry_jobs=kwargs['registry_jobs'])
+        else:
+            execute(src=src[0], version=version, alias=alias)
+    finally:
+        logger.info('Run metrics %s', ' '.join('{}={}'.format(k, v) for k, v in sorted(metrics.snapshot().items())))
+        if kwargs['metrics_path']:
+            metrics.export(kwargs['metrics_path'])
+        if trace_path:
+            trace.export(trace_path)
+            trace.disable()
+
+
+@main.command(help='Report file sizes and row group layout and list partitions worth compacting.')
+@click.argument('src')
+@click.option('--version')
+@click.option('--small-file-size', type=int, default=128 * MB, help='Files smaller than this many bytes are small.')
+@click.option('--footer-sample', type=int, default=1, help='Footers to read per partition for row group sizing.')
+@click.option('--limit', type=int, default=20, help='Number of compaction candidates to list.')
+def analyze(src, version, small_file_size, footer_sample, limit):
+    # type: (Text, Optional[Text], int, int, int) -> None
+    src = ensure_trailing_slash(src)
+    if version:
+        location = u'{}{}/'.format(src, version)
     else:
-        run(src=src, version=version, alias=alias)
+        locations = sorted(get_versions(src), key=version_key)
+        if not locations:
+            raise click.UsageError('no versions found in {}'.format(src))
+        location = locations[-1]
+
+    report = analyze_layout(location, small_file_size=small_file_size, sample=footer_sample)
+    if report is None:
+        raise click.UsageError('no parquet files found in {}'.format(location))
+    for line in report.format(limit):
+        click.echo(line)
+
+
+@main.command(help='Run a long-lived service that syncs datasets on request over HTTP or a unix socket.')
+@click.option('--listen', default='127.0.0.1:8080', help='host:port or the path of a unix socket to listen on.')
+@click.option('--workers', type=int, default=4, help='Number of datasets to sync concurrently.')
+@click.option('--footer-cache', type=int, default=100000, help='Number of parquet footers to keep in memory.')
+@sync_options
+def serve(listen, workers, footer_cache, **kwargs):
+    # type: (Text, int, int, **Any) -> None
+    # http.server is only needed by this command
+    from .service import ServiceError
+    from .service import SyncService
+    from .service import create_server
+
+    options = build_options(kwargs)
+    configure_footer_cache(footer_cache)
+    configure_fast_list(kwargs['fast_list'])
+    preload()
+
+    service = SyncService(lambda **run_kwargs: run(options=options, **run_kwargs), workers=workers)
+    metrics.register(service.counts)
+    try:
+        server = create_server(service, listen)
+    except (ServiceError, socket.error) as ex:
+        raise click.UsageError('cannot listen on {}: {}'.format(listen, ex))
+
+    logger.info('Listening on %s', listen)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info('Waiting for running syncs to finish')
+        service.close()
@@ -0,0 +1,61 @@
+import threading
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+from typing import Tuple     # noqa: F401
+
+from . import limiter
+from . import listing
+from . import trace
+
+_lock = threading.Lock()
+_session = None  # type: Any
+_clients = {}  # type: Dict[Tuple[Text, Optional[Text]], Any]
+
+
+def get_session():
+    # type: () -> Any
+    # botocore is only imported once a client is needed, it dominates the
+    # import time of the cli
+    global _session
+    with _lock:
+        if _session is None:
+            import botocore.session
+            _session = botocore.session.get_session()
+        return _session
+
+
+def get_client(service_name, region_name=None):
+    # type: (Text, Optional[Text]) -> Any
+    # clients are thread safe and expensive to create, so one per service and
+    # region is shared by the whole process
+    key = (service_name, region_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    session = get_session()
+    with _lock:
+        if key not in _clients:
+            client = session.create_client(service_name, region_name=region_name)
+            trace.instrument(client)
+            limiter.instrument(client)
+            if service_name == 's3':
+                listing.instrument(client)
+            _clients[key] = client
+        return _clients[key]
+
+
+def preload(service_names=('glue', 's3')):
+    # type: (Iterable[Text]) -> None
+    for service_name in service_names:
+        get_client(service_name)
+
+
+def reset():
+    # type: () -> None
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
@@ -0,0 +1,265 @@
+import datetime
+import math
+import struct
+import threading
+from collections import deque
+from collections import OrderedDict
+from concurrent.futures import Future  # noqa: F401
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any       # noqa: F401
+from typing import Deque     # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+from typing import Tuple     # noqa: F401
+from typing import TYPE_CHECKING
+from typing import Union     # noqa: F401
+
+from .catalog import Catalog  # noqa: F401
+from .dataset import list_object_summaries
+from .glue import Table  # noqa: F401
+from .listing import ListingStore
+from .listing import UTC
+from .models import Partition  # noqa: F401
+from .storage import get_storage
+from .storage import Storage  # noqa: F401
+from .trace import span
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .parquet.ttypes import FileMetaData  # noqa: F401
+    from .parquet.ttypes import SchemaElement  # noqa: F401
+
+# physical type -> (struct format, glue statistics type)
+STATISTICS_TYPES = {
+    1: ('<i', 'LONG'),    # int32
+    2: ('<q', 'LONG'),    # int64
+    4: ('<f', 'DOUBLE'),  # float
+    5: ('<d', 'DOUBLE'),  # double
+}
+
+# the deprecated min and max fields are compared as signed values, which is
+# wrong for unsigned integers and undefined for decimals
+UNSUPPORTED_CONVERTED_TYPES = frozenset([5, 11, 12, 13, 14])
+
+
+def top_level_elements(schema):
+    # type: (List[SchemaElement]) -> Dict[Text, SchemaElement]
+    elements = {}
+    idx = 1
+    while idx < len(schema):
+        element = schema[idx]
+        # the statistics of a repeated column count its elements, not rows
+        if not element.num_children and element.repetition_type != 2:
+            elements[element.name.lower()] = element
+        idx = subtree_end(schema, idx)
+    return elements
+
+
+def subtree_end(schema, idx):
+    # type: (List[SchemaElement], int) -> int
+    children = schema[idx].num_children or 0
+    idx += 1
+    for _ in range(children):
+        idx = subtree_end(schema, idx)
+    return idx
+
+
+def decode_statistic(element, raw):
+    # type: (SchemaElement, Optional[bytes]) -> Optional[Union[int, float]]
+    if raw is None or element.type not in STATISTICS_TYPES:
+        return None
+    fmt = STATISTICS_TYPES[element.type][0]
+    if len(raw) != struct.calcsize(fmt):
+        return None
+    value = struct.unpack(fmt, raw)[0]  # type: Union[int, float]
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    return value
+
+
+class ColumnStatistics(object):
+    __slots__ = ['name', 'kind', 'minimum', 'maximum', 'nulls', 'values', 'distinct', 'complete']
+
+    def __init__(self, name, kind):
+        # type: (Text, Text) -> None
+        self.name = name
+        self.kind = kind
+        self.minimum = None  # type: Optional[Union[int, float]]
+        self.maximum = None  # type: Optional[Union[int, float]]
+        self.nulls = 0
+        self.values = 0
+        self.distinct = 0  # type: Optional[int]
+        self.complete = True
+
+    def merge(self, element, meta_data):
+        # type: (SchemaElement, Any) -> None
+        statistics = meta_data.statistics
+        if statistics is None or statistics.null_count is None:
+            self.complete = False
+            return
+
+        self.nulls += statistics.null_count
+        self.values += meta_data.num_values
+        if statistics.null_count == meta_data.num_values:
+            return
+
+        minimum = decode_statistic(element, statistics.min)
+        maximum = decode_statistic(element, statistics.max)
+        if minimum is None or maximum is None:
+            self.complete = False
+            return
+        if self.minimum is None or minimum < self.minimum:
+            self.minimum = minimum
+        if self.maximum is None or maximum > self.maximum:
+            self.maximum = maximum
+
+        if statistics.distinct_count is None:
+            self.distinct = None
+        elif self.distinct is not None:
+            self.distinct = max(self.distinct, statistics.distinct_count)
+
+    def distinct_values(self):
+        # type: () -> int
+        # row groups only give a lower bound, without them fall back to the
+        # upper bound the value count and range allow
+        if self.distinct:
+            return self.distinct
+        non_null = self.values - self.nulls
+        if self.kind == 'LONG' and self.minimum is not None and self.maximum is not None:
+            return int(min(non_null, self.maximum - self.minimum + 1))
+        return non_null
+
+    def to_input(self, column_type, analyzed_time):
+        # type: (Text, datetime.datetime) -> Dict[Text, Any]
+        data = {'NumberOfNulls': self.nulls, 'NumberOfDistinctValues': self.distinct_values()}  # type: Dict[Text, Any]
+        if self.minimum is not None:
+            data['MinimumValue'] = self.minimum
+            data['MaximumValue'] = self.maximum
+        key = 'LongColumnStatisticsData' if self.kind == 'LONG' else 'DoubleColumnStatisticsData'
+        return {
+            'ColumnName': self.name,
+            'ColumnType': column_type,
+            'AnalyzedTime': analyzed_time,
+            'StatisticsData': {'Type': self.kind, key: data},
+        }
+
+
+def merge_metadata(columns, metadata):
+    # type: (Dict[Text, ColumnStatistics], FileMetaData) -> None
+    elements = top_level_elements(metadata.schema)
+    for row_group in metadata.row_groups or []:
+        for chunk in row_group.columns:
+            meta_data = chunk.meta_data
+            if meta_data is None or len(meta_data.path_in_schema) != 1:
+                continue
+            name = meta_data.path_in_schema[0].lower()
+            element = elements.get(name)
+            if element is None or element.type not in STATISTICS_TYPES:
+                continue
+            if element.converted_type in UNSUPPORTED_CONVERTED_TYPES:
+                continue
+            if name not in columns:
+                columns[name] = ColumnStatistics(name, STATISTICS_TYPES[element.type][1])
+            columns[name].merge(element, meta_data)
+
+
+class StatisticsCache(object):
+    # the statistics of the most recently read partitions, the tables and
+    # targets of a dataset publish the same partitions at about the same time
+    __slots__ = ['capacity', 'entries', 'lock']
+
+    def __init__(self, capacity=10000):
+        # type: (int) -> None
+        self.capacity = capacity
+        self.entries = OrderedDict()  # type: OrderedDict
+        self.lock = threading.Lock()
+
+    def get(self, location):
+        # type: (Text) -> Optional[List[ColumnStatistics]]
+        with self.lock:
+            columns = self.entries.pop(location, None)  # type: Optional[List[ColumnStatistics]]
+            if columns is not None:
+                self.entries[location] = columns
+        return columns
+
+    def put(self, location, columns):
+        # type: (Text, List[ColumnStatistics]) -> None
+        with self.lock:
+            self.entries[location] = columns
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+
+def list_partition_files(location):
+    # type: (Text) -> Tuple[Storage, Text, ListingStore]
+    storage = get_storage(location)
+    bucket, prefix = storage.split(location)
+    return storage, bucket, ListingStore.from_summaries(list_object_summaries(bucket, prefix, storage))
+
+
+def read_footers(executor, storage, bucket, listing):
+    # type: (ThreadPoolExecutor, Storage, Text, ListingStore) -> List[Future]
+    return [executor.submit(storage.read_metadata, bucket, listing.key(idx), listing.size(idx))
+            for idx in range(len(listing))]
+
+
+def merge_footers(footers):
+    # type: (Iterable[FileMetaData]) -> List[ColumnStatistics]
+    columns = {}  # type: Dict[Text, ColumnStatistics]
+    for metadata in footers:
+        merge_metadata(columns, metadata)
+    return [c for _, c in sorted(columns.items()) if c.complete]
+
+
+def partition_column_statistics(location, workers=16):
+    # type: (Text, int) -> List[ColumnStatistics]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        footers = read_footers(executor, *list_partition_files(location))
+        return merge_footers(future.result() for future in footers)
+
+
+def publish_column_statistics(catalog, table, partitions, workers=16, cache=None):
+    # type: (Catalog, Table, List[Partition], int, Optional[StatisticsCache]) -> None
+    # the cache is shared by every table and target a dataset is synced to,
+    # so each partition's footers are usually only read once
+    column_types = {column.name: column.type for column in table.columns}
+    analyzed_time = datetime.datetime.now(UTC)
+
+    def publish(partition, columns):
+        # type: (Partition, List[ColumnStatistics]) -> None
+        statistics = [c.to_input(column_types[c.name], analyzed_time) for c in columns if c.name in column_types]
+        if statistics:
+            catalog.update_column_statistics(table, partition, statistics)
+
+    def finish(partition, footers):
+        # type: (Partition, List[Future]) -> None
+        columns = merge_footers(future.result() for future in footers)
+        if cache is not None:
+            cache.put(partition.location, columns)
+        publish(partition, columns)
+
+    missing = []  # type: List[Partition]
+    for partition in partitions:
+        columns = cache.get(partition.location) if cache is not None else None
+        if columns is None:
+            missing.append(partition)
+        else:
+            publish(partition, columns)
+    if not missing:
+        return
+
+    # partitions are listed and their footers read on one pool, the
+    # footers of at most as many partitions as there are workers are in
+    # flight so a large batch is not held in memory
+    with span('column_statistics', table=table.name, partitions=len(missing)):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            listings = executor.map(list_partition_files, [p.location for p in missing])
+            in_flight = deque()  # type: Deque[Tuple[Partition, List[Future]]]
+            for partition, (storage, bucket, listing) in zip(missing, listings):
+                in_flight.append((partition, read_footers(executor, storage, bucket, listing)))
+                if len(in_flight) >= workers:
+                    finish(*in_flight.popleft())
+            while in_flight:
+                finish(*in_flight.popleft())
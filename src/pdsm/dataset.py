@@ -1,22 +1,29 @@
-import datetime
 import re
 from functools import total_ordering
 from typing import Any       # noqa: F401
 from typing import Dict      # noqa: F401
 from typing import Iterable  # noqa: F401
+from typing import Iterator  # noqa: F401
 from typing import List      # noqa: F401
 from typing import Optional  # noqa: F401
 from typing import Text      # noqa: F401
 
-import botocore.session
-from dateutil.tz import tzutc
-
+from .external import ExternalSortedSet
+from .fingerprint import Fingerprint
+from .fingerprint import schema_fingerprint
+from .keys import KeyClassifier
+from .keys import partition_keys as get_partition_keys
+from .keys import partition_values
+from .listing import UNIX_EPOCH  # noqa: F401
 from .models import Column
 from .models import Partition
-from .schema import read_metadata
 from .schema import to_columns
+from .stats import StatsCollector  # noqa: F401
+from .storage import get_storage
+from .storage import S3Storage
+from .storage import Storage  # noqa: F401
+from .trace import span
 from .utils import ensure_trailing_slash
-from .utils import split_s3_bucket_key
 
 IGNORED_MATCHER = re.compile(r'''(?:.*/)?(?:
     _spark_metadata/  # spark metadata directory
@@ -38,126 +45,187 @@ VERSION_MATCHER = re.compile(r'(v[0-9]+)/$')
 
 PARTITION_MATCHER = re.compile(r'([^=/]+=[^=/]+(?:/[^=/]+=[^=/]+)*)/')
 
-UNIX_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=tzutc())
-
 
 def get_datasets(location):
     # type: (Text) -> Iterable[Text]
     location = ensure_trailing_slash(location)
-    bucket, prefix = split_s3_bucket_key(location)
-    iterator = get_iterator(bucket, prefix, '/', 'CommonPrefixes[].Prefix')
-    for result in iterator:
+    storage = get_storage(location)
+    bucket, prefix = storage.split(location)
+    for result in storage.list_prefixes(bucket, prefix):
         matches = DATASET_MATCHER.match(result, len(prefix))
         if not matches:
             continue
-        yield 's3://{}/{}'.format(bucket, result)
+        yield storage.url(bucket, result)
 
 
 def get_versions(location):
     # type: (Text) -> Iterable[Text]
     location = ensure_trailing_slash(location)
-    bucket, prefix = split_s3_bucket_key(location)
-    iterator = get_iterator(bucket, prefix, '/', 'CommonPrefixes[].Prefix')
-    for result in iterator:
+    storage = get_storage(location)
+    bucket, prefix = storage.split(location)
+    for result in storage.list_prefixes(bucket, prefix):
         matches = VERSION_MATCHER.match(result, len(prefix))
         if not matches:
             continue
-        yield 's3://{}/{}'.format(bucket, result)
+        yield storage.url(bucket, result)
+
+
+def version_key(location):
+    # type: (Text) -> int
+    matches = VERSION_MATCHER.search(ensure_trailing_slash(location))
+    if not matches:
+        return -1
+    return int(matches.group(1)[1:])
 
 
 def get_iterator(bucket, prefix, delimiter=None, search=None):
     # type: (Text, Text, Optional[Text], Optional[Text]) -> Iterable[Any]
-    client = botocore.session.get_session().create_client('s3')
-    paginator = client.get_paginator('list_objects_v2')
-    options = {'Bucket': bucket, 'Prefix': prefix}
-    if delimiter:
-        options['Delimiter'] = delimiter
-    iterator = paginator.paginate(**options)
-    if search:
-        iterator = iterator.search(search)
-    return (result for result in iterator if result is not None)
-
-
-def get_object_summaries(bucket, prefix):
-    # type: (Text, Text) -> Iterable[Dict[Text, Any]]
-    summaries = []
-    for result in get_iterator(bucket, prefix, search='Contents[]'):
-        if IGNORED_MATCHER.match(result['Key']):
-            continue
-        if result['Size'] < 12:
-            continue
-        if '=__HIVE_DEFAULT_PARTITION__/' in result['Key']:
-            continue
-        summaries.append(result)
-    return sorted(summaries, key=lambda x: x['LastModified'])
+    return S3Storage().iterate(bucket, prefix, delimiter, search)
 
 
-def list_object_summaries(bucket, prefix):
-    # type: (Text, Text) -> Iterable[Dict[Text, Any]]
-    for result in get_iterator(bucket, prefix, search='Contents[]'):
-        if IGNORED_MATCHER.match(result['Key']):
-            continue
-        if result['Size'] < 12:
-            continue
-        if '=__HIVE_DEFAULT_PARTITION__/' in result['Key']:
-            continue
-        yield result
+def list_object_summaries(bucket, prefix, storage=None):
+    # type: (Text, Text, Optional[Storage]) -> Iterable[Dict[Text, Any]]
+    storage = storage or S3Storage()
+    return filter_object_summaries(storage.list_objects(bucket, prefix))
+
+
+def filter_object_summaries(summaries):
+    # type: (Iterable[Dict[Text, Any]]) -> Iterable[Dict[Text, Any]]
+    classifier = KeyClassifier()
+    for result in summaries:
+        if classifier.classify(result['Key'], result['Size']) is not None:
+            yield result
+
+
+def probe_fingerprint(location, fingerprint):
+    # type: (Text, Fingerprint) -> bool
+    # lists the newest partition and anything sorting after it, which
+    # catches new partitions, appends and rewrites there; changes to older
+    # partitions are only picked up by a full run
+    location = ensure_trailing_slash(location)
+    storage = get_storage(location)
+    bucket, prefix = storage.split(location)
+    current = Fingerprint()
+    classifier = KeyClassifier(prefix)
+    with span('probe_fingerprint', location=location):
+        for summary in storage.list_objects(bucket, prefix, start_after=prefix + (fingerprint.tail or '')):
+            partition_name = classifier.classify(summary['Key'], summary['Size'])
+            if partition_name is None:
+                continue
+            if summary['Key'] == fingerprint.latest_key and summary.get('ETag', '') != fingerprint.latest_etag:
+                return False
+            current.add(partition_name, summary)
+    return ((current.tail or '') == (fingerprint.tail or '')
+            and current.tail_count == fingerprint.tail_count
+            and current.tail_size == fingerprint.tail_size
+            and current.last_modified <= fingerprint.last_modified)
+
+
+def partitions_max(partition_names):
+    # type: (Any) -> Optional[Text]
+    if isinstance(partition_names, ExternalSortedSet):
+        return partition_names.largest
+    return max(partition_names) if partition_names else None
+
+
+class PartitionStream(object):
+    __slots__ = ['location', 'columns', 'partition_names', 'stats']
+
+    def __init__(self, location, columns, partition_names, stats=None):
+        # type: (Text, List[Column], Iterable[Text], Optional[StatsCollector]) -> None
+        self.location = location
+        self.columns = columns
+        self.partition_names = partition_names
+        self.stats = stats
+
+    def __iter__(self):
+        # type: () -> Iterator[Partition]
+        partition_names = self.partition_names
+        if isinstance(partition_names, set):
+            partition_names = sorted(partition_names)
+        for partition_name in partition_names:
+            yield Partition(
+                values=partition_values(partition_name),
+                columns=self.columns,
+                location=self.location + partition_name,
+                parameters=self.stats.partition_parameters(partition_name) if self.stats else None,
+            )
+
+    def close(self):
+        # type: () -> None
+        if isinstance(self.partition_names, ExternalSortedSet):
+            self.partition_names.close()
 
 
 @total_ordering
 class Dataset(object):
-    __slots__ = ['name', 'version', 'columns', 'partitions', 'location', 'partition_keys']
+    __slots__ = ['name', 'version', 'columns', 'partitions', 'location', 'partition_keys', 'stats', 'fingerprint']
 
     def __init__(self, name, version, columns, partitions, location, partition_keys):
-        # type: (Text, Text, List[Column], List[Partition], Text, List[Column]) -> None
+        # type: (Text, Text, List[Column], Iterable[Partition], Text, List[Column]) -> None
         self.name = name
         self.version = version
         self.columns = columns
         self.partitions = partitions
         self.location = location
         self.partition_keys = partition_keys
+        self.stats = None  # type: Optional[StatsCollector]
+        self.fingerprint = None  # type: Optional[Fingerprint]
 
     @classmethod
-    def get(cls, location):
-        # type: (Text) -> Optional[Dataset]
+    def get(cls, location, summaries=None, spill_threshold=None, stats=None):
+        # type: (Text, Optional[Iterable[Dict]], Optional[int], Optional[StatsCollector]) -> Optional[Dataset]
         location = ensure_trailing_slash(location)
-        bucket, prefix = split_s3_bucket_key(location)
+        storage = get_storage(location)
+        bucket, prefix = storage.split(location)
         matches = re.search(NAME_VERSION, prefix)
         if not matches:
             return None
         name, version = matches.groups()
 
-        # get latest object and partition names
+        # get latest object and partition names, names keep their trailing
+        # slash so they sort the same way as partition locations
         latest = None
-        partition_names_set = set()
-        for summary in list_object_summaries(bucket, prefix):
-            if not latest or summary['LastModified'] > latest['LastModified']:
-                latest = summary
-            partition_matches = PARTITION_MATCHER.match(summary['Key'], len(prefix))
-            if partition_matches:
-                partition_names_set.add(partition_matches.group(1))
+        fingerprint = Fingerprint()
+        partition_names_set = set()  # type: Any
+        if spill_threshold:
+            partition_names_set = ExternalSortedSet(spill_threshold)
+        if summaries is None:
+            summaries = storage.list_objects(bucket, prefix)
+        classifier = KeyClassifier(prefix)
+        with span('list_objects', location=location):
+            for summary in summaries:
+                partition_name = classifier.classify(summary['Key'], summary['Size'])
+                if partition_name is None:
+                    continue
+                if not latest or summary['LastModified'] > latest['LastModified']:
+                    latest = summary
+                if partition_name:
+                    partition_names_set.add(partition_name)
+                if stats is not None:
+                    stats.add(partition_name, summary)
+                fingerprint.add(partition_name, summary)
         if latest is None:
             return None
-        partition_names = sorted(partition_names_set)
 
         # read columns from object
-        metadata = read_metadata(bucket, latest['Key'], latest['Size'])
-        columns = to_columns(metadata.schema)
+        with span('read_schema', key=latest['Key']):
+            metadata = storage.read_metadata(bucket, latest['Key'], latest['Size'])
+            columns = to_columns(metadata.schema)
+            fingerprint.schema = schema_fingerprint(columns)
+
+        if stats is not None:
+            stats.collect(storage, bucket)
+
+        partitions = PartitionStream(location, columns, partition_names_set, stats)  # type: Any
+        if not spill_threshold:
+            partitions = list(partitions)
 
         # get partition keys from last partition
         partition_keys = []  # type: List[Column]
-        if partition_names:
-            partition_keys = [Column(p.split('=')[0], 'string') for p in partition_names[-1].split('/')]
-
-        # create partition objects
-        partitions = []
-        for partition_name in partition_names:
-            partition = Partition(
-                values=[p.split('=')[1] for p in partition_name.split('/')],
-                columns=columns,
-                location='{}{}/'.format(location, partition_name),
-            )
-            partitions.append(partition)
+        last_partition_name = partitions_max(partition_names_set)
+        if last_partition_name:
+            partition_keys = [Column(key, 'string') for key in get_partition_keys(last_partition_name)]
 
         dataset = cls(
             name=name,
@@ -167,6 +235,8 @@ class Dataset(object):
             location=location,
             partition_keys=partition_keys,
         )
+        dataset.stats = stats
+        dataset.fingerprint = fingerprint
 
         return dataset
 
@@ -180,4 +250,4 @@ class Dataset(object):
         # type: (object) -> bool
         if not isinstance(other, Dataset):
             return NotImplemented
-        return int(self.name[1:]) < int(other.name[1:])
+        return (self.name, version_key(self.location)) < (other.name, version_key(other.location))
@@ -0,0 +1,187 @@
+import logging
+import threading
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import IO        # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Set       # noqa: F401
+from typing import Text      # noqa: F401
+from typing import Tuple     # noqa: F401
+
+from .catalog import Catalog
+from .glue import Table
+from .models import Column     # noqa: F401
+from .models import Partition  # noqa: F401
+from .models import STORAGE_DESCRIPTOR_TEMPLATE
+from .utils import remove_trailing_slash
+
+logger = logging.getLogger(__name__)
+
+# maximum statement size in bytes and partitions per statement
+STATEMENT_LIMITS = {
+    'athena': (262144, 500),
+    'hive': (1048576, 1000),
+}
+
+
+def quote_identifier(name):
+    # type: (Text) -> Text
+    return u'`{}`'.format(name.replace('`', '``'))
+
+
+def quote_string(value):
+    # type: (Text) -> Text
+    return u"'{}'".format(value.replace('\\', '\\\\').replace("'", "\\'"))
+
+
+def table_identifier(database_name, name):
+    # type: (Text, Text) -> Text
+    return u'{}.{}'.format(quote_identifier(database_name), quote_identifier(name))
+
+
+def column_list(columns):
+    # type: (List[Column]) -> Text
+    return u',\n'.join(u'  {} {}'.format(quote_identifier(c.name), c.type) for c in columns)
+
+
+def partition_spec(table, partition):
+    # type: (Table, Partition) -> Text
+    return u'PARTITION ({})'.format(u', '.join(
+        u'{} = {}'.format(quote_identifier(key.name), quote_string(value))
+        for key, value in zip(table.partition_keys, partition.values)
+    ))
+
+
+def create_table_statement(table):
+    # type: (Table) -> Text
+    template = STORAGE_DESCRIPTOR_TEMPLATE
+    statement = u'CREATE EXTERNAL TABLE {} (\n{}\n)'.format(
+        table_identifier(table.database_name, table.name), column_list(table.columns))
+    if table.partition_keys:
+        statement += u'\nPARTITIONED BY (\n{}\n)'.format(column_list(table.partition_keys))
+    statement += u'\nROW FORMAT SERDE {}'.format(quote_string(template['SerdeInfo']['SerializationLibrary']))
+    statement += u'\nSTORED AS INPUTFORMAT {}\nOUTPUTFORMAT {}'.format(
+        quote_string(template['InputFormat']), quote_string(template['OutputFormat']))
+    statement += u'\nLOCATION {}'.format(quote_string(remove_trailing_slash(table.location)))
+    if table.parameters:
+        statement += u'\nTBLPROPERTIES ({})'.format(properties(table.parameters))
+    return statement
+
+
+def properties(parameters):
+    # type: (Dict[Text, Text]) -> Text
+    return u', '.join(u'{} = {}'.format(quote_string(k), quote_string(v)) for k, v in sorted(parameters.items()))
+
+
+def pack_statements(prefix, clauses, separator, max_bytes, max_clauses):
+    # type: (Text, Iterable[Text], Text, int, int) -> Iterable[Text]
+    batch = []  # type: List[Text]
+    size = len(prefix.encode('utf-8'))
+    for clause in clauses:
+        clause_size = len(clause.encode('utf-8')) + len(separator)
+        if batch and (size + clause_size > max_bytes or len(batch) == max_clauses):
+            yield prefix + separator.join(batch)
+            batch = []
+            size = len(prefix.encode('utf-8'))
+        batch.append(clause)
+        size += clause_size
+    if batch:
+        yield prefix + separator.join(batch)
+
+
+class DDLCatalog(Catalog):
+    __slots__ = ['source', 'out', 'dialect', 'max_bytes', 'max_partitions', 'created', 'tables', 'lock']
+
+    def __init__(self, source, out, dialect='athena', lock=None):
+        # type: (Catalog, IO[Text], Text, Optional[threading.Lock]) -> None
+        self.source = source
+        self.out = out
+        self.dialect = dialect
+        self.max_bytes, self.max_partitions = STATEMENT_LIMITS[dialect]
+        self.created = set()  # type: Set[Tuple[Text, Text]]
+        # the tables as of the statements emitted so far
+        self.tables = {}  # type: Dict[Tuple[Text, Text], Table]
+        # catalogs writing to the same output share a lock
+        self.lock = lock or threading.Lock()
+
+    def emit(self, statements):
+        # type: (Iterable[Text]) -> None
+        with self.lock:
+            for statement in statements:
+                self.out.write(statement)
+                self.out.write(u';\n\n')
+            self.out.flush()
+
+    def get_table(self, database_name, name):
+        # type: (Text, Text) -> Optional[Table]
+        return self.source.get_table(database_name, name)
+
+    def create_table(self, database_name, name, columns, location, partition_keys, parameters=None):
+        # type: (Text, Text, List[Column], Text, List[Column], Optional[Dict[Text, Text]]) -> Table
+        table = Table(database_name, name, columns, location, partition_keys, parameters)
+        self.emit([create_table_statement(table)])
+        with self.lock:
+            self.created.add((database_name, name))
+            self.tables[(database_name, name)] = table
+        return table
+
+    def update_table(self, database_name, name, columns, location, partition_keys, parameters=None):
+        # type: (Text, Text, List[Column], Text, List[Column], Optional[Dict[Text, Text]]) -> Table
+        table = Table(database_name, name, columns, location, partition_keys, parameters)
+        with self.lock:
+            previous = self.tables.get((database_name, name))
+        if previous is None:
+            previous = self.source.get_table(database_name, name)
+        identifier = table_identifier(database_name, name)
+        statements = [u'ALTER TABLE {} REPLACE COLUMNS (\n{}\n)'.format(identifier, column_list(columns))]
+        if previous is None or previous.location != table.location:
+            statements.append(u'ALTER TABLE {} SET LOCATION {}'.format(
+                identifier, quote_string(remove_trailing_slash(table.location))))
+        if table.parameters:
+            statements.append(u'ALTER TABLE {} SET TBLPROPERTIES ({})'.format(
+                identifier, properties(table.parameters)))
+        # glue and hive replace all parameters of a table on update, athena
+        # has no statement that removes one so they are left behind there
+        removed = sorted(k for k in previous.parameters if k not in table.parameters) if previous else []
+        if removed and self.dialect == 'hive':
+            statements.append(u'ALTER TABLE {} UNSET TBLPROPERTIES IF EXISTS ({})'.format(
+                identifier, u', '.join(quote_string(k) for k in removed)))
+        elif removed:
+            logger.warning('Leaving removed properties %s on %s, athena cannot unset them',
+                           u', '.join(removed), identifier)
+        self.emit(statements)
+        with self.lock:
+            self.tables[(database_name, name)] = table
+        return table
+
+    def drop_table(self, database_name, name):
+        # type: (Text, Text) -> None
+        self.emit([u'DROP TABLE IF EXISTS {}'.format(table_identifier(database_name, name))])
+
+    def list_partitions(self, table, segment=None, total_segments=None):
+        # type: (Table, Optional[int], Optional[int]) -> Iterable[Partition]
+        # tables created by this sink do not exist in the source catalog yet
+        if (table.database_name, table.name) in self.created:
+            return []
+        return self.source.list_partitions(table, segment, total_segments)
+
+    def add_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        prefix = u'ALTER TABLE {} ADD IF NOT EXISTS\n'.format(table_identifier(table.database_name, table.name))
+        clauses = (u'{} LOCATION {}'.format(
+            partition_spec(table, p), quote_string(remove_trailing_slash(p.location))) for p in partitions)
+        self.emit(pack_statements(prefix, clauses, u'\n', self.max_bytes, self.max_partitions))
+
+    def update_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        # there is no statement that changes the columns or parameters of a
+        # partition, added partitions take the columns of the table
+        self.recreate_partitions(table, partitions)
+
+    def delete_partitions(self, table, partitions):
+        # type: (Table, List[Partition]) -> None
+        prefix = u'ALTER TABLE {} DROP IF EXISTS\n'.format(table_identifier(table.database_name, table.name))
+        clauses = (partition_spec(table, p) for p in partitions)
+        self.emit(pack_statements(prefix, clauses, u',\n', self.max_bytes, self.max_partitions))
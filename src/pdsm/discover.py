@@ -0,0 +1,84 @@
+import fnmatch
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Pattern   # noqa: F401
+from typing import Text      # noqa: F401
+
+from .dataset import get_datasets
+from .trace import span
+from .utils import remove_trailing_slash
+from .utils import split_s3_bucket_key
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue  # type: ignore
+
+DONE = object()
+
+
+def compile_matcher(include=(), exclude=()):
+    # type: (Iterable[Text], Iterable[Text]) -> Pattern
+    include_pattern = '|'.join(fnmatch.translate(p) for p in include) or '.*'
+    exclude_pattern = '|'.join(fnmatch.translate(p) for p in exclude)
+    pattern = '(?:{})'.format(include_pattern)
+    if exclude_pattern:
+        pattern = '(?!(?:{})){}'.format(exclude_pattern, pattern)
+    return re.compile(pattern)
+
+
+def discover_datasets(roots, matcher=None, workers=16, bucket_concurrency=4):
+    # type: (List[Text], Optional[Pattern], int, int) -> Iterable[Text]
+    if matcher is None:
+        matcher = compile_matcher()
+
+    results = queue.Queue()  # type: queue.Queue
+    semaphores = {}  # type: Dict[Text, threading.BoundedSemaphore]
+    for root in roots:
+        bucket = split_s3_bucket_key(root)[0]
+        if bucket not in semaphores:
+            semaphores[bucket] = threading.BoundedSemaphore(bucket_concurrency)
+
+    def list_root(root):
+        # type: (Text) -> None
+        with semaphores[split_s3_bucket_key(root)[0]], span('list_root', root=root):
+            for location in get_datasets(root):
+                if matcher.match(remove_trailing_slash(location)):
+                    results.put(location)
+
+    remaining = [len(roots)]
+    lock = threading.Lock()
+
+    def finished(future):
+        # type: (Any) -> None
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            results.put(DONE)
+
+    if not roots:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(roots)))
+    try:
+        futures = [executor.submit(list_root, root) for root in roots]
+        for future in futures:
+            future.add_done_callback(finished)
+
+        while True:
+            location = results.get()
+            if location is DONE:
+                break
+            yield location
+
+        for future in futures:
+            future.result()
+    finally:
+        executor.shutdown(wait=False)
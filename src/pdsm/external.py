@@ -0,0 +1,86 @@
+import heapq
+import io
+import os
+import tempfile
+from typing import Iterable  # noqa: F401
+from typing import Iterator  # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Set       # noqa: F401
+from typing import Text      # noqa: F401
+
+
+class ExternalSortedSet(object):
+    __slots__ = ['max_items', 'tmpdir', 'items', 'runs', 'largest']
+
+    def __init__(self, max_items=1000000, tmpdir=None):
+        # type: (int, Optional[Text]) -> None
+        self.max_items = max_items
+        self.tmpdir = tmpdir
+        self.items = set()  # type: Set[Text]
+        self.runs = []  # type: List[Text]
+        self.largest = None  # type: Optional[Text]
+
+    def add(self, item):
+        # type: (Text) -> None
+        if '\n' in item:
+            raise ValueError('items may not contain newlines')
+        self.items.add(item)
+        if self.largest is None or item > self.largest:
+            self.largest = item
+        if len(self.items) >= self.max_items:
+            self.spill()
+
+    def update(self, items):
+        # type: (Iterable[Text]) -> None
+        for item in items:
+            self.add(item)
+
+    def spill(self):
+        # type: () -> None
+        if not self.items:
+            return
+        fd, path = tempfile.mkstemp(prefix='pdsm-run-', suffix='.txt', dir=self.tmpdir)
+        with io.open(fd, 'w', encoding='utf-8') as fp:
+            for item in sorted(self.items):
+                fp.write(item)
+                fp.write(u'\n')
+        self.runs.append(path)
+        self.items = set()
+
+    def __iter__(self):
+        # type: () -> Iterator[Text]
+        files = [io.open(path, 'r', encoding='utf-8') for path in self.runs]
+        try:
+            streams = [(line[:-1] for line in fp) for fp in files]  # type: List[Iterator[Text]]
+            streams.append(iter(sorted(self.items)))
+            previous = None
+            for item in heapq.merge(*streams):
+                if item != previous:
+                    yield item
+                previous = item
+        finally:
+            for fp in files:
+                fp.close()
+
+    def close(self):
+        # type: () -> None
+        for path in self.runs:
+            os.remove(path)
+        self.runs = []
+        self.items = set()
+
+    def __enter__(self):
+        # type: () -> ExternalSortedSet
+        return self
+
+    def __exit__(self, *exc_info):
+        # type: (*object) -> None
+        self.close()
+
+
+def external_sort(items, max_items=1000000, tmpdir=None):
+    # type: (Iterable[Text], int, Optional[Text]) -> ExternalSortedSet
+    sorted_set = ExternalSortedSet(max_items, tmpdir)
+    sorted_set.update(items)
+    return sorted_set
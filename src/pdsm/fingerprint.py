@@ -0,0 +1,72 @@
+import hashlib
+import json
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+
+from .models import Column  # noqa: F401
+
+FINGERPRINT_PARAMETER = 'pdsm.fingerprint'
+
+
+def schema_fingerprint(columns):
+    # type: (List[Column]) -> Text
+    data = json.dumps([[column.name, column.type] for column in columns])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+
+class Fingerprint(object):
+    __slots__ = ['count', 'size', 'last_modified', 'latest_key', 'latest_etag', 'tail', 'tail_count', 'tail_size',
+                 'schema']
+
+    def __init__(self):
+        # type: () -> None
+        self.count = 0
+        self.size = 0
+        self.last_modified = u''
+        self.latest_key = u''
+        self.latest_etag = u''
+        # the newest partition, which is where appends usually land
+        self.tail = None  # type: Optional[Text]
+        self.tail_count = 0
+        self.tail_size = 0
+        self.schema = u''
+
+    def add(self, partition_name, summary):
+        # type: (Text, Dict[Text, Any]) -> None
+        self.count += 1
+        self.size += summary['Size']
+        last_modified = summary['LastModified'].isoformat()
+        if last_modified > self.last_modified:
+            self.last_modified = last_modified
+            self.latest_key = summary['Key']
+            self.latest_etag = summary.get('ETag', u'')
+        if self.tail is None or partition_name > self.tail:
+            self.tail = partition_name
+            self.tail_count = 0
+            self.tail_size = 0
+        if partition_name == self.tail:
+            self.tail_count += 1
+            self.tail_size += summary['Size']
+
+    def encode(self):
+        # type: () -> Text
+        return json.dumps({k: getattr(self, k) for k in self.__slots__}, sort_keys=True, separators=(',', ':'))
+
+    @classmethod
+    def decode(cls, value):
+        # type: (Optional[Text]) -> Optional[Fingerprint]
+        try:
+            data = json.loads(value or '')
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        fingerprint = cls()
+        for key in cls.__slots__:
+            if key not in data:
+                return None
+            setattr(fingerprint, key, data[key])
+        return fingerprint
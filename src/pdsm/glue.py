@@ -1,4 +1,5 @@
 import copy
+import logging
 from typing import Any       # noqa: F401
 from typing import Dict      # noqa: F401
 from typing import Iterable  # noqa: F401
@@ -6,16 +7,17 @@ from typing import List      # noqa: F401
 from typing import Optional  # noqa: F401
 from typing import Text      # noqa: F401
 
-import botocore.session
-from botocore.exceptions import ClientError
-
+from .clients import get_client
 from .models import Column
 from .models import Partition
 from .models import STORAGE_DESCRIPTOR_TEMPLATE
+from .trace import span
 from .utils import chunks
 from .utils import ensure_trailing_slash
 from .utils import remove_trailing_slash
 
+logger = logging.getLogger(__name__)
+
 TABLE_INPUT_TEMPLATE = {
     'Name': '',
     'Owner': 'hadoop',
@@ -27,22 +29,27 @@ TABLE_INPUT_TEMPLATE = {
 
 
 class Table(object):
-    __slots__ = ['database_name', 'name', 'columns', 'location', 'partition_keys']
+    __slots__ = ['database_name', 'name', 'columns', 'location', 'partition_keys', 'parameters', 'region_name']
 
-    def __init__(self, database_name, name, columns, location, partition_keys):
-        # type: (Text, Text, List[Column], Text, List[Column]) -> None
+    def __init__(self, database_name, name, columns, location, partition_keys, parameters=None, region_name=None):
+        # type: (Text, Text, List[Column], Text, List[Column], Optional[Dict[Text, Text]], Optional[Text]) -> None
         self.database_name = database_name
         self.name = name
         self.columns = columns
         self.location = location
         self.partition_keys = partition_keys
-
-    def list_partitions(self):
-        # type: () -> Iterable[Partition]
-        client = botocore.session.get_session().create_client('glue')
-        opts = {'DatabaseName': self.database_name, 'TableName': self.name}
+        self.parameters = parameters or {}
+        self.region_name = region_name
+
+    def list_partitions(self, segment=None, total_segments=None):
+        # type: (Optional[int], Optional[int]) -> Iterable[Partition]
+        client = get_client('glue', self.region_name)
+        opts = {'DatabaseName': self.database_name, 'TableName': self.name}  # type: Dict[Text, Any]
+        if total_segments:
+            opts['Segment'] = {'SegmentNumber': segment, 'TotalSegments': total_segments}
         while True:
-            result = client.get_partitions(**opts)
+            with span('get_partitions_page', table=self.name):
+                result = client.get_partitions(**opts)
             if 'Partitions' in result:
                 for pd in result['Partitions']:
                     yield Partition.from_input(pd)
@@ -53,7 +60,7 @@ class Table(object):
 
     def get_partitions(self):
         # type: () -> List[Partition]
-        client = botocore.session.get_session().create_client('glue')
+        client = get_client('glue', self.region_name)
         opts = {'DatabaseName': self.database_name, 'TableName': self.name}
         partitions = []  # type: List[Partition]
         while True:
@@ -68,35 +75,83 @@ class Table(object):
 
     def add_partitions(self, partitions):
         # type: (List[Partition]) -> None
-        client = botocore.session.get_session().create_client('glue')
-        for partition_chunk in chunks(partitions, 100):
-            data = {'DatabaseName': self.database_name,
-                    'TableName': self.name,
-                    'PartitionInputList': [partition.to_input() for partition in partition_chunk]}
-            client.batch_create_partition(**data)
+        client = get_client('glue', self.region_name)
+        with span('add_partitions', table=self.name, count=len(partitions)):
+            for partition_chunk in chunks(partitions, 100):
+                data = {'DatabaseName': self.database_name,
+                        'TableName': self.name,
+                        'PartitionInputList': [partition.to_input() for partition in partition_chunk]}
+                client.batch_create_partition(**data)
 
     def recreate_partitions(self, partitions):
         # type: (List[Partition]) -> None
-        client = botocore.session.get_session().create_client('glue')
-        for partition_chunk in chunks(partitions, 25):
-            data = {'DatabaseName': self.database_name,
-                    'TableName': self.name,
-                    'PartitionsToDelete': [{'Values': partition.values} for partition in partition_chunk]}
-            client.batch_delete_partition(**data)
-            data = {'DatabaseName': self.database_name,
-                    'TableName': self.name,
-                    'PartitionInputList': [partition.to_input() for partition in partition_chunk]}
-            client.batch_create_partition(**data)
+        client = get_client('glue', self.region_name)
+        with span('recreate_partitions', table=self.name, count=len(partitions)):
+            for partition_chunk in chunks(partitions, 25):
+                data = {'DatabaseName': self.database_name,
+                        'TableName': self.name,
+                        'PartitionsToDelete': [{'Values': partition.values} for partition in partition_chunk]}
+                client.batch_delete_partition(**data)
+                data = {'DatabaseName': self.database_name,
+                        'TableName': self.name,
+                        'PartitionInputList': [partition.to_input() for partition in partition_chunk]}
+                client.batch_create_partition(**data)
+
+    def update_partitions(self, partitions):
+        # type: (List[Partition]) -> None
+        client = get_client('glue', self.region_name)
+        with span('update_partitions', table=self.name, count=len(partitions)):
+            for partition_chunk in chunks(partitions, 100):
+                result = client.batch_update_partition(
+                    DatabaseName=self.database_name,
+                    TableName=self.name,
+                    Entries=[{'PartitionValueList': partition.values, 'PartitionInput': partition.to_input()}
+                             for partition in partition_chunk],
+                )
+                for error in result.get('Errors', []):
+                    logger.warning('Failed to update partition %s on %s: %s', error['PartitionValueList'],
+                                   self.name, error['ErrorDetail'].get('ErrorMessage'))
+
+    def delete_partitions(self, partitions):
+        # type: (List[Partition]) -> None
+        client = get_client('glue', self.region_name)
+        with span('delete_partitions', table=self.name, count=len(partitions)):
+            for partition_chunk in chunks(partitions, 25):
+                result = client.batch_delete_partition(
+                    DatabaseName=self.database_name,
+                    TableName=self.name,
+                    PartitionsToDelete=[{'Values': partition.values} for partition in partition_chunk],
+                )
+                for error in result.get('Errors', []):
+                    logger.warning('Failed to delete partition %s on %s: %s', error['PartitionValues'],
+                                   self.name, error['ErrorDetail'].get('ErrorMessage'))
+
+    def update_column_statistics(self, partition, statistics):
+        # type: (Partition, List[Dict[Text, Any]]) -> None
+        client = get_client('glue', self.region_name)
+        for statistics_chunk in chunks(statistics, 25):
+            result = client.update_column_statistics_for_partition(
+                DatabaseName=self.database_name,
+                TableName=self.name,
+                PartitionValues=partition.values,
+                ColumnStatisticsList=statistics_chunk,
+            )
+            for error in result.get('Errors', []):
+                logger.warning('Failed to update statistics for %s on %s: %s',
+                               error['ColumnStatistics']['ColumnName'], partition.location,
+                               error['Error'].get('ErrorMessage'))
 
     @classmethod
-    def from_input(cls, database_name, data):
-        # type: (Text, Dict[Text, Any]) -> Table
+    def from_input(cls, database_name, data, region_name=None):
+        # type: (Text, Dict[Text, Any], Optional[Text]) -> Table
         table = cls(
             database_name=database_name,
             name=data['Name'],
             columns=[Column.from_input(cd) for cd in data['StorageDescriptor']['Columns']],
             location=ensure_trailing_slash(data['StorageDescriptor']['Location']),
             partition_keys=[Column.from_input(cd) for cd in data['PartitionKeys']],
+            parameters=data.get('Parameters', {}),
+            region_name=region_name,
         )
         return table
 
@@ -107,30 +162,31 @@ class Table(object):
         data['StorageDescriptor']['Columns'] = [column.to_input() for column in self.columns]
         data['StorageDescriptor']['Location'] = remove_trailing_slash(self.location)
         data['PartitionKeys'] = [column.to_input() for column in self.partition_keys]
+        data['Parameters'].update(self.parameters)
         return data
 
     @classmethod
-    def get(cls, database_name, name):
-        # type: (Text, Text) -> Optional[Table]
-        client = botocore.session.get_session().create_client('glue')
+    def get(cls, database_name, name, region_name=None):
+        # type: (Text, Text, Optional[Text]) -> Optional[Table]
+        client = get_client('glue', region_name)
         try:
             result = client.get_table(DatabaseName=database_name, Name=name)
-        except ClientError as ex:
-            if ex.response['Error']['Code'] == 'EntityNotFoundException':
-                return None
-            raise ex
-        return cls.from_input(database_name, result['Table'])
+        except client.exceptions.EntityNotFoundException:
+            return None
+        return cls.from_input(database_name, result['Table'], region_name)
 
     @classmethod
-    def create(cls, database_name, name, columns, location, partition_keys):
-        # type: (Text, Text, List[Column], Text, List[Column]) -> Table
-        client = botocore.session.get_session().create_client('glue')
+    def create(cls, database_name, name, columns, location, partition_keys, parameters=None, region_name=None):
+        # type: (Text, Text, List[Column], Text, List[Column], Optional[Dict[Text, Text]], Optional[Text]) -> Table
+        client = get_client('glue', region_name)
         table = cls(
             database_name=database_name,
             name=name,
             columns=columns,
             location=location,
             partition_keys=partition_keys,
+            parameters=parameters,
+            region_name=region_name,
         )
         client.create_table(
             DatabaseName=database_name,
@@ -139,15 +195,17 @@ class Table(object):
         return table
 
     @classmethod
-    def update(cls, database_name, name, columns, location, partition_keys):
-        # type: (Text, Text, List[Column], Text, List[Column]) -> Table
-        client = botocore.session.get_session().create_client('glue')
+    def update(cls, database_name, name, columns, location, partition_keys, parameters=None, region_name=None):
+        # type: (Text, Text, List[Column], Text, List[Column], Optional[Dict[Text, Text]], Optional[Text]) -> Table
+        client = get_client('glue', region_name)
         table = cls(
             database_name=database_name,
             name=name,
             columns=columns,
             location=location,
             partition_keys=partition_keys,
+            parameters=parameters,
+            region_name=region_name,
         )
         client.update_table(
             DatabaseName=database_name,
@@ -156,9 +214,9 @@ class Table(object):
         return table
 
     @classmethod
-    def drop(cls, database_name, name):
-        # type: (Text, Text) -> None
-        client = botocore.session.get_session().create_client('glue')
+    def drop(cls, database_name, name, region_name=None):
+        # type: (Text, Text, Optional[Text]) -> None
+        client = get_client('glue', region_name)
         client.delete_table(
             DatabaseName=database_name,
             Name=name,
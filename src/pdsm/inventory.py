@@ -0,0 +1,333 @@
+import datetime
+import gzip
+import io
+import json
+import os
+import threading
+from array import array
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import IO        # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+
+from .clients import get_client
+from .dataset import filter_object_summaries
+from .dataset import get_iterator
+from .dataset import list_object_summaries
+from .dataset import PARTITION_MATCHER
+from .listing import ListingStore
+from .listing import UTC
+from .trace import span
+from .utils import split_s3_bucket_key
+
+try:
+    from urllib.parse import unquote_plus
+except ImportError:  # pragma: no cover
+    from urllib import unquote_plus  # type: ignore
+
+PARQUET_COLUMNS = ['bucket', 'key', 'size', 'last_modified_date', 'e_tag', 'is_latest', 'is_delete_marker']
+
+
+class InventoryError(Exception):
+    pass
+
+
+def parse_timestamp(value):
+    # type: (Text) -> datetime.datetime
+    # inventory timestamps are always formatted as 2018-01-01T00:00:00.000Z
+    return datetime.datetime(
+        int(value[0:4]), int(value[5:7]), int(value[8:10]),
+        int(value[11:13]), int(value[14:16]), int(value[17:19]),
+        tzinfo=UTC,
+    )
+
+
+class InventoryIndex(object):
+    # the rows of a manifest kept as columns and ordered by key, so each
+    # dataset only walks the rows under its own prefix
+    __slots__ = ['store', 'etags', 'order']
+
+    def __init__(self, rows):
+        # type: (Iterable[Dict[Text, Any]]) -> None
+        self.store = ListingStore()
+        self.etags = []  # type: List[Optional[Text]]
+        for row in rows:
+            self.store.add(row)
+            self.etags.append(row.get('ETag'))
+        self.order = array('l', sorted(range(len(self.store)), key=self.store.key))
+
+    def first(self, prefix):
+        # type: (Text) -> int
+        low, high = 0, len(self.order)
+        while low < high:
+            middle = (low + high) // 2
+            if self.store.key(self.order[middle]) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def summaries(self, prefix):
+        # type: (Text) -> Iterable[Dict[Text, Any]]
+        for position in range(self.first(prefix), len(self.order)):
+            idx = self.order[position]
+            summary = self.store.summary(idx)
+            if not summary['Key'].startswith(prefix):
+                return
+            if self.etags[idx] is not None:
+                summary['ETag'] = self.etags[idx]
+            yield summary
+
+
+class Inventory(object):
+    __slots__ = ['location', 'source_bucket', 'destination_bucket', 'file_format', 'file_schema', 'files',
+                 'created', 'index', 'lock']
+
+    def __init__(self, location, source_bucket, destination_bucket, file_format, file_schema, files, created):
+        # type: (Text, Text, Text, Text, List[Text], List[Text], datetime.datetime) -> None
+        self.location = location
+        self.source_bucket = source_bucket
+        self.destination_bucket = destination_bucket
+        self.file_format = file_format
+        self.file_schema = file_schema
+        self.files = files
+        self.created = created
+        self.index = None  # type: Optional[InventoryIndex]
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, location):
+        # type: (Text) -> Inventory
+        if not location.endswith('.json'):
+            location = location.rstrip('/') + '/manifest.json'
+        with open_location(location) as fp:
+            data = json.loads(fp.read().decode('utf-8'))
+
+        file_format = data['fileFormat'].upper()
+        if file_format not in ('CSV', 'PARQUET'):
+            raise InventoryError('unsupported inventory format {}'.format(data['fileFormat']))
+
+        inventory = cls(
+            location=location,
+            source_bucket=data['sourceBucket'],
+            destination_bucket=data['destinationBucket'].split(':')[-1],
+            file_format=file_format,
+            file_schema=[field.strip() for field in data['fileSchema'].split(',')],
+            files=[f['key'] for f in data['files']],
+            created=datetime.datetime.fromtimestamp(int(data['creationTimestamp']) / 1000.0, UTC),
+        )
+        return inventory
+
+    def data_location(self, key):
+        # type: (Text) -> Text
+        if self.location.startswith('s3://'):
+            return 's3://{}/{}'.format(self.destination_bucket, key)
+        # local copies keep the inventory layout: <config>/<date>/manifest.json and <config>/data/<file>
+        config_dir = os.path.dirname(os.path.dirname(self.location))
+        return os.path.join(config_dir, 'data', os.path.basename(key))
+
+    def iter_rows(self):
+        # type: () -> Iterable[Dict[Text, Any]]
+        for key in self.files:
+            location = self.data_location(key)
+            with span('read_inventory_file', location=location):
+                if self.file_format == 'CSV':
+                    rows = self.read_csv(location)
+                else:
+                    rows = self.read_parquet(location)
+                for row in rows:
+                    yield row
+
+    def get_index(self):
+        # type: () -> InventoryIndex
+        # the manifest is read once and shared by every dataset synced from it
+        with self.lock:
+            if self.index is None:
+                with span('index_inventory', location=self.location):
+                    self.index = InventoryIndex(
+                        row for row in self.iter_rows() if row['Bucket'] == self.source_bucket)
+            return self.index
+
+    def read_csv(self, location):
+        # type: (Text) -> Iterable[Dict[Text, Any]]
+        import csv
+
+        schema = self.file_schema
+        with open_location(location) as raw:
+            for values in csv.reader(io.TextIOWrapper(gzip.GzipFile(fileobj=raw), encoding='utf-8')):
+                row = dict(zip(schema, values))
+                if row.get('IsLatest') == 'false' or row.get('IsDeleteMarker') == 'true':
+                    continue
+                yield {
+                    'Bucket': row['Bucket'],
+                    'Key': unquote_plus(row['Key']),
+                    'Size': int(row['Size'] or 0),
+                    'LastModified': parse_timestamp(row['LastModifiedDate']),
+                    'ETag': row.get('ETag'),
+                }
+
+    def read_parquet(self, location):
+        # type: (Text) -> Iterable[Dict[Text, Any]]
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise InventoryError('reading parquet inventories requires pyarrow')
+
+        # only the footer and the requested columns of one row group at a
+        # time are read from the file
+        with open_seekable(location) as raw:
+            parquet_file = pq.ParquetFile(raw)
+            columns = [c for c in PARQUET_COLUMNS if c in parquet_file.schema_arrow.names]
+            for batch in parquet_file.iter_batches(columns=columns):
+                for row in batch.to_pylist():
+                    if row.get('is_latest') is False or row.get('is_delete_marker'):
+                        continue
+                    last_modified = row['last_modified_date']
+                    if last_modified.tzinfo is None:
+                        last_modified = last_modified.replace(tzinfo=UTC)
+                    yield {
+                        'Bucket': row['bucket'],
+                        'Key': row['key'],
+                        'Size': row['size'] or 0,
+                        'LastModified': last_modified,
+                        'ETag': row.get('e_tag'),
+                    }
+
+    def list_object_summaries(self, bucket, prefix, live=False):
+        # type: (Text, Text, bool) -> Iterable[Dict[Text, Any]]
+        if bucket != self.source_bucket:
+            raise InventoryError('inventory covers {}, not {}'.format(self.source_bucket, bucket))
+
+        # rows belonging to the highest top level partition seen so far are held back, so
+        # that they can be replaced by a live listing when it is requested
+        newest = None  # type: Optional[Text]
+        pending = []  # type: List[Dict[Text, Any]]
+        for summary in filter_object_summaries(self.get_index().summaries(prefix)):
+            top = top_level_partition(summary['Key'], prefix)
+            if top is None or (newest is not None and top < newest):
+                yield summary
+            elif top == newest:
+                pending.append(summary)
+            else:
+                for held in pending:
+                    yield held
+                newest = top
+                pending = [summary]
+
+        if not live:
+            for held in pending:
+                yield held
+            return
+
+        # relist the newest partition and everything after it
+        for result in get_iterator(bucket, prefix, '/', 'CommonPrefixes[].Prefix'):
+            top = top_level_partition(result, prefix)
+            if top is None or (newest is not None and top < newest):
+                continue
+            with span('list_live_partition', prefix=result):
+                for summary in list_object_summaries(bucket, result):
+                    yield summary
+
+
+def top_level_partition(key, prefix):
+    # type: (Text, Text) -> Optional[Text]
+    matches = PARTITION_MATCHER.match(key, len(prefix))
+    if not matches:
+        return None
+    return matches.group(1).split('/')[0]
+
+
+def open_location(location):
+    # type: (Text) -> IO[bytes]
+    if location.startswith('s3://'):
+        bucket, key = split_s3_bucket_key(location)
+        body = get_client('s3').get_object(Bucket=bucket, Key=key)['Body']
+        return io.BufferedReader(StreamingBodyReader(body))
+    return io.open(location, 'rb')
+
+
+def open_seekable(location):
+    # type: (Text) -> IO[bytes]
+    if location.startswith('s3://'):
+        bucket, key = split_s3_bucket_key(location)
+        return io.BufferedReader(RangeReader(bucket, key), buffer_size=1024 * 1024)
+    return io.open(location, 'rb')
+
+
+class RangeReader(io.RawIOBase):
+    # fetches only the byte ranges that are read, so readers can seek to
+    # the parts of an object they need
+
+    def __init__(self, bucket, key):
+        # type: (Text, Text) -> None
+        self.bucket = bucket
+        self.key = key
+        self.size = get_client('s3').head_object(Bucket=bucket, Key=key)['ContentLength']  # type: int
+        self.position = 0
+
+    def readable(self):
+        # type: () -> bool
+        return True
+
+    def seekable(self):
+        # type: () -> bool
+        return True
+
+    def tell(self):
+        # type: () -> int
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # type: (int, int) -> int
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def read_range(self, size):
+        # type: (int) -> bytes
+        end = min(self.position + size, self.size)
+        if self.position >= end:
+            return b''
+        response = get_client('s3').get_object(
+            Bucket=self.bucket, Key=self.key, Range='bytes={}-{}'.format(self.position, end - 1))
+        data = response['Body'].read()  # type: bytes
+        self.position += len(data)
+        return data
+
+    def readinto(self, buf):
+        # type: (Any) -> int
+        data = self.read_range(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def readall(self):
+        # type: () -> bytes
+        return self.read_range(self.size - self.position)
+
+
+class StreamingBodyReader(io.RawIOBase):
+
+    def __init__(self, body):
+        # type: (Any) -> None
+        self.body = body
+
+    def readable(self):
+        # type: () -> bool
+        return True
+
+    def readinto(self, buf):
+        # type: (Any) -> int
+        data = self.body.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        # type: () -> None
+        self.body.close()
+        super(StreamingBodyReader, self).close()
@@ -0,0 +1,87 @@
+from typing import Dict      # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+
+HIVE_DEFAULT_PARTITION = '=__HIVE_DEFAULT_PARTITION__/'
+
+FOLDER_MARKER = '_$folder$'
+
+MIN_OBJECT_SIZE = 12
+
+
+def is_ignored_name(name):
+    # type: (Text) -> bool
+    # spark, hadoop and parquet metadata and temporary files and directories
+    return name[:1] == '_' and '=' not in name
+
+
+def partition_values(partition_name):
+    # type: (Text) -> List[Text]
+    return [p.split('=')[1] for p in partition_name[:-1].split('/')]
+
+
+def partition_keys(partition_name):
+    # type: (Text) -> List[Text]
+    return [p.split('=')[0] for p in partition_name[:-1].split('/')]
+
+
+class KeyClassifier(object):
+    # filters listed keys and extracts their partition name in one pass, the
+    # same filter as IGNORED_MATCHER, the size check and the hive default
+    # partition test and the same partition name as PARTITION_MATCHER;
+    # everything but the file name is decided once per directory
+    __slots__ = ['offset', 'directories', 'max_directories']
+
+    def __init__(self, prefix='', max_directories=100000):
+        # type: (Text, int) -> None
+        self.offset = len(prefix)
+        self.directories = {}  # type: Dict[Text, Optional[Text]]
+        self.max_directories = max_directories
+
+    def classify(self, key, size):
+        # type: (Text, int) -> Optional[Text]
+        if size < MIN_OBJECT_SIZE:
+            return None
+        idx = key.rfind('/') + 1
+        directory = key[:idx]
+        try:
+            partition_name = self.directories[directory]
+        except KeyError:
+            partition_name = self.classify_directory(directory)
+            # listings are mostly sorted, so a cleared cache refills quickly
+            if len(self.directories) >= self.max_directories:
+                self.directories.clear()
+            self.directories[directory] = partition_name
+        if partition_name is None:
+            return None
+
+        name = key[idx:]
+        if not name:
+            # the historical filter only drops keys ending in an empty path component
+            return None if directory == '/' or directory[-2:] == '//' else partition_name
+        if name[0] == '_' and '=' not in name:
+            return None
+        if len(name) == len(FOLDER_MARKER) + 1 and name.endswith(FOLDER_MARKER):
+            return None
+        return partition_name
+
+    def classify_directory(self, directory):
+        # type: (Text) -> Optional[Text]
+        if HIVE_DEFAULT_PARTITION in directory:
+            return None
+        components = directory.split('/')
+        components.pop()
+        for component in components:
+            if component[:1] == '_' and '=' not in component:
+                return None
+
+        names = directory[self.offset:].split('/')
+        names.pop()
+        count = 0
+        for name in names:
+            key, _, value = name.partition('=')
+            if not key or not value or '=' in value:
+                break
+            count += 1
+        return '/'.join(names[:count]) + '/' if count else ''
@@ -0,0 +1,176 @@
+import threading
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+
+from . import metrics
+from .trace import clock
+
+THROTTLE_ERRORS = frozenset(['SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded', '503'])
+
+
+class AIMDLimiter(object):
+    __slots__ = ['limit', 'min_limit', 'max_limit', 'tolerance', 'cooldown', 'in_flight', 'min_latency',
+                 'last_decrease', 'condition']
+
+    def __init__(self, initial=16, min_limit=1, max_limit=512, tolerance=2.0, cooldown=1.0):
+        # type: (int, int, int, float, float) -> None
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.min_latency = None  # type: Optional[float]
+        self.last_decrease = None  # type: Optional[float]
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        # type: () -> None
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None):
+        # type: (Optional[float]) -> None
+        with self.condition:
+            self.in_flight -= 1
+            if latency is not None:
+                # the baseline creeps up slowly so one unusually fast
+                # response does not stop growth for the rest of the run
+                if self.min_latency is None:
+                    self.min_latency = latency
+                else:
+                    self.min_latency = min(latency, self.min_latency * 1.01)
+                if latency <= self.tolerance * self.min_latency:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+    def backoff(self):
+        # type: () -> bool
+        # one throttling response is usually followed by several others from
+        # requests that were already in flight, only halve once per cooldown
+        now = clock()
+        with self.condition:
+            if self.last_decrease is not None and now - self.last_decrease < self.cooldown:
+                return False
+            self.limit = max(float(self.min_limit), self.limit / 2)
+            self.last_decrease = now
+            return True
+
+
+class RequestController(object):
+    __slots__ = ['service_name', 'prefix_depth', 'initial', 'max_limit', 'limiters', 'lock']
+
+    def __init__(self, prefix_depth=1, initial=16, max_limit=512, service_name='s3'):
+        # type: (int, int, int, Text) -> None
+        self.service_name = service_name
+        self.prefix_depth = prefix_depth
+        self.initial = initial
+        self.max_limit = max_limit
+        self.limiters = {}  # type: Dict[Text, AIMDLimiter]
+        self.lock = threading.Lock()
+
+    def partition(self, params, operation_name=None):
+        # type: (Dict[Text, Any], Optional[Text]) -> Text
+        if self.service_name != 's3':
+            # other services throttle per account and operation
+            return operation_name or self.service_name
+        key = params.get('Key') or params.get('Prefix') or ''
+        return u'{}/{}'.format(params.get('Bucket', ''), '/'.join(key.split('/')[:self.prefix_depth]))
+
+    def limiter(self, partition):
+        # type: (Text) -> AIMDLimiter
+        with self.lock:
+            limiter = self.limiters.get(partition)
+            if limiter is None:
+                limiter = self.limiters[partition] = AIMDLimiter(self.initial, max_limit=self.max_limit)
+            return limiter
+
+    def limits(self):
+        # type: () -> Dict[Text, float]
+        with self.lock:
+            limiters = list(self.limiters.items())
+        return {'{}.limit.{}'.format(self.service_name, partition): int(limiter.limit)
+                for partition, limiter in limiters}
+
+
+# one controller per service shared by every client in the process, so
+# concurrent datasets and versions stay within the same limits
+_controllers = {
+    's3': RequestController(),
+    'glue': RequestController(initial=8, max_limit=64, service_name='glue'),
+}  # type: Dict[Text, RequestController]
+
+
+def limits():
+    # type: () -> Dict[Text, float]
+    values = {}  # type: Dict[Text, float]
+    for controller in list(_controllers.values()):
+        values.update(controller.limits())
+    return values
+
+
+metrics.register(limits)
+
+
+def configure(prefix_depth=1, initial=16, max_limit=512, service_name='s3'):
+    # type: (int, int, int, Text) -> RequestController
+    controller = RequestController(prefix_depth, initial, max_limit, service_name)
+    _controllers[service_name] = controller
+    return controller
+
+
+def is_throttled(response):
+    # type: (Any) -> bool
+    if response is None:
+        return False
+    http_response, parsed = response
+    if getattr(http_response, 'status_code', None) == 503:
+        return True
+    return (parsed or {}).get('Error', {}).get('Code') in THROTTLE_ERRORS
+
+
+def instrument(client):
+    # type: (Any) -> None
+    service_name = client.meta.service_model.service_name
+
+    def before_parameter_build(params, model, context, **kwargs):
+        # type: (Dict[Text, Any], Any, Dict[Text, Any], **Any) -> None
+        controller = _controllers.get(service_name)
+        if controller is not None:
+            context['pdsm_limiter'] = controller.limiter(controller.partition(params, model.name))
+
+    def before_call(context, **kwargs):
+        # type: (Dict[Text, Any], **Any) -> None
+        limiter = context.get('pdsm_limiter')
+        if limiter is not None:
+            limiter.acquire()
+            context['pdsm_limiter_started'] = clock()
+            metrics.incr('{}.requests'.format(service_name))
+
+    def after_call(context, **kwargs):
+        # type: (Dict[Text, Any], **Any) -> None
+        started = context.pop('pdsm_limiter_started', None)
+        if started is None:
+            return
+        failed = kwargs.get('exception') is not None
+        failed = failed or is_throttled((kwargs.get('http_response'), kwargs.get('parsed')))
+        context['pdsm_limiter'].release(None if failed else clock() - started)
+
+    def needs_retry(response=None, request_dict=None, **kwargs):
+        # type: (Any, Optional[Dict[Text, Any]], **Any) -> None
+        context = (request_dict or {}).get('context', {})
+        limiter = context.get('pdsm_limiter')
+        if limiter is not None and is_throttled(response):
+            metrics.incr('{}.throttled'.format(service_name))
+            if limiter.backoff():
+                metrics.incr('{}.backoffs'.format(service_name))
+
+    client.meta.events.register('before-parameter-build.{}'.format(service_name), before_parameter_build)
+    client.meta.events.register('before-call.{}'.format(service_name), before_call)
+    client.meta.events.register('after-call.{}'.format(service_name), after_call)
+    client.meta.events.register('after-call-error.{}'.format(service_name), after_call)
+    client.meta.events.register('needs-retry.{}'.format(service_name), needs_retry)
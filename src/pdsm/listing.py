@@ -0,0 +1,253 @@
+import datetime
+import io
+from array import array
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import Iterator  # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+from typing import Tuple     # noqa: F401
+from xml.etree.ElementTree import iterparse
+
+ZERO = datetime.timedelta(0)
+
+
+class UTCZone(datetime.tzinfo):
+    # a fixed utc zone so listings don't need dateutil loaded
+    __slots__ = []  # type: List[str]
+
+    def utcoffset(self, dt):
+        # type: (Optional[datetime.datetime]) -> datetime.timedelta
+        return ZERO
+
+    def dst(self, dt):
+        # type: (Optional[datetime.datetime]) -> datetime.timedelta
+        return ZERO
+
+    def tzname(self, dt):
+        # type: (Optional[datetime.datetime]) -> str
+        return 'UTC'
+
+    def __repr__(self):
+        # type: () -> str
+        return 'UTCZone()'
+
+
+UTC = UTCZone()
+
+UNIX_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=UTC)
+
+# what is left for botocore to parse once the lean parser took the listing
+EMPTY_LIST_RESULT = b'<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/"></ListBucketResult>'
+
+LIST_RESULT_FIELDS = frozenset(['Name', 'Prefix', 'Delimiter', 'EncodingType', 'ContinuationToken',
+                                'NextContinuationToken', 'StartAfter'])
+
+LIST_RESULT_COUNTS = frozenset(['MaxKeys', 'KeyCount'])
+
+_fast_list = False
+
+
+def to_epoch_us(value):
+    # type: (datetime.datetime) -> int
+    delta = value - UNIX_EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def from_epoch_us(value):
+    # type: (int) -> datetime.datetime
+    return UNIX_EPOCH + datetime.timedelta(microseconds=value)
+
+
+def parse_timestamp(text):
+    # type: (Text) -> datetime.datetime
+    # s3 listings always use 2009-10-12T17:50:30.000Z
+    if len(text) == 24 and text[-1] == 'Z':
+        return datetime.datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]), int(text[11:13]),
+                                 int(text[14:16]), int(text[17:19]), int(text[20:23]) * 1000, UTC)
+    from dateutil.parser import parse
+    parsed = parse(text)  # type: datetime.datetime
+    return parsed
+
+
+def local_name(tag):
+    # type: (Text) -> Text
+    return tag[tag.find('}') + 1:]
+
+
+def parse_list_objects(body):
+    # type: (bytes) -> Dict[Text, Any]
+    # a ListObjectsV2 result with only the key, size, last modified time and
+    # etag of each object, elements are dropped as soon as they are read
+    result = {}  # type: Dict[Text, Any]
+    contents = []  # type: List[Dict[Text, Any]]
+    prefixes = []  # type: List[Dict[Text, Any]]
+    depth = 0
+    for event, element in iterparse(io.BytesIO(body), events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        name = local_name(element.tag)
+        if name == 'Contents':
+            summary = {}  # type: Dict[Text, Any]
+            for child in element:
+                field = local_name(child.tag)
+                if field == 'Key':
+                    summary['Key'] = child.text or u''
+                elif field == 'Size':
+                    summary['Size'] = int(child.text)
+                elif field == 'LastModified':
+                    summary['LastModified'] = parse_timestamp(child.text)
+                elif field == 'ETag':
+                    summary['ETag'] = child.text
+            contents.append(summary)
+        elif name == 'CommonPrefixes':
+            for child in element:
+                if local_name(child.tag) == 'Prefix':
+                    prefixes.append({'Prefix': child.text or u''})
+        elif name in LIST_RESULT_FIELDS:
+            result[name] = element.text or u''
+        elif name in LIST_RESULT_COUNTS:
+            result[name] = int(element.text)
+        elif name == 'IsTruncated':
+            result[name] = element.text == 'true'
+        element.clear()
+    if contents:
+        result['Contents'] = contents
+    if prefixes:
+        result['CommonPrefixes'] = prefixes
+    return result
+
+
+def configure_fast_list(enabled):
+    # type: (bool) -> None
+    global _fast_list
+    _fast_list = enabled
+
+
+def fast_list_enabled():
+    # type: () -> bool
+    return _fast_list
+
+
+def instrument(client):
+    # type: (Any) -> None
+    # requests are still signed, retried, limited and traced by botocore,
+    # only successful listings skip its generic xml parser
+    def before_parse(response_dict, customized_response_dict, **kwargs):
+        # type: (Dict[Text, Any], Dict[Text, Any], **Any) -> None
+        if not _fast_list or response_dict['status_code'] >= 300 or not response_dict['body']:
+            return
+        customized_response_dict.update(parse_list_objects(response_dict['body']))
+        response_dict['body'] = EMPTY_LIST_RESULT
+
+    client.meta.events.register('before-parse.s3.ListObjectsV2', before_parse)
+
+
+class ListingStore(object):
+    # a listing kept as columns instead of one botocore dict per object: keys
+    # are packed into one utf-8 buffer with end offsets, sizes and last
+    # modified times (epoch microseconds) are typed arrays and partitions are
+    # indexes into a table of their names, about 40 bytes plus the key length
+    # per object; python 2 has no 64 bit array typecode, so sizes and times
+    # are doubles, exact up to 2 ** 53
+    __slots__ = ['buffer', 'ends', 'sizes', 'times', 'partitions', 'partition_names', 'partition_indexes']
+
+    def __init__(self):
+        # type: () -> None
+        self.buffer = bytearray()
+        self.ends = array('l')
+        self.sizes = array('d')
+        self.times = array('d')
+        self.partitions = array('l')
+        self.partition_names = []  # type: List[Text]
+        self.partition_indexes = {}  # type: Dict[Text, int]
+
+    @classmethod
+    def from_summaries(cls, summaries, partition_name=u''):
+        # type: (Iterable[Dict[Text, Any]], Text) -> ListingStore
+        store = cls()
+        for summary in summaries:
+            store.add(summary, partition_name)
+        return store
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.ends)
+
+    def add(self, summary, partition_name=u''):
+        # type: (Dict[Text, Any], Text) -> None
+        self.append(summary['Key'], summary['Size'], summary['LastModified'], partition_name)
+
+    def append(self, key, size, last_modified, partition_name=u''):
+        # type: (Text, int, datetime.datetime, Text) -> None
+        partition = self.partition_indexes.get(partition_name)
+        if partition is None:
+            partition = self.partition_indexes[partition_name] = len(self.partition_names)
+            self.partition_names.append(partition_name)
+        self.buffer += key.encode('utf-8')
+        self.ends.append(len(self.buffer))
+        self.sizes.append(size)
+        self.times.append(to_epoch_us(last_modified))
+        self.partitions.append(partition)
+
+    def key(self, idx):
+        # type: (int) -> Text
+        start = self.ends[idx - 1] if idx else 0
+        return self.buffer[start:self.ends[idx]].decode('utf-8')
+
+    def size(self, idx):
+        # type: (int) -> int
+        return int(self.sizes[idx])
+
+    def partition_name(self, idx):
+        # type: (int) -> Text
+        return self.partition_names[self.partitions[idx]]
+
+    def summary(self, idx):
+        # type: (int) -> Dict[Text, Any]
+        return {'Key': self.key(idx), 'Size': self.size(idx), 'LastModified': from_epoch_us(int(self.times[idx]))}
+
+    def summaries(self, order=None):
+        # type: (Optional[Iterable[int]]) -> Iterator[Dict[Text, Any]]
+        for idx in (range(len(self)) if order is None else order):
+            yield self.summary(idx)
+
+    def latest(self):
+        # type: () -> Optional[int]
+        # the first of the newest objects, like a running strict comparison
+        if not self.times:
+            return None
+        return self.times.index(max(self.times))
+
+    def order_by_last_modified(self):
+        # type: () -> List[int]
+        return sorted(range(len(self)), key=self.times.__getitem__)
+
+    def total_size(self):
+        # type: () -> int
+        return int(sum(self.sizes))
+
+    def partition_totals(self):
+        # type: () -> Dict[Text, Tuple[int, int]]
+        counts = array('l', [0]) * len(self.partition_names)
+        sizes = array('d', [0]) * len(self.partition_names)
+        for partition, size in zip(self.partitions, self.sizes):
+            counts[partition] += 1
+            sizes[partition] += size
+        return {name: (counts[idx], int(sizes[idx])) for idx, name in enumerate(self.partition_names)}
+
+    def clear(self):
+        # type: () -> None
+        self.buffer = bytearray()
+        self.ends = array('l')
+        self.sizes = array('d')
+        self.times = array('d')
+        self.partitions = array('l')
+        self.partition_names = []
+        self.partition_indexes = {}
@@ -0,0 +1,55 @@
+import json
+import threading
+from typing import Any       # noqa: F401
+from typing import Callable  # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import List      # noqa: F401
+from typing import Text      # noqa: F401
+
+_lock = threading.Lock()
+_counters = {}  # type: Dict[Text, float]
+_gauges = {}  # type: Dict[Text, float]
+_providers = []  # type: List[Callable[[], Dict[Text, float]]]
+
+
+def incr(name, value=1):
+    # type: (Text, float) -> None
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def gauge(name, value):
+    # type: (Text, float) -> None
+    with _lock:
+        _gauges[name] = value
+
+
+def register(provider):
+    # type: (Callable[[], Dict[Text, float]]) -> None
+    # providers are asked for their gauges whenever a snapshot is taken
+    with _lock:
+        _providers.append(provider)
+
+
+def snapshot():
+    # type: () -> Dict[Text, float]
+    with _lock:
+        values = dict(_counters)
+        values.update(_gauges)
+        providers = list(_providers)
+    for provider in providers:
+        values.update(provider())
+    return values
+
+
+def reset():
+    # type: () -> None
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+
+
+def export(path):
+    # type: (Text) -> None
+    with open(path, 'w') as fp:
+        json.dump(snapshot(), fp, indent=2, sort_keys=True)
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any       # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import Iterator  # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+from typing import Tuple     # noqa: F401
+
+from .catalog import Catalog  # noqa: F401
+from .catalog import GlueCatalog
+from .glue import Table  # noqa: F401
+from .models import Column
+from .models import Partition
+from .trace import span
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tables (
+    database_name TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    location TEXT NOT NULL,
+    refreshed_at REAL NOT NULL,
+    PRIMARY KEY (database_name, table_name)
+);
+CREATE TABLE IF NOT EXISTS segments (
+    database_name TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    checksum TEXT NOT NULL,
+    PRIMARY KEY (database_name, table_name, segment)
+);
+CREATE TABLE IF NOT EXISTS partitions (
+    database_name TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    location TEXT NOT NULL,
+    partition_values TEXT NOT NULL,
+    columns TEXT NOT NULL,
+    segment INTEGER,
+    parameters TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (database_name, table_name, location)
+);
+'''
+
+INSERT_PARTITION = '''
+INSERT OR REPLACE INTO partitions
+    (database_name, table_name, location, partition_values, columns, segment, parameters)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def encode_columns(columns):
+    # type: (List[Column]) -> Text
+    return json.dumps([[column.name, column.type] for column in columns])
+
+
+def partition_row(table, partition, segment=None):
+    # type: (Table, Partition, Optional[int]) -> Tuple[Any, ...]
+    return (table.database_name, table.name, partition.location, json.dumps(partition.values),
+            encode_columns(partition.columns), segment, json.dumps(partition.parameters, sort_keys=True))
+
+
+class Mirror(object):
+    __slots__ = ['path', 'ttl', 'segments', 'connection', 'lock']
+
+    def __init__(self, path, ttl=86400, segments=8):
+        # type: (Text, float, int) -> None
+        self.path = path
+        self.ttl = ttl
+        self.segments = segments
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+            # mirrors created before partition parameters were tracked
+            names = [row[1] for row in self.connection.execute('PRAGMA table_info(partitions)')]
+            if 'parameters' not in names:
+                self.connection.execute("ALTER TABLE partitions ADD COLUMN parameters TEXT NOT NULL DEFAULT '{}'")
+
+    def is_fresh(self, table):
+        # type: (Table) -> bool
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT location, refreshed_at FROM tables WHERE database_name = ? AND table_name = ?',
+                (table.database_name, table.name),
+            ).fetchone()
+        return row is not None and row[0] == table.location and time.time() - row[1] < self.ttl
+
+    def list_partitions(self, table, catalog=None, batch_size=10000):
+        # type: (Table, Optional[Catalog], int) -> Iterator[Partition]
+        if not self.is_fresh(table):
+            self.refresh(table, catalog)
+
+        # pages through the primary key, so only one page is held at a time
+        # and the connection is free for other tables between pages
+        last = u''
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    'SELECT location, partition_values, columns, parameters FROM partitions '
+                    'WHERE database_name = ? AND table_name = ? AND location > ? ORDER BY location LIMIT ?',
+                    (table.database_name, table.name, last, batch_size),
+                ).fetchall()
+            for location, values, columns, parameters in rows:
+                yield Partition(json.loads(values), [Column(n, t) for n, t in json.loads(columns)], location,
+                                json.loads(parameters))
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][0]
+
+    def refresh(self, table, catalog=None):
+        # type: (Table, Optional[Catalog]) -> None
+        # a refresh always relists every segment, glue has no cheap way to
+        # tell which partitions changed, so the ttl is what bounds the
+        # requests. the checksums only spare rewriting unchanged segments
+        catalog = catalog or GlueCatalog()
+        with span('refresh_mirror', table=table.name):
+            with ThreadPoolExecutor(max_workers=self.segments) as executor:
+                fetched = list(executor.map(lambda segment: self.fetch_segment(catalog, table, segment),
+                                            range(self.segments)))
+
+            with self.lock, self.connection:
+                key = (table.database_name, table.name)
+                checksums = dict(self.connection.execute(
+                    'SELECT segment, checksum FROM segments WHERE database_name = ? AND table_name = ?', key))
+                unassigned = self.connection.execute(
+                    'SELECT COUNT(*) FROM partitions WHERE database_name = ? AND table_name = ? AND segment IS NULL',
+                    key).fetchone()[0]
+
+                changed = 0
+                for segment, (checksum, partitions) in enumerate(fetched):
+                    if not unassigned and checksums.get(segment) == checksum:
+                        continue
+                    changed += 1
+                    self.connection.execute(
+                        'DELETE FROM partitions WHERE database_name = ? AND table_name = ? AND segment = ?',
+                        key + (segment,))
+                    self.connection.executemany(
+                        INSERT_PARTITION, (partition_row(table, partition, segment) for partition in partitions))
+                    self.connection.execute(
+                        'INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?)', key + (segment, checksum))
+
+                self.connection.execute(
+                    'DELETE FROM partitions WHERE database_name = ? AND table_name = ? AND segment IS NULL', key)
+                self.connection.execute(
+                    'DELETE FROM segments WHERE database_name = ? AND table_name = ? AND segment >= ?',
+                    key + (self.segments,))
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO tables VALUES (?, ?, ?, ?)', key + (table.location, time.time()))
+
+            logger.info('Relisted mirror of %s, rewrote %d of %d segments', table.name, changed, self.segments)
+
+    def fetch_segment(self, catalog, table, segment):
+        # type: (Catalog, Table, int) -> Tuple[Text, List[Partition]]
+        partitions = sorted(catalog.list_partitions(table, segment, self.segments), key=lambda p: p.location)
+        digest = hashlib.sha1()
+        for partition in partitions:
+            digest.update(u'{}\t{}\t{}\t{}\n'.format(
+                partition.location, json.dumps(partition.values), encode_columns(partition.columns),
+                json.dumps(partition.parameters, sort_keys=True),
+            ).encode('utf-8'))
+        return digest.hexdigest(), partitions
+
+    def reset(self, table):
+        # type: (Table) -> None
+        key = (table.database_name, table.name)
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM partitions WHERE database_name = ? AND table_name = ?', key)
+            self.connection.execute('DELETE FROM segments WHERE database_name = ? AND table_name = ?', key)
+            self.connection.execute(
+                'INSERT OR REPLACE INTO tables VALUES (?, ?, ?, ?)', key + (table.location, time.time()))
+
+    def invalidate(self, table):
+        # type: (Table) -> None
+        # the next list_partitions refreshes the table from the catalog
+        key = (table.database_name, table.name)
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM partitions WHERE database_name = ? AND table_name = ?', key)
+            self.connection.execute('DELETE FROM segments WHERE database_name = ? AND table_name = ?', key)
+            self.connection.execute('DELETE FROM tables WHERE database_name = ? AND table_name = ?', key)
+
+    def forget(self, table, partitions):
+        # type: (Table, Iterable[Partition]) -> None
+        key = (table.database_name, table.name)
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'DELETE FROM partitions WHERE database_name = ? AND table_name = ? AND location = ?',
+                (key + (partition.location,) for partition in partitions))
+
+    def record(self, table, partitions):
+        # type: (Table, Iterable[Partition]) -> None
+        # partitions written by us are not assigned to a segment until the next refresh
+        with self.lock, self.connection:
+            self.connection.executemany(
+                INSERT_PARTITION, (partition_row(table, partition) for partition in partitions))
@@ -1,12 +1,12 @@
 import copy
 from functools import total_ordering
-from typing import Any   # noqa: F401
-from typing import Dict  # noqa: F401
-from typing import List  # noqa: F401
-from typing import Text  # noqa: F401
-
-import botocore.session
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
 
+from .clients import get_client
 from .utils import ensure_trailing_slash
 from .utils import remove_trailing_slash
 
@@ -30,7 +30,7 @@ STORAGE_DESCRIPTOR_TEMPLATE = {
         'SkewedColumnValueLocationMaps': {},
     },
     'StoredAsSubDirectories': False,
-}
+}  # type: Dict[Text, Any]
 
 PARTITION_INPUT_TEMPLATE = {
     'Values': [],
@@ -77,13 +77,14 @@ class Column(object):
 
 @total_ordering
 class Partition(object):
-    __slots__ = ['values', 'columns', 'location']
+    __slots__ = ['values', 'columns', 'location', 'parameters']
 
-    def __init__(self, values, columns, location):
-        # type: (List[Text], List[Column], Text) -> None
+    def __init__(self, values, columns, location, parameters=None):
+        # type: (List[Text], List[Column], Text, Optional[Dict[Text, Text]]) -> None
         self.values = values
         self.columns = columns
         self.location = location
+        self.parameters = parameters or {}
 
     @classmethod
     def from_input(cls, data):
@@ -92,6 +93,7 @@ class Partition(object):
             values=data['Values'],
             columns=[Column.from_input(cd) for cd in data['StorageDescriptor']['Columns']],
             location=ensure_trailing_slash(data['StorageDescriptor']['Location']),
+            parameters=data.get('Parameters', {}),
         )
         return partition
 
@@ -101,12 +103,14 @@ class Partition(object):
         data['Values'] = self.values
         data['StorageDescriptor']['Columns'] = [column.to_input() for column in self.columns]
         data['StorageDescriptor']['Location'] = remove_trailing_slash(self.location)
+        if self.parameters:
+            data['Parameters'] = dict(self.parameters)
         return data
 
     @classmethod
     def get(cls, database_name, table_name, values):
         # type: (Text, Text, List[Text]) -> Partition
-        client = botocore.session.get_session().create_client('glue')
+        client = get_client('glue')
         result = client.get_partition(
             DatabaseName=database_name,
             TableName=table_name,
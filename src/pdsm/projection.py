@@ -0,0 +1,87 @@
+import datetime
+import re
+from typing import Dict      # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import List      # noqa: F401
+from typing import Set       # noqa: F401
+from typing import Text      # noqa: F401
+
+from .models import Column     # noqa: F401
+from .models import Partition  # noqa: F401
+
+DATE_FORMATS = [
+    (re.compile(r'[0-9]{8}$'), 'yyyyMMdd', '%Y%m%d'),
+    (re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}$'), 'yyyy-MM-dd', '%Y-%m-%d'),
+]
+
+INTEGER_MATCHER = re.compile(r'-?[0-9]+$')
+
+MAX_ENUM_VALUES = 1000
+
+
+class ProjectionError(Exception):
+    pass
+
+
+def is_projection_parameter(name):
+    # type: (Text) -> bool
+    return name.startswith('projection.') or name == 'storage.location.template'
+
+
+def infer_projection(location, partition_keys, partitions):
+    # type: (Text, List[Column], Iterable[Partition]) -> Dict[Text, Text]
+    if not partition_keys:
+        raise ProjectionError('dataset is not partitioned')
+
+    values_sets = [set() for _ in partition_keys]  # type: List[Set[Text]]
+    for partition in partitions:
+        for values, value in zip(values_sets, partition.values):
+            values.add(value)
+    if not values_sets[0]:
+        raise ProjectionError('dataset has no partitions')
+
+    parameters = {'projection.enabled': 'true'}
+    for key, values in zip(partition_keys, values_sets):
+        for name, value in infer_key_projection(values).items():
+            parameters['projection.{}.{}'.format(key.name, name)] = value
+
+    template = '/'.join('{0}=${{{0}}}'.format(key.name) for key in partition_keys)
+    parameters['storage.location.template'] = '{}{}/'.format(location, template)
+    return parameters
+
+
+def infer_key_projection(values):
+    # type: (Set[Text]) -> Dict[Text, Text]
+    for matcher, athena_format, strptime_format in DATE_FORMATS:
+        if all(matcher.match(value) for value in values):
+            try:
+                dates = [datetime.datetime.strptime(value, strptime_format) for value in values]
+            except ValueError:
+                continue
+            return {
+                'type': 'date',
+                'format': athena_format,
+                'range': '{},{}'.format(min(dates).strftime(strptime_format), max(dates).strftime(strptime_format)),
+                'interval': '1',
+                'interval.unit': 'DAYS',
+            }
+
+    if all(INTEGER_MATCHER.match(value) for value in values):
+        integers = [int(value) for value in values]
+        projection = {
+            'type': 'integer',
+            'range': '{},{}'.format(min(integers), max(integers)),
+        }
+        widths = set(len(value.lstrip('-')) for value in values)
+        padded = any(value.lstrip('-').startswith('0') and value.lstrip('-') != '0' for value in values)
+        if padded and len(widths) == 1:
+            projection['digits'] = str(widths.pop())
+        return projection
+
+    if len(values) <= MAX_ENUM_VALUES and not any(',' in value for value in values):
+        return {
+            'type': 'enum',
+            'values': ','.join(sorted(values)),
+        }
+
+    raise ProjectionError('unable to infer a projection for {} distinct values'.format(len(values)))
@@ -0,0 +1,110 @@
+import datetime  # noqa: F401
+import json
+import logging
+import os
+import threading
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+
+from .dataset import get_versions
+from .dataset import version_key
+from .storage import get_storage
+from .utils import ensure_trailing_slash
+
+logger = logging.getLogger(__name__)
+
+
+def get_watermark(location):
+    # type: (Text) -> Text
+    # the number of entries and the newest name at every level down the
+    # newest path, with the size and last modification of the files at each
+    # level; new partitions at any depth and files added to or rewritten in
+    # the newest partition change it, changes to older partitions do not
+    storage = get_storage(location)
+    bucket, prefix = storage.split(ensure_trailing_slash(location))
+    levels = []  # type: List[Text]
+    while prefix:
+        prefixes, contents = storage.list_directory(bucket, prefix)
+        count = len(prefixes) + len(contents)
+        newest_prefix = max(prefixes) if prefixes else ''
+        newest = ''
+        size = 0
+        modified = None  # type: Optional[datetime.datetime]
+        for summary in contents:
+            newest = max(newest, summary['Key'])
+            size += summary['Size']
+            if modified is None or summary['LastModified'] > modified:
+                modified = summary['LastModified']
+        newest = max(newest, newest_prefix)
+        levels.append(u'{}:{}:{}:{}'.format(count, newest, size, modified.isoformat() if modified else ''))
+        prefix = newest_prefix
+    return u'|'.join(levels)
+
+
+class DatasetRegistry(object):
+    __slots__ = ['path', 'entries', 'lock']
+
+    def __init__(self, path, entries=None):
+        # type: (Text, Optional[Dict[Text, Dict[Text, Any]]]) -> None
+        self.path = path
+        self.entries = entries or {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        # type: (Text) -> DatasetRegistry
+        entries = {}
+        if os.path.exists(path):
+            with open(path) as fp:
+                entries = json.load(fp).get('datasets', {})
+        return cls(path, entries)
+
+    def save(self):
+        # type: () -> None
+        with self.lock:
+            tmp_path = '{}.tmp'.format(self.path)
+            with open(tmp_path, 'w') as fp:
+                json.dump({'datasets': self.entries}, fp, indent=2, sort_keys=True)
+            os.rename(tmp_path, self.path)
+
+    def refresh_location(self, location):
+        # type: (Text) -> Text
+        location = ensure_trailing_slash(location)
+        self.store(location, self.fetch(location))
+        return location
+
+    def store(self, location, entry):
+        # type: (Text, Dict[Text, Any]) -> None
+        with self.lock:
+            entry['synced'] = self.entries.get(location, {}).get('synced')
+            self.entries[location] = entry
+
+    def fetch(self, location):
+        # type: (Text) -> Dict[Text, Any]
+        versions = sorted(get_versions(location), key=version_key)
+        latest = versions[-1] if versions else None
+        watermark = get_watermark(latest) if latest else None
+        return {'versions': versions, 'latest': latest, 'watermark': watermark}
+
+    def versions(self, location):
+        # type: (Text) -> List[Text]
+        with self.lock:
+            return list(self.entries.get(ensure_trailing_slash(location), {}).get('versions', []))
+
+    def is_unchanged(self, location):
+        # type: (Text) -> bool
+        with self.lock:
+            entry = self.entries.get(ensure_trailing_slash(location))
+            if not entry or not entry.get('synced'):
+                return False
+            return bool(entry['synced'] == {'latest': entry['latest'], 'watermark': entry['watermark']})
+
+    def mark_synced(self, location):
+        # type: (Text) -> None
+        with self.lock:
+            entry = self.entries.get(ensure_trailing_slash(location))
+            if entry:
+                entry['synced'] = {'latest': entry['latest'], 'watermark': entry['watermark']}
@@ -1,14 +1,26 @@
+import mmap
+import os
 import struct
-from typing import List  # noqa: F401
-from typing import Text  # noqa: F401
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any       # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+from typing import Tuple     # noqa: F401
+from typing import TYPE_CHECKING
+
+from . import metrics
+from .clients import get_client
+from .models import Column
+from .trace import span
 
-import botocore.session
-from thrift.protocol import TCompactProtocol
-from thrift.transport import TTransport
+if TYPE_CHECKING:  # pragma: no cover
+    from .parquet.ttypes import FileMetaData  # noqa: F401
+    from .parquet.ttypes import SchemaElement  # noqa: F401
 
-from .models import Column
-from .parquet.ttypes import FileMetaData
-from .parquet.ttypes import SchemaElement  # noqa: F401
+PY2 = sys.version_info[0] == 2
 
 TYPE_MAP = {
     0: 'boolean',    # boolean
@@ -25,15 +37,76 @@ class ParquetError(Exception):
     pass
 
 
+class FooterCache(object):
+    # parquet files are written once, so a key and size identify a footer
+    __slots__ = ['capacity', 'entries', 'lock']
+
+    def __init__(self, capacity):
+        # type: (int) -> None
+        self.capacity = capacity
+        self.entries = OrderedDict()  # type: OrderedDict
+        self.lock = threading.Lock()
+
+    def get(self, cache_key):
+        # type: (Tuple[Text, Text, int]) -> Optional[FileMetaData]
+        with self.lock:
+            metadata = self.entries.pop(cache_key, None)  # type: Optional[FileMetaData]
+            if metadata is not None:
+                self.entries[cache_key] = metadata
+        metrics.incr('footer_cache.hits' if metadata is not None else 'footer_cache.misses')
+        return metadata
+
+    def put(self, cache_key, metadata):
+        # type: (Tuple[Text, Text, int], FileMetaData) -> None
+        with self.lock:
+            self.entries[cache_key] = metadata
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+
+_footer_cache = None  # type: Optional[FooterCache]
+
+
+def configure_footer_cache(capacity):
+    # type: (int) -> Optional[FooterCache]
+    global _footer_cache
+    _footer_cache = FooterCache(capacity) if capacity > 0 else None
+    return _footer_cache
+
+
 def read_metadata(bucket, key, size):
     # type: (Text, Text, int) -> FileMetaData
-    session = botocore.session.get_session()
-    client = session.create_client('s3')
+    cache = _footer_cache
+    if cache is not None:
+        metadata = cache.get((bucket, key, size))
+        if metadata is not None:
+            return metadata
+    with span('read_metadata', key=key, size=size):
+        metadata = _read_metadata(bucket, key, size)
+    if cache is not None:
+        cache.put((bucket, key, size), metadata)
+    return metadata
+
+
+def _read_metadata(bucket, key, size):
+    # type: (Text, Text, int) -> FileMetaData
+    from thrift.transport import TTransport
+
+    client = get_client('s3')
 
     offset = size - 8
     response = client.get_object(Bucket=bucket, Key=key, Range='bytes={}-'.format(offset))
-    footer_size = struct.unpack('<i', response['Body'].read(4))[0]
-    magic_number = response['Body'].read(4)
+    footer_size = read_footer_size(response['Body'].read(8), size)
+
+    offset = offset - footer_size
+    response = client.get_object(Bucket=bucket, Key=key, Range='bytes={}-'.format(offset))
+    return decode_metadata(TTransport.TFileObjectTransport(response['Body']))
+
+
+def read_footer_size(tail, size):
+    # type: (bytes, int) -> int
+    footer_size = struct.unpack('<i', tail[:4])[0]  # type: int
+    magic_number = tail[4:8]
 
     if size < (12 + footer_size):
         raise ParquetError('file is too small')
@@ -41,20 +114,80 @@ def read_metadata(bucket, key, size):
     if magic_number != b'PAR1':
         raise ParquetError('magic number is invalid')
 
-    offset = offset - footer_size
-    response = client.get_object(Bucket=bucket, Key=key, Range='bytes={}-'.format(offset))
+    return footer_size
+
+
+def read_local_metadata(path):
+    # type: (Text) -> FileMetaData
+    from thrift.transport import TTransport
+
+    with span('read_metadata', key=path):
+        with open(path, 'rb') as fp:
+            size = os.fstat(fp.fileno()).st_size
+            if size < 12:
+                raise ParquetError('file is too small')
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                footer_size = read_footer_size(buf[size - 8:size], size)
+                start = size - 8 - footer_size
+                if PY2:
+                    # python 2 cannot take a memoryview of a mmap, so the
+                    # footer is copied out of it once
+                    return decode_metadata(TTransport.TMemoryBuffer(buf[start:size - 8]))
+                view = memoryview(buf)[start:size - 8]
+                try:
+                    return decode_metadata(MemoryViewTransport(view))
+                finally:
+                    # the mmap cannot be closed while a view of it is alive
+                    view.release()
+            finally:
+                buf.close()
+
+
+def decode_metadata(transport):
+    # type: (Any) -> FileMetaData
+    from thrift.protocol import TCompactProtocol
+    from .parquet import ttypes
 
-    transport = TTransport.TFileObjectTransport(response['Body'])
     protocol = TCompactProtocol.TCompactProtocol(transport)
-    metadata = FileMetaData()  # type: ignore
+    metadata = ttypes.FileMetaData()  # type: ignore
     metadata.read(protocol)
 
-    if not isinstance(metadata, FileMetaData):
+    if not isinstance(metadata, ttypes.FileMetaData):
         raise ParquetError('error parsing metadata')
 
     return metadata
 
 
+class MemoryViewTransport(object):
+    # reads fields straight out of a mapped footer, so only the bytes of each
+    # field are copied, implements the part of TTransportBase the compact
+    # protocol uses
+    __slots__ = ['view', 'offset']
+
+    def __init__(self, view):
+        # type: (memoryview) -> None
+        self.view = view
+        self.offset = 0
+
+    def isOpen(self):
+        # type: () -> bool
+        return True
+
+    def read(self, sz):
+        # type: (int) -> bytes
+        chunk = self.view[self.offset:self.offset + sz]
+        self.offset += len(chunk)
+        return chunk.tobytes()
+
+    def readAll(self, sz):
+        # type: (int) -> bytes
+        chunk = self.read(sz)
+        if len(chunk) < sz:
+            raise EOFError('end of footer')
+        return chunk
+
+
 def to_columns(schema):
     # type: (List[SchemaElement]) -> List[Column]
     columns = []
@@ -0,0 +1,261 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any       # noqa: F401
+from typing import Callable  # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+from typing import Tuple     # noqa: F401
+from typing import Union
+
+from . import metrics
+from .utils import ensure_trailing_slash
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+    from socketserver import UnixStreamServer
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler  # type: ignore
+    from BaseHTTPServer import HTTPServer  # type: ignore
+    from SocketServer import ThreadingMixIn  # type: ignore
+    from SocketServer import UnixStreamServer  # type: ignore
+
+try:
+    string_types = (str, unicode)  # type: ignore
+except NameError:
+    string_types = (str,)  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+IDLE = 'idle'
+QUEUED = 'queued'
+RUNNING = 'running'
+
+
+class ServiceError(Exception):
+    pass
+
+
+class DatasetStatus(object):
+    __slots__ = ['src', 'state', 'queued', 'requests', 'runs', 'failures', 'last_started', 'last_finished',
+                 'last_error']
+
+    def __init__(self, src):
+        # type: (Text) -> None
+        self.src = src
+        self.state = IDLE
+        # the version and alias of every request that has not started yet,
+        # requests that arrive while a run is in flight wait for the next one
+        # since it may have listed before the change that triggered them
+        self.queued = []  # type: List[Tuple[Optional[Text], Optional[Text]]]
+        self.requests = 0
+        self.runs = 0
+        self.failures = 0
+        self.last_started = None  # type: Optional[float]
+        self.last_finished = None  # type: Optional[float]
+        self.last_error = None  # type: Optional[Text]
+
+    def to_dict(self):
+        # type: () -> Dict[Text, Any]
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class SyncService(object):
+    __slots__ = ['execute', 'executor', 'datasets', 'lock', 'idle']
+
+    def __init__(self, execute, workers=4):
+        # type: (Callable[..., None], int) -> None
+        self.execute = execute
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.datasets = {}  # type: Dict[Text, DatasetStatus]
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+
+    def submit(self, src, version=None, alias=None):
+        # type: (Text, Optional[Text], Optional[Text]) -> Dict[Text, Any]
+        # requests are coalesced per dataset, so syncs of the same dataset
+        # never write its tables concurrently whatever version they ask for
+        src = ensure_trailing_slash(src)
+        request = (version or None, alias or None)
+        with self.lock:
+            status = self.datasets.get(src)
+            if status is None:
+                status = self.datasets[src] = DatasetStatus(src)
+            status.requests += 1
+            if request not in status.queued:
+                status.queued.append(request)
+            if status.state == IDLE:
+                status.state = QUEUED
+                self.executor.submit(self._run, src)
+            else:
+                metrics.incr('service.coalesced')
+            return status.to_dict()
+
+    def _run(self, src):
+        # type: (Text) -> None
+        with self.lock:
+            status = self.datasets[src]
+            status.state = RUNNING
+            requests = status.queued
+            status.queued = []
+            status.last_started = time.time()
+
+        error = None
+        for version, alias in requests:
+            try:
+                self.execute(src=src, version=version, alias=alias)
+            except Exception as ex:
+                logger.exception('Failed to sync %s', src)
+                error = u'{}: {}'.format(type(ex).__name__, ex)
+
+        with self.lock:
+            status.runs += 1
+            status.last_finished = time.time()
+            status.last_error = error
+            if error is not None:
+                status.failures += 1
+                metrics.incr('service.failures')
+            metrics.incr('service.runs')
+            if status.queued:
+                status.state = QUEUED
+                self.executor.submit(self._run, src)
+            else:
+                status.state = IDLE
+                self.idle.notify_all()
+
+    def status(self):
+        # type: () -> List[Dict[Text, Any]]
+        with self.lock:
+            return [self.datasets[src].to_dict() for src in sorted(self.datasets)]
+
+    def counts(self):
+        # type: () -> Dict[Text, float]
+        with self.lock:
+            states = [status.state for status in self.datasets.values()]
+        return {'service.{}'.format(state): states.count(state) for state in (QUEUED, RUNNING)}
+
+    def wait(self, timeout=None):
+        # type: (Optional[float]) -> bool
+        deadline = None if timeout is None else time.time() + timeout
+        with self.lock:
+            while any(status.state != IDLE for status in self.datasets.values()):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.idle.wait(remaining)
+            return True
+
+    def close(self):
+        # type: () -> None
+        self.wait()
+        self.executor.shutdown(wait=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = 'pdsm'
+
+    def do_GET(self):
+        # type: () -> None
+        service = self.server.service  # type: ignore
+        path = self.path.split('?', 1)[0].rstrip('/')
+        if path == '/status':
+            self.send_json(200, {'datasets': service.status()})
+        elif path == '/metrics':
+            self.send_json(200, metrics.snapshot())
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        # type: () -> None
+        service = self.server.service  # type: ignore
+        if self.path.split('?', 1)[0].rstrip('/') != '/sync':
+            self.send_json(404, {'error': 'not found'})
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            request = json.loads(body.decode('utf-8') or '{}')
+            if not isinstance(request, dict):
+                raise ValueError('expected a json object')
+            if not request.get('src') or not isinstance(request['src'], string_types):
+                raise ValueError('src is required')
+            for name in ('version', 'alias'):
+                if request.get(name) is not None and not isinstance(request[name], string_types):
+                    raise ValueError('{} must be a string'.format(name))
+        except ValueError as ex:
+            self.send_json(400, {'error': str(ex)})
+            return
+        status = service.submit(request['src'], request.get('version'), request.get('alias'))
+        self.send_json(202, status)
+
+    def send_json(self, code, data):
+        # type: (int, Any) -> None
+        body = json.dumps(data, sort_keys=True).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # type: () -> str
+        # unix socket peers have no address
+        return self.client_address[0] if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        # type: (str, *Any) -> None
+        logger.debug('%s %s', self.address_string(), format % args)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    service = None  # type: Optional[SyncService]
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    service = None  # type: Optional[SyncService]
+
+    def __init__(self, path, handler_class):
+        # type: (Text, Any) -> None
+        self.path = path
+        UnixStreamServer.__init__(self, path, handler_class)
+
+    def server_bind(self):
+        # type: () -> None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        UnixStreamServer.server_bind(self)
+        self.server_name = socket.gethostname()
+        self.server_port = 0
+
+    def server_close(self):
+        # type: () -> None
+        UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+AnyServer = Union[ThreadingHTTPServer, ThreadingUnixHTTPServer]
+
+
+def create_server(service, listen):
+    # type: (SyncService, Text) -> AnyServer
+    # listen is either host:port or the path of a unix socket
+    if '/' in listen:
+        server = ThreadingUnixHTTPServer(listen, ServiceHandler)  # type: AnyServer
+    else:
+        host, _, port = listen.rpartition(':')
+        try:
+            server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), ServiceHandler)
+        except ValueError:
+            raise ServiceError('invalid listen address {}'.format(listen))
+    server.service = service
+    return server
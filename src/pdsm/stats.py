@@ -0,0 +1,122 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+from typing import Tuple     # noqa: F401
+
+from .listing import ListingStore
+from .storage import Storage  # noqa: F401
+from .trace import span
+
+STATS_PARAMETERS = frozenset(['numFiles', 'numRows', 'totalSize'])
+
+
+def is_stats_parameter(name):
+    # type: (Text) -> bool
+    return name in STATS_PARAMETERS
+
+
+class PartitionStats(object):
+    __slots__ = ['num_files', 'total_size', 'selected', 'sampled_rows', 'sampled_size']
+
+    def __init__(self):
+        # type: () -> None
+        self.num_files = 0
+        self.total_size = 0
+        self.selected = 0
+        self.sampled_rows = 0
+        self.sampled_size = 0
+
+    def num_rows(self):
+        # type: () -> Optional[int]
+        if not self.sampled_size:
+            return None
+        if self.sampled_size == self.total_size:
+            return self.sampled_rows
+        # extrapolate from the footers we read, assuming a similar row size
+        return int(round(float(self.sampled_rows) * self.total_size / self.sampled_size))
+
+    def to_parameters(self):
+        # type: () -> Dict[Text, Text]
+        parameters = {
+            'numFiles': str(self.num_files),
+            'totalSize': str(self.total_size),
+        }
+        num_rows = self.num_rows()
+        if num_rows is not None:
+            parameters['numRows'] = str(num_rows)
+        return parameters
+
+
+class StatsCollector(object):
+    __slots__ = ['sample', 'workers', 'partitions', 'selected', 'lock']
+
+    def __init__(self, sample=None, workers=16):
+        # type: (Optional[int], int) -> None
+        self.sample = sample
+        self.workers = workers
+        self.partitions = {}  # type: Dict[Text, PartitionStats]
+        # the objects whose footers will be read, without sampling that is
+        # every object listed
+        self.selected = ListingStore()
+        self.lock = threading.Lock()
+
+    def add(self, partition_name, summary):
+        # type: (Text, Dict[Text, Any]) -> None
+        stats = self.partitions.get(partition_name)
+        if stats is None:
+            stats = self.partitions[partition_name] = PartitionStats()
+        stats.num_files += 1
+        stats.total_size += summary['Size']
+        if self.sample is None or stats.selected < self.sample:
+            stats.selected += 1
+            self.selected.add(summary, partition_name)
+
+    def collect(self, storage, bucket):
+        # type: (Storage, Text) -> None
+        selected = self.selected
+
+        def read_rows(idx):
+            # type: (int) -> None
+            stats = self.partitions[selected.partition_name(idx)]
+            size = selected.size(idx)
+            metadata = storage.read_metadata(bucket, selected.key(idx), size)
+            with self.lock:
+                stats.sampled_rows += metadata.num_rows
+                stats.sampled_size += size
+
+        with span('read_footers', count=len(selected)):
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for _ in executor.map(read_rows, range(len(selected))):
+                    pass
+        for stats in self.partitions.values():
+            stats.selected = 0
+        selected.clear()
+
+    def partition_parameters(self, partition_name):
+        # type: (Text) -> Dict[Text, Text]
+        stats = self.partitions.get(partition_name)
+        if stats is None:
+            return {}
+        return stats.to_parameters()
+
+    def table_parameters(self):
+        # type: () -> Dict[Text, Text]
+        total = PartitionStats()
+        unknown = False
+        for stats in self.partitions.values():
+            total.num_files += stats.num_files
+            total.total_size += stats.total_size
+            num_rows = stats.num_rows()
+            if num_rows is None:
+                unknown = True
+            else:
+                total.sampled_rows += num_rows
+                total.sampled_size += stats.total_size
+        parameters = total.to_parameters()
+        if unknown:
+            parameters.pop('numRows', None)
+        return parameters
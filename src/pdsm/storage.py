@@ -0,0 +1,218 @@
+import datetime
+import errno
+import os
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Any       # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import Iterable  # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+from typing import Tuple     # noqa: F401
+from typing import TYPE_CHECKING
+
+from .clients import get_client
+from .listing import fast_list_enabled
+from .listing import UTC
+from .schema import read_local_metadata
+from .schema import read_metadata
+from .utils import split_s3_bucket_key
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .parquet.ttypes import FileMetaData  # noqa: F401
+
+try:
+    from os import scandir
+except ImportError:  # pragma: no cover
+    from scandir import scandir  # type: ignore
+
+
+class Storage(object):
+    __slots__ = []  # type: List[str]
+
+    scheme = None  # type: Optional[Text]
+
+    def split(self, location):
+        # type: (Text) -> Tuple[Text, Text]
+        raise NotImplementedError
+
+    def url(self, bucket, key):
+        # type: (Text, Text) -> Text
+        return u'{}://{}/{}'.format(self.scheme, bucket, key)
+
+    def list_prefixes(self, bucket, prefix):
+        # type: (Text, Text) -> Iterable[Text]
+        raise NotImplementedError
+
+    def list_objects(self, bucket, prefix, start_after=None):
+        # type: (Text, Text, Optional[Text]) -> Iterable[Dict[Text, Any]]
+        raise NotImplementedError
+
+    def list_directory(self, bucket, prefix):
+        # type: (Text, Text) -> Tuple[List[Text], List[Dict[Text, Any]]]
+        # the prefixes and objects directly under prefix, without recursing
+        raise NotImplementedError
+
+    def has_objects(self, bucket, prefix):
+        # type: (Text, Text) -> bool
+        return next(iter(self.list_objects(bucket, prefix)), None) is not None
+
+    def read_metadata(self, bucket, key, size):
+        # type: (Text, Text, int) -> FileMetaData
+        raise NotImplementedError
+
+
+class S3Storage(Storage):
+    __slots__ = []  # type: List[str]
+
+    scheme = 's3'
+
+    def split(self, location):
+        # type: (Text) -> Tuple[Text, Text]
+        return split_s3_bucket_key(location)
+
+    def iterate(self, bucket, prefix, delimiter=None, search=None, start_after=None):
+        # type: (Text, Text, Optional[Text], Optional[Text], Optional[Text]) -> Iterable[Any]
+        client = get_client('s3')
+        paginator = client.get_paginator('list_objects_v2')
+        options = {'Bucket': bucket, 'Prefix': prefix}
+        if delimiter:
+            options['Delimiter'] = delimiter
+        if start_after:
+            options['StartAfter'] = start_after
+        iterator = paginator.paginate(**options)
+        if search:
+            iterator = iterator.search(search)
+        return (result for result in iterator if result is not None)
+
+    def list_prefixes(self, bucket, prefix):
+        # type: (Text, Text) -> Iterable[Text]
+        return self.iterate(bucket, prefix, '/', 'CommonPrefixes[].Prefix')
+
+    def list_objects(self, bucket, prefix, start_after=None):
+        # type: (Text, Text, Optional[Text]) -> Iterable[Dict[Text, Any]]
+        if fast_list_enabled():
+            return self.iterate_contents(bucket, prefix, start_after)
+        return self.iterate(bucket, prefix, search='Contents[]', start_after=start_after)
+
+    def list_directory(self, bucket, prefix):
+        # type: (Text, Text) -> Tuple[List[Text], List[Dict[Text, Any]]]
+        prefixes = []  # type: List[Text]
+        objects = []  # type: List[Dict[Text, Any]]
+        for page in self.iterate(bucket, prefix, '/'):
+            prefixes.extend(cp['Prefix'] for cp in page.get('CommonPrefixes', []))
+            objects.extend(page.get('Contents', []))
+        return prefixes, objects
+
+    def iterate_contents(self, bucket, prefix, start_after=None):
+        # type: (Text, Text, Optional[Text]) -> Iterable[Dict[Text, Any]]
+        # pages through the listing without the paginator and its jmespath
+        # search, yielding the lean summaries as they are parsed
+        client = get_client('s3')
+        options = {'Bucket': bucket, 'Prefix': prefix}
+        if start_after:
+            options['StartAfter'] = start_after
+        while True:
+            page = client.list_objects_v2(**options)
+            for summary in page.get('Contents', ()):
+                yield summary
+            if not page.get('IsTruncated') or not page.get('NextContinuationToken'):
+                return
+            options['ContinuationToken'] = page['NextContinuationToken']
+
+    def has_objects(self, bucket, prefix):
+        # type: (Text, Text) -> bool
+        result = get_client('s3').list_objects_v2(Bucket=bucket, Prefix=prefix, MaxKeys=1)
+        return bool(result.get('KeyCount', len(result.get('Contents', ()))))
+
+    def read_metadata(self, bucket, key, size):
+        # type: (Text, Text, int) -> FileMetaData
+        return read_metadata(bucket, key, size)
+
+
+class FileStorage(Storage):
+    __slots__ = ['workers']
+
+    scheme = 'file'
+
+    def __init__(self, workers=8):
+        # type: (int) -> None
+        self.workers = workers
+
+    def split(self, location):
+        # type: (Text) -> Tuple[Text, Text]
+        # keys are absolute paths without their leading slash so that
+        # url() round trips to file:///path
+        if location.startswith('file://'):
+            location = location[7:]
+        return u'', os.path.abspath(location).lstrip('/') + (u'/' if location.endswith('/') else u'')
+
+    def list_prefixes(self, bucket, prefix):
+        # type: (Text, Text) -> Iterable[Text]
+        files, directories = scan_directory(u'/' + prefix)
+        for path in sorted(directories):
+            yield path[1:] + u'/'
+
+    def list_objects(self, bucket, prefix, start_after=None):
+        # type: (Text, Text, Optional[Text]) -> Iterable[Dict[Text, Any]]
+        root = os.path.dirname(u'/' + prefix)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {executor.submit(scan_directory, root)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, directories = future.result()
+                    for path, size, mtime in files:
+                        key = path[1:]
+                        if key.startswith(prefix) and (not start_after or key > start_after):
+                            yield {'Key': key, 'Size': size, 'LastModified': mtime}
+                    for path in directories:
+                        key = path[1:] + u'/'
+                        if key.startswith(prefix) or prefix.startswith(key):
+                            pending.add(executor.submit(scan_directory, path))
+
+    def list_directory(self, bucket, prefix):
+        # type: (Text, Text) -> Tuple[List[Text], List[Dict[Text, Any]]]
+        files, directories = scan_directory(u'/' + prefix)
+        return ([path[1:] + u'/' for path in sorted(directories)],
+                [{'Key': path[1:], 'Size': size, 'LastModified': mtime} for path, size, mtime in sorted(files)])
+
+    def read_metadata(self, bucket, key, size):
+        # type: (Text, Text, int) -> FileMetaData
+        return read_local_metadata(u'/' + key)
+
+
+def scan_directory(path):
+    # type: (Text) -> Tuple[List[Tuple[Text, int, datetime.datetime]], List[Text]]
+    files = []  # type: List[Tuple[Text, int, datetime.datetime]]
+    directories = []  # type: List[Text]
+    try:
+        entries = list(scandir(path))
+    except OSError as e:
+        if e.errno in (errno.ENOENT, errno.ENOTDIR):
+            return files, directories
+        raise
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            directories.append(entry.path)
+        elif entry.is_file():
+            stat = entry.stat()
+            mtime = datetime.datetime.fromtimestamp(stat.st_mtime, UTC)
+            files.append((entry.path, stat.st_size, mtime))
+    return files, directories
+
+
+STORAGES = {
+    's3': S3Storage(),
+    'file': FileStorage(),
+}  # type: Dict[Text, Storage]
+
+
+def get_storage(location):
+    # type: (Text) -> Storage
+    scheme = location.split('://', 1)[0] if '://' in location else 's3'
+    if scheme not in STORAGES:
+        raise ValueError('unsupported location {}'.format(location))
+    return STORAGES[scheme]
@@ -0,0 +1,528 @@
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Any        # noqa: F401
+from typing import Dict       # noqa: F401
+from typing import FrozenSet  # noqa: F401
+from typing import Iterable   # noqa: F401
+from typing import Iterator   # noqa: F401
+from typing import List       # noqa: F401
+from typing import Optional   # noqa: F401
+from typing import Set        # noqa: F401
+from typing import Text       # noqa: F401
+from typing import Tuple      # noqa: F401
+
+from .catalog import Catalog  # noqa: F401
+from .catalog import GlueCatalog
+from .column_stats import publish_column_statistics
+from .column_stats import StatisticsCache
+from .dataset import Dataset  # noqa: F401
+from .dataset import probe_fingerprint
+from .external import external_sort
+from .fingerprint import Fingerprint
+from .fingerprint import FINGERPRINT_PARAMETER
+from .glue import Table  # noqa: F401
+from .mirror import Mirror  # noqa: F401
+from .models import Column
+from .models import Partition
+from .projection import infer_projection
+from .projection import is_projection_parameter
+from .projection import ProjectionError
+from .stats import is_stats_parameter
+from .storage import get_storage
+from .trace import profile_thread
+from .trace import span
+from .utils import chunks
+from .utils import ensure_trailing_slash
+
+logger = logging.getLogger(__name__)
+
+ADD = 'add'
+UPDATE = 'update'
+DELETE = 'delete'
+
+DEFAULT_DATABASE = 'telemetry'
+
+
+class SyncError(Exception):
+    pass
+
+
+class PrunePolicy(object):
+    __slots__ = ['probe', 'threshold', 'dry_run', 'workers']
+
+    def __init__(self, probe=False, threshold=0.1, dry_run=False, workers=16):
+        # type: (bool, float, bool, int) -> None
+        # without probes a partition is stale when the listing has no live
+        # objects under it, which is only as current as the listing
+        self.probe = probe
+        self.threshold = threshold
+        self.dry_run = dry_run
+        self.workers = workers
+
+    def probing(self):
+        # type: () -> PrunePolicy
+        return PrunePolicy(True, self.threshold, self.dry_run, self.workers)
+
+
+class CountingIterator(object):
+    __slots__ = ['iterator', 'count']
+
+    def __init__(self, iterable):
+        # type: (Iterable[Any]) -> None
+        self.iterator = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        # type: () -> CountingIterator
+        return self
+
+    def __next__(self):
+        # type: () -> Any
+        item = next(self.iterator)
+        self.count += 1
+        return item
+
+    next = __next__
+
+
+class DesiredState(object):
+    __slots__ = ['dataset', 'columns_set', 'partitions', 'parameters', 'projection', 'spill_threshold', 'stats',
+                 'column_stats', 'column_statistics', 'prune']
+
+    def __init__(self, dataset, projection=False, spill_threshold=None, column_stats=False, prune=None):
+        # type: (Dataset, bool, Optional[int], bool, Optional[PrunePolicy]) -> None
+        self.dataset = dataset
+        self.columns_set = frozenset(dataset.columns)  # type: FrozenSet[Column]
+        self.partitions = dataset.partitions
+        if isinstance(self.partitions, list):
+            self.partitions = sorted(self.partitions, key=lambda p: p.location)
+        self.parameters = {}  # type: Dict[Text, Text]
+        self.projection = False
+        self.spill_threshold = spill_threshold
+        self.stats = dataset.stats is not None
+        self.column_stats = column_stats
+        self.column_statistics = StatisticsCache()
+        self.prune = prune
+
+        if projection:
+            try:
+                self.parameters = infer_projection(dataset.location, dataset.partition_keys, dataset.partitions)
+                self.projection = True
+            except ProjectionError as ex:
+                logger.warning('Registering partitions for %s, projection unavailable: %s', dataset.location, ex)
+
+        if dataset.stats is not None:
+            self.parameters.update(dataset.stats.table_parameters())
+
+    def is_managed(self, name):
+        # type: (Text) -> bool
+        return is_projection_parameter(name) or (self.stats and is_stats_parameter(name))
+
+    def managed_parameters(self, table):
+        # type: (Table) -> Dict[Text, Text]
+        return {k: v for k, v in table.parameters.items() if self.is_managed(k)}
+
+    def table_parameters(self, table):
+        # type: (Optional[Table]) -> Dict[Text, Text]
+        parameters = {}  # type: Dict[Text, Text]
+        if table is not None:
+            parameters = {k: v for k, v in table.parameters.items() if not self.is_managed(k)}
+        parameters.update(self.parameters)
+        return parameters
+
+
+def sync_tables(desired, table_names, catalog=None, mirror=None, database_name=DEFAULT_DATABASE):
+    # type: (DesiredState, List[Text], Optional[Catalog], Optional[Mirror], Text) -> List[Table]
+    catalog = catalog or GlueCatalog()
+    if len(table_names) == 1:
+        return [sync_table(desired, table_names[0], catalog, mirror, database_name)]
+
+    with ThreadPoolExecutor(max_workers=len(table_names)) as executor:
+        worker = profile_thread(sync_table)
+        futures = [executor.submit(worker, desired, table_name, catalog, mirror, database_name)
+                   for table_name in table_names]
+        return [future.result() for future in futures]
+
+
+def sync_table(desired, table_name, catalog, mirror=None, database_name=DEFAULT_DATABASE):
+    # type: (DesiredState, Text, Catalog, Optional[Mirror], Text) -> Table
+    with span('sync_table', table=table_name, database=database_name):
+        return _sync_table(desired, table_name, catalog, mirror, database_name)
+
+
+def _sync_table(desired, table_name, catalog, mirror, database_name):
+    # type: (DesiredState, Text, Catalog, Optional[Mirror], Text) -> Table
+    dataset = desired.dataset
+    table = catalog.get_table(database_name, table_name)
+    created = not table or table.location != dataset.location
+
+    if not table:
+        logger.info('Creating %s', table_name)
+        table = catalog.create_table(
+            database_name=database_name,
+            name=table_name,
+            columns=dataset.columns,
+            location=dataset.location,
+            partition_keys=dataset.partition_keys,
+            parameters=desired.table_parameters(None),
+        )
+
+    elif table.location != dataset.location:
+        # while a promotion runs the alias serves partitions of both versions,
+        # that is only safe while they agree on the schema
+        if (not desired.projection and table.partition_keys == dataset.partition_keys
+                and desired.columns_set == set(table.columns)):
+            logger.info('Promoting %s to %s', table_name, dataset.location)
+            return promote_table(desired, table, catalog, mirror)
+        logger.info('Recreating %s', table_name)
+        catalog.drop_table(database_name, table.name)
+        table = catalog.create_table(
+            database_name=database_name,
+            name=table_name,
+            columns=dataset.columns,
+            location=dataset.location,
+            partition_keys=dataset.partition_keys,
+            parameters=desired.table_parameters(None),
+        )
+
+    elif (desired.columns_set != set(table.columns)
+            or desired.parameters != desired.managed_parameters(table)):
+        logger.info('Updating %s', table_name)
+        table = catalog.update_table(
+            database_name=table.database_name,
+            name=table.name,
+            columns=dataset.columns,
+            location=dataset.location,
+            partition_keys=dataset.partition_keys,
+            parameters=desired.table_parameters(table),
+        )
+
+    if mirror is not None and created:
+        mirror.reset(table)
+
+    if desired.projection:
+        logger.info('Skipping partitions on %s, partition projection is enabled', table_name)
+        return table
+
+    different = []  # type: List[Partition]
+    missing = []  # type: List[Partition]
+    unlisted = []  # type: List[Partition]
+
+    if mirror is not None:
+        existing = CountingIterator(mirror.list_partitions(table, catalog))
+    else:
+        existing = CountingIterator(sorted_table_partitions(catalog, table, desired.spill_threshold))
+    prune = desired.prune is not None
+    for action, partition in diff_partitions(iter(desired.partitions), existing, desired.columns_set, prune):
+        if action == DELETE:
+            unlisted.append(partition)
+            continue
+        if action == UPDATE:
+            partition.columns = dataset.columns
+            different.append(partition)
+        else:
+            missing.append(partition)
+
+        if len(different) == 100:
+            logger.info('Updating %d partitions on %s', len(different), table_name)
+            write_partitions(catalog, table, different, mirror, update=True)
+            different = []
+
+        if len(missing) == 1000:
+            logger.info('Adding %d partitions to %s', len(missing), table_name)
+            write_partitions(catalog, table, missing, mirror)
+            if desired.column_stats:
+                publish_column_statistics(catalog, table, missing, cache=desired.column_statistics)
+            missing = []
+
+    if different:
+        logger.info('Updating %d partitions on %s', len(different), table_name)
+        write_partitions(catalog, table, different, mirror, update=True)
+
+    if missing:
+        logger.info('Adding %d partitions to %s', len(missing), table_name)
+        write_partitions(catalog, table, missing, mirror)
+        if desired.column_stats:
+            publish_column_statistics(catalog, table, missing, cache=desired.column_statistics)
+
+    if unlisted:
+        prune_partitions(desired, table, catalog, unlisted, existing.count, mirror)
+
+    return table
+
+
+def prune_partitions(desired, table, catalog, unlisted, total, mirror=None):
+    # type: (DesiredState, Table, Catalog, List[Partition], int, Optional[Mirror]) -> List[Partition]
+    # partitions outside the dataset were never listed, so they are always
+    # probed; the threshold guards against a truncated or mistaken listing
+    policy = desired.prune
+    assert policy is not None
+    location = desired.dataset.location
+    probed = [p for p in unlisted if policy.probe or not p.location.startswith(location)]
+    stale = [p for p in unlisted if not policy.probe and p.location.startswith(location)]
+    if probed:
+        with span('probe_partitions', table=table.name, count=len(probed)):
+            with ThreadPoolExecutor(max_workers=policy.workers) as executor:
+                live = list(executor.map(has_objects, probed))
+        stale.extend(p for p, is_live in zip(probed, live) if not is_live)
+    if not stale:
+        return []
+
+    if len(stale) > policy.threshold * total:
+        raise SyncError('refusing to prune {} of {} partitions from {}, more than the threshold of {:.0%}'.format(
+            len(stale), total, table.name, policy.threshold))
+    if policy.dry_run:
+        for partition in stale:
+            logger.info('Would prune %s from %s', partition.location, table.name)
+        return stale
+
+    logger.info('Pruning %d partitions from %s', len(stale), table.name)
+    with span('prune_partitions', table=table.name, count=len(stale)):
+        with ThreadPoolExecutor(max_workers=policy.workers) as executor:
+            for _ in executor.map(lambda batch: catalog.delete_partitions(table, batch), chunks(stale, 25)):
+                pass
+    if mirror is not None:
+        mirror.forget(table, stale)
+    return stale
+
+
+def has_objects(partition):
+    # type: (Partition) -> bool
+    storage = get_storage(partition.location)
+    bucket, prefix = storage.split(ensure_trailing_slash(partition.location))
+    return storage.has_objects(bucket, prefix)
+
+
+class Target(object):
+    __slots__ = ['catalog', 'database_name', 'mirror', 'name']
+
+    def __init__(self, catalog, database_name=DEFAULT_DATABASE, mirror=None, name=None):
+        # type: (Catalog, Text, Optional[Mirror], Optional[Text]) -> None
+        self.catalog = catalog
+        self.database_name = database_name
+        self.mirror = mirror
+        self.name = name or database_name
+
+
+class TargetResult(object):
+    __slots__ = ['target', 'tables', 'error']
+
+    def __init__(self, target, tables=None, error=None):
+        # type: (Target, Optional[List[Table]], Optional[Exception]) -> None
+        self.target = target
+        self.tables = tables or []
+        self.error = error
+
+
+def sync_targets(desired, table_names, targets):
+    # type: (DesiredState, List[Text], List[Target]) -> List[TargetResult]
+    # the desired state is computed once and reconciled against every target,
+    # a failing target is reported without stopping the others
+    def sync_target(target):
+        # type: (Target) -> TargetResult
+        try:
+            with span('sync_target', target=target.name):
+                tables = sync_tables(desired, table_names, target.catalog, target.mirror, target.database_name)
+            return TargetResult(target, tables)
+        except Exception as ex:
+            logger.exception('Failed to sync %s to %s', desired.dataset.location, target.name)
+            return TargetResult(target, error=ex)
+
+    if len(targets) == 1:
+        return [sync_target(targets[0])]
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        return list(executor.map(profile_thread(sync_target), targets))
+
+
+def promote_table(desired, table, catalog, mirror=None, workers=8, batch_size=1000):
+    # type: (DesiredState, Table, Catalog, Optional[Mirror], int, int) -> Table
+    # new partitions are written and existing ones repointed while the table
+    # still serves the previous version, the table itself is flipped with a
+    # single update and partitions only the previous version had go last.
+    # until then readers see partitions of both versions, which the caller
+    # only allows when the columns did not change
+    dataset = desired.dataset
+    if mirror is not None:
+        existing = mirror.list_partitions(table, catalog)  # type: Iterable[Partition]
+    else:
+        existing = sorted_table_partitions(catalog, table, desired.spill_threshold)
+
+    def write(action, partitions):
+        # type: (Text, List[Partition]) -> None
+        if action == ADD:
+            catalog.add_partitions(table, partitions)
+        elif action == UPDATE:
+            catalog.update_partitions(table, partitions)
+        else:
+            catalog.delete_partitions(table, partitions)
+        if desired.column_stats and action != DELETE:
+            publish_column_statistics(catalog, table, partitions, cache=desired.column_statistics)
+
+    pending = set()  # type: Set[Any]
+
+    def submit(executor, action, partitions):
+        # type: (ThreadPoolExecutor, Text, List[Partition]) -> None
+        # bounded so a streamed desired state is not buffered in the queue
+        if len(pending) >= 2 * workers:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                future.result()
+        pending.add(executor.submit(profile_thread(write), action, partitions))
+
+    obsolete = []  # type: List[Partition]
+    batches = {ADD: [], UPDATE: []}  # type: Dict[Text, List[Partition]]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for action, partition in diff_promotion(iter(desired.partitions), existing, table.location, dataset.location):
+            if action == DELETE:
+                obsolete.append(partition)
+                continue
+            batches[action].append(partition)
+            if len(batches[action]) == batch_size:
+                submit(executor, action, batches[action])
+                batches[action] = []
+        for action, batch in sorted(batches.items()):
+            if batch:
+                submit(executor, action, batch)
+        for future in pending:
+            future.result()
+        pending.clear()
+
+        table = catalog.update_table(
+            database_name=table.database_name,
+            name=table.name,
+            columns=dataset.columns,
+            location=dataset.location,
+            partition_keys=dataset.partition_keys,
+            parameters=desired.table_parameters(table),
+        )
+
+        if obsolete:
+            logger.info('Dropping %d partitions of the previous version from %s', len(obsolete), table.name)
+            for batch in chunks(obsolete, batch_size):
+                submit(executor, DELETE, batch)
+            for future in pending:
+                future.result()
+
+    # the promoted partitions were streamed, not kept, so the next run
+    # refreshes the mirror from the catalog
+    if mirror is not None:
+        mirror.invalidate(table)
+    return table
+
+
+def diff_promotion(desired, existing, old_location, new_location):
+    # type: (Iterator[Partition], Iterable[Partition], Text, Text) -> Iterator[Tuple[Text, Partition]]
+    # partitions are matched on their location relative to the table, which
+    # keeps both inputs in the same order, partitions outside the previous
+    # location sort before or after all of the others and are dropped
+    wanted = next(desired, None)
+    for partition in existing:
+        if not partition.location.startswith(old_location):
+            yield DELETE, partition
+            continue
+        name = partition.location[len(old_location):]
+        while wanted is not None and wanted.location[len(new_location):] < name:
+            yield ADD, wanted
+            wanted = next(desired, None)
+        if wanted is not None and wanted.location[len(new_location):] == name:
+            yield UPDATE, wanted
+            wanted = next(desired, None)
+        else:
+            yield DELETE, partition
+    while wanted is not None:
+        yield ADD, wanted
+        wanted = next(desired, None)
+
+
+def is_unchanged(catalog, location, table_names, database_name=DEFAULT_DATABASE):
+    # type: (Catalog, Text, List[Text], Text) -> bool
+    fingerprints = set()
+    for table_name in table_names:
+        table = catalog.get_table(database_name, table_name)
+        if table is None or table.location != location:
+            return False
+        fingerprints.add(table.parameters.get(FINGERPRINT_PARAMETER))
+    if len(fingerprints) != 1:
+        return False
+    fingerprint = Fingerprint.decode(fingerprints.pop())
+    return fingerprint is not None and probe_fingerprint(location, fingerprint)
+
+
+def store_fingerprint(catalog, tables, fingerprint):
+    # type: (Catalog, List[Table], Fingerprint) -> None
+    # only written once every table synced, so a failed run is retried in full
+    value = fingerprint.encode()
+    for table in tables:
+        if table.parameters.get(FINGERPRINT_PARAMETER) == value:
+            continue
+        parameters = dict(table.parameters)
+        parameters[FINGERPRINT_PARAMETER] = value
+        catalog.update_table(table.database_name, table.name, table.columns, table.location, table.partition_keys,
+                             parameters)
+
+
+def write_partitions(catalog, table, partitions, mirror=None, update=False):
+    # type: (Catalog, Table, List[Partition], Optional[Mirror], bool) -> None
+    # updated partitions keep their column statistics and stay readable
+    if update:
+        catalog.update_partitions(table, partitions)
+    else:
+        catalog.add_partitions(table, partitions)
+    if mirror is not None:
+        mirror.record(table, partitions)
+
+
+def diff_partitions(desired, existing, columns_set, unlisted=False):
+    # type: (Iterator[Partition], Iterable[Partition], FrozenSet[Column], bool) -> Iterator[Tuple[Text, Partition]]
+    # both inputs are sorted by location, so a single merge pass finds the
+    # partitions to add and the existing partitions with outdated columns or
+    # parameters, and optionally the existing partitions that were not listed
+    wanted = next(desired, None)
+    for partition in existing:
+        while wanted is not None and wanted.location < partition.location:
+            yield ADD, wanted
+            wanted = next(desired, None)
+        stale = False
+        if wanted is not None and wanted.location == partition.location:
+            if any(partition.parameters.get(k) != v for k, v in wanted.parameters.items()):
+                partition.parameters = dict(partition.parameters, **wanted.parameters)
+                stale = True
+            wanted = next(desired, None)
+        elif unlisted:
+            yield DELETE, partition
+            continue
+        if stale or columns_set != set(partition.columns):
+            yield UPDATE, partition
+    while wanted is not None:
+        yield ADD, wanted
+        wanted = next(desired, None)
+
+
+def sorted_table_partitions(catalog, table, spill_threshold=None):
+    # type: (Catalog, Table, Optional[int]) -> Iterator[Partition]
+    if not spill_threshold:
+        for partition in sorted(catalog.list_partitions(table), key=lambda p: p.location):
+            yield partition
+        return
+
+    with external_sort((encode_partition(p) for p in catalog.list_partitions(table)), spill_threshold) as lines:
+        for line in lines:
+            yield decode_partition(line)
+
+
+def encode_partition(partition):
+    # type: (Partition) -> Text
+    data = [partition.values, [[column.name, column.type] for column in partition.columns], partition.parameters]
+    return u'{}\t{}'.format(partition.location, json.dumps(data))
+
+
+def decode_partition(line):
+    # type: (Text) -> Partition
+    location, data = line.split('\t', 1)
+    values, columns, parameters = json.loads(data)
+    return Partition(values, [Column(name, type_) for name, type_ in columns], location, parameters)
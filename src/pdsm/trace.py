@@ -0,0 +1,222 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from typing import Any       # noqa: F401
+from typing import Callable  # noqa: F401
+from typing import Dict      # noqa: F401
+from typing import List      # noqa: F401
+from typing import Optional  # noqa: F401
+from typing import Text      # noqa: F401
+from typing import TypeVar
+
+T = TypeVar('T')
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class NullSpan(object):
+    __slots__ = []  # type: List[str]
+
+    def __enter__(self):
+        # type: () -> NullSpan
+        return self
+
+    def __exit__(self, *exc_info):
+        # type: (*Any) -> None
+        pass
+
+    def set(self, **args):
+        # type: (**Any) -> None
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span(object):
+    __slots__ = ['tracer', 'name', 'cat', 'args', 'start']
+
+    def __init__(self, tracer, name, cat, args):
+        # type: (Tracer, Text, Text, Dict[Text, Any]) -> None
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        # type: () -> Span
+        self.start = clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # type: (Any, Any, Any) -> None
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.record(self.name, self.cat, self.start, clock(), self.args)
+
+    def set(self, **args):
+        # type: (**Any) -> None
+        self.args.update(args)
+
+
+class Tracer(object):
+    __slots__ = ['events', 'lock', 'pid', 'origin']
+
+    def __init__(self):
+        # type: () -> None
+        self.events = []  # type: List[Dict[Text, Any]]
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.origin = clock()
+
+    def record(self, name, cat, start, end, args):
+        # type: (Text, Text, float, float, Dict[Text, Any]) -> None
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': int((start - self.origin) * 1e6),
+            'dur': int((end - start) * 1e6),
+            'pid': self.pid,
+            'tid': threading.current_thread().ident,
+            'args': args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def export(self, path):
+        # type: (Text) -> None
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w') as fp:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fp, default=str)
+
+
+_tracer = None  # type: Optional[Tracer]
+
+
+def enable():
+    # type: () -> Tracer
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disable():
+    # type: () -> None
+    global _tracer
+    _tracer = None
+
+
+def enabled():
+    # type: () -> bool
+    return _tracer is not None
+
+
+def export(path):
+    # type: (Text) -> None
+    if _tracer is not None:
+        _tracer.export(path)
+
+
+def span(name, cat='phase', **args):
+    # type: (Text, Text, **Any) -> Any
+    tracer = _tracer
+    if tracer is None:
+        return NULL_SPAN
+    return Span(tracer, name, cat, args)
+
+
+def instrument(client):
+    # type: (Any) -> None
+    service_name = client.meta.service_model.service_name
+
+    # clients are cached for the life of the process, so the handlers are
+    # always registered and only record while a tracer is enabled
+    def before_call(params, model, context, **kwargs):
+        # type: (Dict[Text, Any], Any, Dict[Text, Any], **Any) -> None
+        if _tracer is not None:
+            context['pdsm_trace'] = (model.name, clock())
+
+    def after_call(context, **kwargs):
+        # type: (Dict[Text, Any], **Any) -> None
+        tracer = _tracer
+        started = context.pop('pdsm_trace', None)
+        if tracer is None or started is None:
+            return
+        args = {'service': service_name}
+        if kwargs.get('exception') is not None:
+            args['error'] = type(kwargs['exception']).__name__
+        tracer.record(started[0], 'aws', started[1], clock(), args)
+
+    client.meta.events.register('before-parameter-build.{}'.format(service_name), before_call)
+    client.meta.events.register('after-call.{}'.format(service_name), after_call)
+    client.meta.events.register('after-call-error.{}'.format(service_name), after_call)
+
+
+class ProfileSet(object):
+    __slots__ = ['profilers', 'lock']
+
+    def __init__(self):
+        # type: () -> None
+        self.profilers = []  # type: List[cProfile.Profile]
+        self.lock = threading.Lock()
+
+    def add(self, profiler):
+        # type: (cProfile.Profile) -> None
+        with self.lock:
+            self.profilers.append(profiler)
+
+
+_profiles = threading.local()
+
+
+def profiled(path, func, *args, **kwargs):
+    # type: (Text, Callable[..., Any], *Any, **Any) -> Any
+    # work handed to threads through profile_thread is merged into the same dump
+    profiles = ProfileSet()
+    previous = getattr(_profiles, 'current', None)
+    _profiles.current = profiles
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        _profiles.current = previous
+        stats = pstats.Stats(profiler)
+        with profiles.lock:
+            for worker in profiles.profilers:
+                stats.add(worker)
+        stats.dump_stats(path)
+
+
+def profile_thread(func):
+    # type: (Callable[..., T]) -> Callable[..., T]
+    # cProfile only follows the thread that enabled it, so functions submitted
+    # to worker threads run under their own profiler while a profile is taken
+    profiles = getattr(_profiles, 'current', None)
+    if profiles is None:
+        return func
+
+    def wrapper(*args, **kwargs):
+        # type: (*Any, **Any) -> T
+        _profiles.current = profiles
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            active = True
+        except ValueError:
+            # newer pythons allow a single active profiler, which already covers every thread
+            active = False
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _profiles.current = None
+            if active:
+                profiler.disable()
+                profiles.add(profiler)
+
+    return wrapper
@@ -0,0 +1,54 @@
+# compares the regex filter and partition matcher with KeyClassifier:
+#
+#     python tests/benchmark_keys.py [COUNT]
+import sys
+import time
+
+from pdsm.dataset import IGNORED_MATCHER
+from pdsm.dataset import PARTITION_MATCHER
+from pdsm.keys import KeyClassifier
+
+PREFIX = 'datasets/main_summary/v4/'
+
+
+def synthetic_keys(count, files_per_partition=50):
+    for idx in range(count):
+        partition, part = divmod(idx, files_per_partition)
+        day, sample_id = divmod(partition, 100)
+        directory = '{}submission_date_s3={}/sample_id={}/'.format(PREFIX, 20170101 + day, sample_id)
+        if part == 0:
+            yield directory + '_SUCCESS', 0
+        yield '{}part-{:05d}.snappy.parquet'.format(directory, part), 1024
+
+
+def regex_partitions(keys):
+    offset = len(PREFIX)
+    for key, size in keys:
+        if IGNORED_MATCHER.match(key) or size < 12 or '=__HIVE_DEFAULT_PARTITION__/' in key:
+            continue
+        matches = PARTITION_MATCHER.match(key, offset)
+        yield matches.group(1) + '/' if matches else ''
+
+
+def classifier_partitions(keys):
+    classifier = KeyClassifier(PREFIX)
+    for key, size in keys:
+        partition_name = classifier.classify(key, size)
+        if partition_name is not None:
+            yield partition_name
+
+
+def main(count):
+    keys = list(synthetic_keys(count))
+    results = {}
+    for name, func in (('regex', regex_partitions), ('classifier', classifier_partitions)):
+        started = time.time()
+        results[name] = len(set(func(keys)))
+        elapsed = time.time() - started
+        print('{:<10} {:>8.2f}s {:>12.0f} keys/s {} partitions'.format(name, elapsed, len(keys) / elapsed,
+                                                                       results[name]))
+    assert results['regex'] == results['classifier']
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10 * 1000 * 1000)
@@ -1,6 +1,90 @@
+import gzip
+import io
+import json
+import os
+import pstats
+import struct
+import subprocess
+import sys
+import threading
+from datetime import timedelta
+
+import botocore.session
+import pytest
+from botocore.awsrequest import AWSResponse
 from click.testing import CliRunner
+from thrift.protocol import TCompactProtocol
+from thrift.transport import TTransport
 
+import pdsm
+from pdsm import limiter as limiter_module
+from pdsm import metrics
+from pdsm import sync as sync_module
+from pdsm import trace
+from pdsm.catalog import Catalog
+from pdsm.catalog import CatalogError
+from pdsm.catalog import get_catalog
+from pdsm.catalog import GlueCatalog
+from pdsm.catalog import HiveMetastoreCatalog
 from pdsm.cli import main
+from pdsm.cli import run
+from pdsm.cli import run_all_versions
+from pdsm.cli import RunOptions
+from pdsm.column_stats import partition_column_statistics
+from pdsm.column_stats import publish_column_statistics
+from pdsm.column_stats import StatisticsCache
+from pdsm.dataset import Dataset
+from pdsm.dataset import get_versions
+from pdsm.dataset import IGNORED_MATCHER
+from pdsm.dataset import PARTITION_MATCHER
+from pdsm.dataset import probe_fingerprint
+from pdsm.dataset import version_key
+from pdsm.ddl import DDLCatalog
+from pdsm.discover import compile_matcher
+from pdsm.external import ExternalSortedSet
+from pdsm.fingerprint import Fingerprint
+from pdsm.glue import Table
+from pdsm.inventory import Inventory
+from pdsm.keys import KeyClassifier
+from pdsm.limiter import AIMDLimiter
+from pdsm.limiter import is_throttled
+from pdsm.listing import configure_fast_list
+from pdsm.listing import instrument as instrument_listing
+from pdsm.listing import ListingStore
+from pdsm.listing import parse_timestamp
+from pdsm.listing import UNIX_EPOCH
+from pdsm.mirror import Mirror
+from pdsm.models import Column
+from pdsm.models import Partition
+from pdsm.parquet.ttypes import ColumnChunk
+from pdsm.parquet.ttypes import ColumnMetaData
+from pdsm.parquet.ttypes import FileMetaData
+from pdsm.parquet.ttypes import RowGroup
+from pdsm.parquet.ttypes import SchemaElement
+from pdsm.parquet.ttypes import Statistics
+from pdsm.projection import infer_projection
+from pdsm.registry import DatasetRegistry
+from pdsm.registry import get_watermark
+from pdsm.schema import FooterCache
+from pdsm.service import create_server
+from pdsm.service import SyncService
+from pdsm.stats import StatsCollector
+from pdsm.storage import S3Storage
+from pdsm.sync import diff_partitions
+from pdsm.sync import PrunePolicy
+from pdsm.sync import sync_tables
+from pdsm.sync import SyncError
+from pdsm.sync import Target
+from pdsm.sync import UPDATE
+
+try:
+    from urllib.error import HTTPError
+    from urllib.request import Request
+    from urllib.request import urlopen
+except ImportError:  # pragma: no cover
+    from urllib2 import HTTPError  # type: ignore
+    from urllib2 import Request  # type: ignore
+    from urllib2 import urlopen  # type: ignore
 
 
 def test_main():
@@ -9,3 +93,920 @@ def test_main():
 
     assert result.output == '()\n'
     assert result.exit_code == 0
+
+
+def test_trace_export(tmpdir):
+    tracer = trace.enable()
+    try:
+        with trace.span('run', cat='dataset', src='s3://bucket/dataset/'):
+            with trace.span('load_dataset') as span:
+                span.set(partitions=2)
+    finally:
+        trace.disable()
+
+    path = str(tmpdir.join('trace.json'))
+    tracer.export(path)
+    with open(path) as fp:
+        events = json.load(fp)['traceEvents']
+
+    assert [e['name'] for e in events] == ['load_dataset', 'run']
+    assert events[0]['args'] == {'partitions': 2}
+    assert events[1]['ts'] <= events[0]['ts']
+    assert trace.span('disabled') is trace.NULL_SPAN
+
+
+def test_inventory_list_object_summaries(tmpdir):
+    config = tmpdir.mkdir('inventory').mkdir('bucket').mkdir('daily')
+    rows = [
+        ['bucket', 'dataset/v1/day%3D20180102/part-0.parquet', '100', '2018-01-02T05:00:00.000Z'],
+        ['bucket', 'dataset/v1/day%3D20180101/part-0.parquet', '100', '2018-01-01T05:00:00.000Z'],
+        ['bucket', 'dataset/v1/day%3D20180101/_SUCCESS', '0', '2018-01-01T05:00:00.000Z'],
+        ['bucket', 'dataset/v1/day%3D20180101/_metadata', '100', '2018-01-01T05:00:00.000Z'],
+        ['bucket', 'other/v1/day%3D20180101/part-0.parquet', '100', '2018-01-01T05:00:00.000Z'],
+    ]
+    data = io.BytesIO()
+    with gzip.GzipFile(fileobj=data, mode='wb') as fp:
+        fp.write(''.join(','.join('"{}"'.format(v) for v in row) + '\n' for row in rows).encode('utf-8'))
+    config.mkdir('data').join('0.csv.gz').write_binary(data.getvalue())
+    config.mkdir('2018-01-03T00-00Z').join('manifest.json').write(json.dumps({
+        'sourceBucket': 'bucket',
+        'destinationBucket': 'arn:aws:s3:::inventory',
+        'fileFormat': 'CSV',
+        'fileSchema': 'Bucket, Key, Size, LastModifiedDate',
+        'creationTimestamp': '1514937600000',
+        'files': [{'key': 'inventory/bucket/daily/data/0.csv.gz', 'size': 1, 'MD5checksum': ''}],
+    }))
+
+    inventory = Inventory.load(str(config.join('2018-01-03T00-00Z')))
+    summaries = list(inventory.list_object_summaries('bucket', 'dataset/v1/'))
+
+    assert [s['Key'] for s in summaries] == [
+        'dataset/v1/day=20180101/part-0.parquet',
+        'dataset/v1/day=20180102/part-0.parquet',
+    ]
+    assert summaries[1]['LastModified'].day == 2
+
+    # the manifest is only read once, later datasets use the index
+    config.join('data', '0.csv.gz').remove()
+    assert [s['Key'] for s in inventory.list_object_summaries('bucket', 'other/')] == [
+        'other/v1/day=20180101/part-0.parquet']
+    assert list(inventory.list_object_summaries('bucket', 'missing/')) == []
+
+
+def test_sync_tables_concurrently(monkeypatch):
+    started = []
+    both_started = threading.Event()
+
+    def sync_table(desired, table_name, *args):
+        started.append(table_name)
+        if len(started) == 2:
+            both_started.set()
+        # only returns once the other table started as well, which needs a second thread
+        assert both_started.wait(5)
+        if table_name == 'broken':
+            raise IOError('unavailable')
+
+    monkeypatch.setattr(sync_module, '_sync_table', sync_table)
+    sync_tables(None, ['dataset_v1', 'dataset'])
+    assert sorted(started) == ['dataset', 'dataset_v1']
+
+    # the other table still finishes and the error reaches the caller
+    del started[:]
+    both_started.clear()
+    with pytest.raises(IOError):
+        sync_tables(None, ['dataset_v1', 'broken'])
+    assert sorted(started) == ['broken', 'dataset_v1']
+
+
+def test_infer_projection():
+    columns = [Column('a', 'int')]
+    partition_keys = [Column('submission_date', 'string'), Column('sample_id', 'string'), Column('channel', 'string')]
+    partitions = [
+        Partition(['20180101', '0', 'release'], columns, 's3://bucket/dataset/v1/...'),
+        Partition(['20180103', '99', 'beta'], columns, 's3://bucket/dataset/v1/...'),
+    ]
+
+    parameters = infer_projection('s3://bucket/dataset/v1/', partition_keys, partitions)
+
+    assert parameters['projection.enabled'] == 'true'
+    assert parameters['projection.submission_date.type'] == 'date'
+    assert parameters['projection.submission_date.format'] == 'yyyyMMdd'
+    assert parameters['projection.submission_date.range'] == '20180101,20180103'
+    assert parameters['projection.sample_id.type'] == 'integer'
+    assert parameters['projection.sample_id.range'] == '0,99'
+    assert parameters['projection.channel.type'] == 'enum'
+    assert parameters['projection.channel.values'] == 'beta,release'
+    assert parameters['storage.location.template'] == (
+        's3://bucket/dataset/v1/submission_date=${submission_date}/sample_id=${sample_id}/channel=${channel}/')
+
+
+def test_version_key():
+    locations = ['s3://bucket/dataset/v10/', 's3://bucket/dataset/v9/', 's3://bucket/dataset/v1/']
+    assert sorted(locations, key=version_key)[-1] == 's3://bucket/dataset/v10/'
+
+
+def test_registry_skips_unchanged(tmpdir):
+    path = str(tmpdir.join('registry.json'))
+    registry = DatasetRegistry.load(path)
+    registry.entries['s3://bucket/dataset/'] = {
+        'versions': ['s3://bucket/dataset/v9/', 's3://bucket/dataset/v10/'],
+        'latest': 's3://bucket/dataset/v10/',
+        'watermark': '2:s3://bucket/dataset/v10/day=20180102/',
+        'synced': None,
+    }
+    assert not registry.is_unchanged('s3://bucket/dataset')
+
+    registry.mark_synced('s3://bucket/dataset')
+    registry.save()
+
+    registry = DatasetRegistry.load(path)
+    assert registry.is_unchanged('s3://bucket/dataset')
+    registry.entries['s3://bucket/dataset/']['watermark'] = '3:s3://bucket/dataset/v10/day=20180103/'
+    assert not registry.is_unchanged('s3://bucket/dataset')
+
+
+def test_watermark_covers_nested_partitions(tmpdir):
+    root = tmpdir.mkdir('dataset')
+    location = 'file://{}/v1/'.format(root)
+    root.join('v1', 'day=20180101', 'type=a', 'part-0.parquet').write('0' * 10, ensure=True)
+    watermarks = [get_watermark(location)]
+    root.join('v1', 'day=20180101', 'type=b', 'part-0.parquet').write('0' * 10, ensure=True)
+    watermarks.append(get_watermark(location))
+    part = root.join('v1', 'day=20180101', 'type=b', 'part-1.parquet')
+    part.write('0' * 10, ensure=True)
+    for path in root.join('v1', 'day=20180101', 'type=b').listdir():
+        path.setmtime(1000000000)
+    watermarks.append(get_watermark(location))
+    part.setmtime(1000000001)
+    watermarks.append(get_watermark(location))
+    assert len(set(watermarks)) == 4
+    # files added to older partitions do not change it
+    root.join('v1', 'day=20171231', 'type=a', 'part-1.parquet').write('0' * 10, ensure=True)
+    watermark = get_watermark(location)
+    root.join('v1', 'day=20171231', 'type=a', 'part-2.parquet').write('0' * 10, ensure=True)
+    assert get_watermark(location) == watermark
+
+
+def test_compile_matcher():
+    matcher = compile_matcher(include=['s3://bucket-a/*', 's3://bucket-b/main_*'], exclude=['*_test'])
+
+    assert matcher.match('s3://bucket-a/root/dataset')
+    assert matcher.match('s3://bucket-b/main_summary')
+    assert not matcher.match('s3://bucket-b/crash_summary')
+    assert not matcher.match('s3://bucket-a/root/dataset_test')
+    assert compile_matcher().match('s3://bucket-c/anything')
+
+
+def test_external_sorted_set(tmpdir):
+    with ExternalSortedSet(max_items=3, tmpdir=str(tmpdir)) as sorted_set:
+        sorted_set.update(['d/', 'a/', 'c/', 'a/', 'e/', 'b/', 'c/'])
+        assert len(sorted_set.runs) == 2
+        assert list(sorted_set) == ['a/', 'b/', 'c/', 'd/', 'e/']
+        assert sorted_set.largest == 'e/'
+    assert tmpdir.listdir() == []
+
+
+def test_diff_partitions():
+    columns = [Column('a', 'int')]
+    old_columns = [Column('a', 'bigint')]
+    desired = [Partition([v], columns, 's3://bucket/dataset/v1/x={}/'.format(v)) for v in ['1', '2', '3']]
+    existing = [
+        Partition(['0'], columns, 's3://bucket/dataset/v1/x=0/'),
+        Partition(['2'], old_columns, 's3://bucket/dataset/v1/x=2/'),
+    ]
+
+    actions = [(action, p.location) for action, p in diff_partitions(iter(desired), existing, frozenset(columns))]
+
+    assert actions == [
+        ('add', 's3://bucket/dataset/v1/x=1/'),
+        ('update', 's3://bucket/dataset/v1/x=2/'),
+        ('add', 's3://bucket/dataset/v1/x=3/'),
+    ]
+
+
+class FakeTable(Table):
+    __slots__ = ['partitions', 'calls']
+
+    def __init__(self, partitions):
+        super(FakeTable, self).__init__('telemetry', 'dataset_v1', [], 's3://bucket/dataset/v1/', [])
+        self.partitions = partitions
+        self.calls = 0
+
+    def list_partitions(self, segment=None, total_segments=None):
+        self.calls += 1
+        return [p for i, p in enumerate(self.partitions) if total_segments is None or i % total_segments == segment]
+
+
+def test_mirror(tmpdir):
+    columns = [Column('a', 'int')]
+    partitions = [Partition([v], columns, 's3://bucket/dataset/v1/x={}/'.format(v)) for v in ['3', '1', '2']]
+    table = FakeTable(partitions)
+    mirror = Mirror(str(tmpdir.join('mirror.db')), segments=2)
+
+    assert [p.values for p in mirror.list_partitions(table)] == [['1'], ['2'], ['3']]
+    assert table.calls == 2
+
+    mirror.record(table, [Partition(['4'], columns, 's3://bucket/dataset/v1/x=4/')])
+    assert [p.values for p in mirror.list_partitions(table)] == [['1'], ['2'], ['3'], ['4']]
+    assert [p.values for p in mirror.list_partitions(table, batch_size=2)] == [['1'], ['2'], ['3'], ['4']]
+    assert table.calls == 2
+
+    mirror.refresh(table)
+    assert [p.values for p in mirror.list_partitions(table)] == [['1'], ['2'], ['3']]
+
+
+class HiveStruct(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class HiveTypes(object):
+    FieldSchema = HiveStruct
+    Partition = HiveStruct
+    SerDeInfo = HiveStruct
+    StorageDescriptor = HiveStruct
+    Table = HiveStruct
+
+    class NoSuchObjectException(Exception):
+        pass
+
+
+class StandInMetastore(object):
+    def __init__(self):
+        self.tables = {}
+        self.partitions = {}
+
+    def get_table(self, db_name, tbl_name):
+        if (db_name, tbl_name) not in self.tables:
+            raise HiveTypes.NoSuchObjectException()
+        return self.tables[db_name, tbl_name]
+
+    def create_table(self, tbl):
+        self.tables[tbl.dbName, tbl.tableName] = tbl
+
+    def get_partition_names(self, db_name, tbl_name, max_parts):
+        return sorted(k[2] for k in self.partitions if k[:2] == (db_name, tbl_name))
+
+    def get_partitions_by_names(self, db_name, tbl_name, names):
+        return [self.partitions[db_name, tbl_name, name] for name in names]
+
+    def add_partitions(self, new_parts):
+        for part in new_parts:
+            self.partitions[part.dbName, part.tableName, '/'.join(part.values)] = part
+
+    def alter_partitions(self, db_name, tbl_name, new_parts):
+        self.add_partitions(new_parts)
+
+
+def test_hive_metastore_catalog():
+    metastore = StandInMetastore()
+    catalog = HiveMetastoreCatalog('localhost', client_factory=lambda: metastore, ttypes=HiveTypes, batch_size=2)
+    columns = [Column('a', 'int')]
+    partition_keys = [Column('x', 'string')]
+
+    assert catalog.get_table('telemetry', 'dataset_v1') is None
+    catalog.create_table('telemetry', 'dataset_v1', columns, 's3://bucket/dataset/v1/', partition_keys)
+    table = catalog.get_table('telemetry', 'dataset_v1')
+    assert table.location == 's3://bucket/dataset/v1/'
+    assert table.partition_keys == partition_keys
+
+    partitions = [Partition([v], columns, 's3://bucket/dataset/v1/x={}/'.format(v)) for v in '123']
+    catalog.add_partitions(table, partitions)
+    catalog.update_partitions(table, [Partition(['2'], [Column('a', 'bigint')], 's3://bucket/dataset/v1/x=2/')])
+
+    listed = list(catalog.list_partitions(table))
+    assert [p.location for p in listed] == [p.location for p in partitions]
+    assert listed[1].columns == [Column('a', 'bigint')]
+    assert [p.values for p in catalog.list_partitions(table, 1, 2)] == [['3']]
+
+
+class StandInTransport(object):
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class BrokenMetastore(StandInMetastore):
+    def __init__(self):
+        super(BrokenMetastore, self).__init__()
+        self._oprot = HiveStruct(trans=StandInTransport())
+
+    def drop_table(self, db_name, tbl_name, delete_data):
+        raise IOError('connection reset')
+
+
+def test_hive_metastore_catalog_discards_broken_connections():
+    clients = []
+
+    def connect():
+        clients.append(BrokenMetastore())
+        return clients[-1]
+
+    catalog = HiveMetastoreCatalog('localhost', pool_size=1, client_factory=connect, ttypes=HiveTypes)
+    assert catalog.get_table('telemetry', 'dataset_v1') is None
+    with pytest.raises(IOError):
+        catalog.drop_table('telemetry', 'dataset_v1')
+    assert catalog.get_table('telemetry', 'dataset_v1') is None
+    assert [client._oprot.trans.closed for client in clients] == [True, False]
+
+    with pytest.raises(CatalogError):
+        get_catalog('hive', 'localhost:thrift')
+
+
+def test_ddl_catalog_packs_partitions():
+    out = io.StringIO()
+    catalog = DDLCatalog(GlueCatalog(), out, dialect='athena')
+    catalog.max_partitions = 2
+    columns = [Column('a', 'int')]
+    keys = [Column('x', 'string')]
+    table = catalog.create_table('telemetry', 'dataset_v1', columns, 's3://bucket/dataset/v1/', keys)
+    partitions = [Partition([v], columns, 's3://bucket/dataset/v1/x={}/'.format(v)) for v in '123']
+
+    assert list(catalog.list_partitions(table)) == []
+    catalog.add_partitions(table, partitions)
+
+    statements = out.getvalue().split(';\n\n')
+    assert statements[0].startswith('CREATE EXTERNAL TABLE `telemetry`.`dataset_v1` (\n  `a` int\n)\n'
+                                    'PARTITIONED BY (\n  `x` string\n)')
+    assert statements[1:] == [
+        "ALTER TABLE `telemetry`.`dataset_v1` ADD IF NOT EXISTS\n"
+        "PARTITION (`x` = '1') LOCATION 's3://bucket/dataset/v1/x=1'\n"
+        "PARTITION (`x` = '2') LOCATION 's3://bucket/dataset/v1/x=2'",
+        "ALTER TABLE `telemetry`.`dataset_v1` ADD IF NOT EXISTS\n"
+        "PARTITION (`x` = '3') LOCATION 's3://bucket/dataset/v1/x=3'",
+        '',
+    ]
+
+    out.seek(0)
+    out.truncate()
+    catalog.update_table('telemetry', 'dataset_v1', columns, 's3://bucket/dataset/v2/', keys, {'b': '2'})
+    catalog.update_table('telemetry', 'dataset_v1', columns, 's3://bucket/dataset/v2/', keys)
+    assert out.getvalue().split(';\n\n')[1:] == [
+        "ALTER TABLE `telemetry`.`dataset_v1` SET LOCATION 's3://bucket/dataset/v2'",
+        "ALTER TABLE `telemetry`.`dataset_v1` SET TBLPROPERTIES ('b' = '2')",
+        "ALTER TABLE `telemetry`.`dataset_v1` REPLACE COLUMNS (\n  `a` int\n)",
+        '',
+    ]
+
+    out = io.StringIO()
+    catalog = DDLCatalog(GlueCatalog(), out, dialect='hive')
+    catalog.create_table('telemetry', 'dataset_v1', columns, 's3://bucket/dataset/v1/', keys, {'b': '2'})
+    catalog.update_table('telemetry', 'dataset_v1', columns, 's3://bucket/dataset/v1/', keys)
+    assert out.getvalue().split(';\n\n')[1:] == [
+        "ALTER TABLE `telemetry`.`dataset_v1` REPLACE COLUMNS (\n  `a` int\n)",
+        "ALTER TABLE `telemetry`.`dataset_v1` UNSET TBLPROPERTIES IF EXISTS ('b')",
+        '',
+    ]
+
+
+def write_parquet_footer(path, metadata):
+    transport = TTransport.TMemoryBuffer()
+    metadata.write(TCompactProtocol.TCompactProtocol(transport))
+    footer = transport.getvalue()
+    path.write_binary(b'PAR1' + footer + struct.pack('<i', len(footer)) + b'PAR1', ensure=True)
+
+
+def test_file_storage_dataset(tmpdir):
+    schema = [
+        SchemaElement(name='schema', num_children=2),
+        SchemaElement(name='id', type=2, repetition_type=0),
+        SchemaElement(name='name', type=6, repetition_type=1),
+    ]
+    root = tmpdir.mkdir('dataset')
+    for day in ('20180101', '20180102'):
+        write_parquet_footer(root.join('v1', 'day={}'.format(day), 'part-0.parquet'),
+                             FileMetaData(version=1, schema=schema, num_rows=0, row_groups=[]))
+    root.join('v1', 'day=20180102', '_SUCCESS').write('', ensure=True)
+
+    assert list(get_versions('file://{}'.format(root))) == ['file://{}/v1/'.format(root)]
+
+    dataset = Dataset.get('file://{}/v1'.format(root))
+
+    assert dataset.columns == [Column('id', 'bigint'), Column('name', 'string')]
+    assert dataset.partition_keys == [Column('day', 'string')]
+    assert [p.location for p in dataset.partitions] == [
+        'file://{}/v1/day=20180101/'.format(root),
+        'file://{}/v1/day=20180102/'.format(root),
+    ]
+
+
+def test_dataset_stats(tmpdir):
+    schema = [SchemaElement(name='schema', num_children=1), SchemaElement(name='id', type=2, repetition_type=0)]
+    root = tmpdir.mkdir('dataset')
+    for name, num_rows in (('part-0', 10), ('part-1', 30)):
+        write_parquet_footer(root.join('v1', 'day=20180101', name + '.parquet'),
+                             FileMetaData(version=1, schema=schema, num_rows=num_rows, row_groups=[]))
+    size = root.join('v1', 'day=20180101', 'part-0.parquet').size()
+
+    dataset = Dataset.get('file://{}/v1'.format(root), stats=StatsCollector())
+    location = 'file://{}/v1/day=20180101/'.format(root)
+    expected = {'numFiles': '2', 'numRows': '40', 'totalSize': str(2 * size)}
+
+    assert dataset.partitions[0].parameters == expected
+    assert dataset.stats.table_parameters() == expected
+
+    existing = [Partition(['20180101'], dataset.columns, location, {'numRows': '10', 'other': 'x'})]
+    diff = list(diff_partitions(iter(dataset.partitions), existing, frozenset(dataset.columns)))
+    assert [(action, p.parameters) for action, p in diff] == [(UPDATE, dict(expected, other='x'))]
+
+    dataset = Dataset.get('file://{}/v1'.format(root), stats=StatsCollector(sample=1))
+    assert dataset.partitions[0].parameters['numRows'] in ('20', '60')
+
+
+def test_partition_column_statistics(tmpdir):
+    schema = [
+        SchemaElement(name='schema', num_children=4),
+        SchemaElement(name='id', type=2, repetition_type=1),
+        SchemaElement(name='score', type=5, repetition_type=1),
+        SchemaElement(name='name', type=6, repetition_type=1),
+        SchemaElement(name='tags', type=2, repetition_type=2),
+    ]
+    partition = tmpdir.mkdir('dataset').join('v1', 'day=20180101')
+    for idx, (low, high, nulls) in enumerate([(5, 10, 0), (-3, 7, 2)]):
+        columns = [
+            ColumnChunk(file_offset=0, meta_data=ColumnMetaData(
+                type=2, path_in_schema=['id'], num_values=10, statistics=Statistics(
+                    min=struct.pack('<q', low), max=struct.pack('<q', high), null_count=nulls))),
+            ColumnChunk(file_offset=0, meta_data=ColumnMetaData(
+                type=5, path_in_schema=['score'], num_values=10, statistics=None)),
+            ColumnChunk(file_offset=0, meta_data=ColumnMetaData(
+                type=6, path_in_schema=['name'], num_values=10, statistics=Statistics(
+                    min=b'a', max=b'z', null_count=0))),
+            ColumnChunk(file_offset=0, meta_data=ColumnMetaData(
+                type=2, path_in_schema=['tags'], num_values=30, statistics=Statistics(
+                    min=struct.pack('<q', 0), max=struct.pack('<q', 1), null_count=0))),
+        ]
+        row_groups = [RowGroup(columns=columns, total_byte_size=100, num_rows=10)]
+        write_parquet_footer(partition.join('part-{}.parquet'.format(idx)),
+                             FileMetaData(version=1, schema=schema, num_rows=10, row_groups=row_groups))
+
+    statistics = partition_column_statistics('file://{}/'.format(partition))
+
+    assert [s.name for s in statistics] == ['id']
+    assert statistics[0].to_input('bigint', None)['StatisticsData'] == {
+        'Type': 'LONG',
+        'LongColumnStatisticsData': {
+            'MinimumValue': -3, 'MaximumValue': 10, 'NumberOfNulls': 2, 'NumberOfDistinctValues': 14,
+        },
+    }
+
+    class StatisticsCatalog(Catalog):
+        published = []
+
+        def update_column_statistics(self, table, partition, statistics):
+            self.published.append((partition.location, [s['ColumnName'] for s in statistics]))
+
+    other = tmpdir.join('dataset', 'v1', 'day=20180102')
+    other.ensure(dir=True)
+    partition.join('part-0.parquet').copy(other)
+    table = Table('telemetry', 'dataset_v1', [Column('id', 'bigint'), Column('tags', 'array<bigint>')],
+                  'file://{}/'.format(tmpdir.join('dataset', 'v1')), [Column('day', 'string')])
+    partitions = [Partition([day], table.columns, 'file://{}/'.format(path))
+                  for day, path in (('20180101', partition), ('20180102', other))]
+    catalog = StatisticsCatalog()
+    cache = StatisticsCache()
+    publish_column_statistics(catalog, table, partitions, workers=1, cache=cache)
+    # the statistics of every partition are cached for the next table
+    other.remove()
+    publish_column_statistics(catalog, table, partitions, cache=cache)
+    assert catalog.published == [(p.location, ['id']) for p in partitions] * 2
+
+
+def test_analyze(tmpdir):
+    schema = [SchemaElement(name='schema', num_children=1), SchemaElement(name='id', type=2, repetition_type=0)]
+    row_groups = [RowGroup(columns=[], total_byte_size=1000, num_rows=10)]
+    root = tmpdir.mkdir('dataset')
+    for day, count in (('20180101', 3), ('20180102', 1)):
+        for idx in range(count):
+            write_parquet_footer(root.join('v1', 'day={}'.format(day), 'part-{}.parquet'.format(idx)),
+                                 FileMetaData(version=1, schema=schema, num_rows=10, row_groups=row_groups))
+
+    result = CliRunner().invoke(main, ['analyze', 'file://{}'.format(root), '--small-file-size', '1024'])
+
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert lines[0].startswith('file://{}/v1/ files=4 '.format(root))
+    assert 'small_ratio=1.00 row_groups=2 mean_row_group_size=1000' in lines[0]
+    size = root.join('v1', 'day=20180102', 'part-0.parquet').size()
+    assert lines[-2:] == [
+        'compaction candidates:',
+        '  day=20180101/ excess_files=2 small_files=3 size={}'.format(3 * size),
+    ]
+
+
+def test_aimd_limiter():
+    limiter = AIMDLimiter(initial=4, max_limit=5, cooldown=60)
+    for _ in range(4):
+        limiter.acquire()
+    for latency in (0.1, 0.1, 0.5, 0.1):
+        limiter.release(latency)
+    assert limiter.in_flight == 0
+    assert 4.5 < limiter.limit < 5
+
+    assert limiter.backoff() is True
+    assert limiter.backoff() is False
+    assert 2 < limiter.limit < 2.5
+
+    controller = limiter_module.configure(prefix_depth=1)
+    assert controller.partition({'Bucket': 'bucket', 'Prefix': 'dataset/v1/'}) == 'bucket/dataset'
+    controller.limiter('bucket/dataset')
+    assert metrics.snapshot()['s3.limit.bucket/dataset'] == 16
+    assert is_throttled((None, {'Error': {'Code': 'SlowDown'}}))
+
+
+def test_fingerprint_probe(tmpdir):
+    schema = [SchemaElement(name='schema', num_children=1), SchemaElement(name='id', type=2, repetition_type=0)]
+    metadata = FileMetaData(version=1, schema=schema, num_rows=0, row_groups=[])
+    root = tmpdir.mkdir('dataset')
+    for day in ('20180101', '20180102'):
+        write_parquet_footer(root.join('v1', 'day={}'.format(day), 'part-0.parquet'), metadata)
+    location = 'file://{}/v1/'.format(root)
+
+    fingerprint = Fingerprint.decode(Dataset.get(location).fingerprint.encode())
+
+    assert (fingerprint.count, fingerprint.tail, fingerprint.tail_count) == (2, 'day=20180102/', 1)
+    assert probe_fingerprint(location, fingerprint)
+
+    write_parquet_footer(root.join('v1', 'day=20180101', 'part-1.parquet'), metadata)
+    assert probe_fingerprint(location, fingerprint)
+
+    write_parquet_footer(root.join('v1', 'day=20180102', 'part-1.parquet'), metadata)
+    assert not probe_fingerprint(location, fingerprint)
+
+    fingerprint = Dataset.get(location).fingerprint
+    write_parquet_footer(root.join('v1', 'day=20180103', 'part-0.parquet'), metadata)
+    assert not probe_fingerprint(location, fingerprint)
+    assert Fingerprint.decode('[]') is None
+
+
+def test_cli_import_is_lazy():
+    modules = ('botocore', 'thrift', 'pdsm.parquet.ttypes', 'dateutil', 'http.server', 'BaseHTTPServer')
+    code = 'import sys, pdsm.cli; print(" ".join(m for m in {!r} if m in sys.modules))'.format(modules)
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(pdsm.__file__)))
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    assert output.strip() == b''
+
+    # the command line stays quick to start, a generous bound that only trips on eager heavy imports
+    code = 'import time; start = time.time(); import pdsm.cli; print(time.time() - start)'
+    elapsed = float(subprocess.check_output([sys.executable, '-c', code], env=env))
+    assert elapsed < 1.0
+
+
+def test_sync_service():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def execute(**kwargs):
+        calls.append(kwargs)
+        started.set()
+        release.wait(5)
+
+    service = SyncService(execute, workers=2)
+    server = create_server(service, '127.0.0.1:0')
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    try:
+        request = Request(url + '/sync', data=json.dumps({'src': 's3://bucket/dataset'}).encode('utf-8'))
+        assert json.loads(urlopen(request).read().decode('utf-8'))['state'] == 'queued'
+        assert started.wait(5)
+        # the requests arrive while the first run is in flight and collapse into one more run,
+        # the version request of the same dataset waits for it instead of running alongside
+        service.submit('s3://bucket/dataset/')
+        service.submit('s3://bucket/dataset', version='3')
+        service.submit('s3://bucket/dataset')
+        release.set()
+        assert service.wait(5)
+
+        status = json.loads(urlopen(url + '/status').read().decode('utf-8'))['datasets']
+        assert [(s['src'], s['requests'], s['runs'], s['state'], s['queued']) for s in status] == [
+            ('s3://bucket/dataset/', 4, 2, 'idle', [])]
+        assert calls == [
+            {'src': 's3://bucket/dataset/', 'version': None, 'alias': None},
+            {'src': 's3://bucket/dataset/', 'version': None, 'alias': None},
+            {'src': 's3://bucket/dataset/', 'version': '3', 'alias': None},
+        ]
+        assert json.loads(urlopen(url + '/metrics').read().decode('utf-8'))['service.coalesced'] >= 3
+
+        for body in ({}, {'src': ''}, {'src': 1}, {'src': 's3://bucket/dataset', 'version': 3}, []):
+            with pytest.raises(HTTPError) as error:
+                urlopen(Request(url + '/sync', data=json.dumps(body).encode('utf-8')))
+            assert error.value.code == 400
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        service.close()
+
+
+def test_footer_cache():
+    cache = FooterCache(2)
+    for key in ('a', 'b'):
+        cache.put(('bucket', key, 1), FileMetaData(version=1))
+    assert cache.get(('bucket', 'a', 1)) is not None
+    cache.put(('bucket', 'c', 1), FileMetaData(version=1))
+    assert cache.get(('bucket', 'b', 1)) is None
+    assert sorted(key for _, key, _ in cache.entries) == ['a', 'c']
+
+
+class MemoryCatalog(Catalog):
+    __slots__ = ['tables', 'partitions', 'fail', 'operations']
+
+    def __init__(self, fail=False):
+        self.tables = {}
+        self.partitions = {}
+        self.fail = fail
+        self.operations = []
+
+    def get_table(self, database_name, name):
+        if self.fail:
+            raise IOError('unavailable')
+        return self.tables.get((database_name, name))
+
+    def create_table(self, database_name, name, columns, location, partition_keys, parameters=None):
+        table = Table(database_name, name, columns, location, partition_keys, parameters)
+        self.tables[(database_name, name)] = table
+        return table
+
+    def list_partitions(self, table, segment=None, total_segments=None):
+        return list(self.partitions.get((table.database_name, table.name), []))
+
+    def update_table(self, database_name, name, columns, location, partition_keys, parameters=None):
+        self.operations.append(('update_table', name, location))
+        return self.create_table(database_name, name, columns, location, partition_keys, parameters)
+
+    def drop_table(self, database_name, name):
+        self.operations.append(('drop_table', name))
+        del self.tables[(database_name, name)]
+        self.partitions.pop((database_name, name), None)
+
+    def add_partitions(self, table, partitions):
+        self.operations.append(('add_partitions', table.name, [p.location for p in partitions]))
+        self.partitions.setdefault((table.database_name, table.name), []).extend(partitions)
+
+    def update_partitions(self, table, partitions):
+        self.operations.append(('update_partitions', table.name, [p.location for p in partitions]))
+        replaced = {tuple(p.values): p for p in partitions}
+        key = (table.database_name, table.name)
+        self.partitions[key] = [replaced.get(tuple(p.values), p) for p in self.partitions[key]]
+
+    def delete_partitions(self, table, partitions):
+        self.operations.append(('delete_partitions', table.name, [p.location for p in partitions]))
+        deleted = set(tuple(p.values) for p in partitions)
+        key = (table.database_name, table.name)
+        self.partitions[key] = [p for p in self.partitions[key] if tuple(p.values) not in deleted]
+
+
+def test_sync_targets(tmpdir):
+    schema = [SchemaElement(name='schema', num_children=1), SchemaElement(name='id', type=2, repetition_type=0)]
+    metadata = FileMetaData(version=1, schema=schema, num_rows=0, row_groups=[])
+    root = tmpdir.mkdir('dataset')
+    for day in ('20180101', '20180102'):
+        write_parquet_footer(root.join('v1', 'day={}'.format(day), 'part-0.parquet'), metadata)
+
+    glue, other = MemoryCatalog(), MemoryCatalog()
+    options = RunOptions(catalog=glue)
+    options.targets = [Target(glue, 'telemetry'), Target(glue, 'analysis'), Target(MemoryCatalog(fail=True), 'broken'),
+                       Target(other, 'telemetry', name='other:telemetry')]
+    with pytest.raises(SyncError) as excinfo:
+        run('file://{}'.format(root), version='v1', options=options)
+    assert str(excinfo.value).endswith(' to broken')
+
+    assert sorted(glue.tables) == [('analysis', 'dataset_v1'), ('telemetry', 'dataset_v1')]
+    assert list(other.tables) == [('telemetry', 'dataset_v1')]
+    for catalog, key in ((glue, ('analysis', 'dataset_v1')), (other, ('telemetry', 'dataset_v1'))):
+        assert [p.values for p in catalog.partitions[key]] == [['20180101'], ['20180102']]
+
+
+def test_profile_follows_worker_threads(tmpdir):
+    schema = [SchemaElement(name='schema', num_children=1), SchemaElement(name='id', type=2, repetition_type=0)]
+    metadata = FileMetaData(version=1, schema=schema, num_rows=0, row_groups=[])
+    root = tmpdir.mkdir('dataset')
+    for day in ('20180101', '20180102'):
+        write_parquet_footer(root.join('v1', 'day={}'.format(day), 'part-0.parquet'), metadata)
+
+    # both tables are synced on worker threads and still end up in the profile
+    catalog = MemoryCatalog()
+    path = str(tmpdir.join('dataset.prof'))
+    trace.profiled(path, run, 'file://{}/'.format(root), options=RunOptions(catalog=catalog))
+    for name in ('dataset_v1', 'dataset'):
+        assert [p.values for p in catalog.partitions[('telemetry', name)]] == [['20180101'], ['20180102']]
+    calls = [value[1] for key, value in pstats.Stats(path).stats.items() if key[2] == '_sync_table']
+    assert calls == [2]
+
+
+def test_promote_alias(tmpdir):
+    schema = [SchemaElement(name='schema', num_children=1), SchemaElement(name='id', type=2, repetition_type=0)]
+    metadata = FileMetaData(version=1, schema=schema, num_rows=0, row_groups=[])
+    root = tmpdir.mkdir('dataset')
+    for day in ('20180102', '20180103'):
+        write_parquet_footer(root.join('v2', 'day={}'.format(day), 'part-0.parquet'), metadata)
+    src = 'file://{}/'.format(root)
+
+    catalog = MemoryCatalog()
+    columns = [Column('id', 'bigint')]
+    keys = [Column('day', 'string')]
+    alias = catalog.create_table('telemetry', 'dataset', columns, src + 'v1/', keys)
+    catalog.add_partitions(alias, [Partition([day], columns, '{}v1/day={}/'.format(src, day))
+                                   for day in ('20180101', '20180102')])
+    catalog.operations = []
+
+    mirror = Mirror(str(tmpdir.join('mirror.db')))
+    run(src, options=RunOptions(catalog=catalog, mirror=mirror))
+
+    operations = [op for op in catalog.operations if op[1] == 'dataset']
+    assert operations == [
+        ('add_partitions', 'dataset', [src + 'v2/day=20180103/']),
+        ('update_partitions', 'dataset', [src + 'v2/day=20180102/']),
+        ('update_table', 'dataset', src + 'v2/'),
+        ('delete_partitions', 'dataset', [src + 'v1/day=20180101/']),
+    ]
+    assert sorted(p.location for p in catalog.partitions[('telemetry', 'dataset')]) == [
+        src + 'v2/day=20180102/', src + 'v2/day=20180103/']
+    assert catalog.tables[('telemetry', 'dataset')].location == src + 'v2/'
+
+    catalog.operations = []
+    run(src, options=RunOptions(catalog=catalog, mirror=mirror))
+    assert catalog.operations == []
+
+    # a version with other columns is never served alongside the previous one
+    schema = [SchemaElement(name='schema', num_children=1), SchemaElement(name='name', type=6, repetition_type=0)]
+    write_parquet_footer(root.join('v3', 'day=20180103', 'part-0.parquet'),
+                         FileMetaData(version=1, schema=schema, num_rows=0, row_groups=[]))
+    catalog.operations = []
+    run(src, options=RunOptions(catalog=catalog, mirror=mirror))
+    assert [op for op in catalog.operations if op[1] == 'dataset'] == [
+        ('drop_table', 'dataset'),
+        ('add_partitions', 'dataset', [src + 'v3/day=20180103/']),
+    ]
+    assert [p.location for p in catalog.partitions[('telemetry', 'dataset')]] == [src + 'v3/day=20180103/']
+
+
+def test_sync_updates_partitions_in_place(tmpdir):
+    schema = [SchemaElement(name='schema', num_children=1), SchemaElement(name='id', type=2, repetition_type=0)]
+    metadata = FileMetaData(version=1, schema=schema, num_rows=0, row_groups=[])
+    root = tmpdir.mkdir('dataset')
+    write_parquet_footer(root.join('v1', 'day=20180101', 'part-0.parquet'), metadata)
+    src = 'file://{}/'.format(root)
+
+    catalog = MemoryCatalog()
+    table = catalog.create_table('telemetry', 'dataset_v1', [Column('id', 'bigint')], src + 'v1/',
+                                 [Column('day', 'string')])
+    catalog.add_partitions(table, [Partition(['20180101'], [Column('id', 'int')], src + 'v1/day=20180101/')])
+    catalog.operations = []
+
+    run(src, version='v1', options=RunOptions(catalog=catalog))
+    assert catalog.operations == [('update_partitions', 'dataset_v1', [src + 'v1/day=20180101/'])]
+    assert catalog.partitions[('telemetry', 'dataset_v1')][0].columns == [Column('id', 'bigint')]
+
+
+def test_prune_partitions(tmpdir):
+    schema = [SchemaElement(name='schema', num_children=1), SchemaElement(name='id', type=2, repetition_type=0)]
+    metadata = FileMetaData(version=1, schema=schema, num_rows=0, row_groups=[])
+    root = tmpdir.mkdir('dataset')
+    days = ['201801{:02d}'.format(day) for day in range(1, 11)]
+    for day in days:
+        write_parquet_footer(root.join('v1', 'day={}'.format(day), 'part-0.parquet'), metadata)
+    root.join('v1', 'day=20180111', '_SUCCESS').write('', ensure=True)
+    src = 'file://{}/'.format(root)
+    location = src + 'v1/'
+
+    catalog = MemoryCatalog()
+    columns = [Column('id', 'bigint')]
+    table = catalog.create_table('telemetry', 'dataset_v1', columns, location, [Column('day', 'string')])
+    catalog.add_partitions(table, [Partition([day], columns, '{}day={}/'.format(location, day))
+                                   for day in ['20171231'] + days + ['20180111']])
+    catalog.add_partitions(table, [Partition(['x'], columns, 'file://{}/elsewhere/day=x/'.format(tmpdir))])
+    catalog.operations = []
+
+    options = RunOptions(catalog=catalog)
+    options.prune = PrunePolicy(probe=True)
+    with pytest.raises(SyncError):
+        run(src, version='v1', options=options)
+    options.prune = PrunePolicy(probe=True, threshold=0.5, dry_run=True)
+    run(src, version='v1', options=options)
+    assert catalog.operations == []
+
+    options.prune = PrunePolicy(probe=True, threshold=0.5)
+    run(src, version='v1', options=options)
+    assert [op[2] for op in catalog.operations] == [
+        ['{}day=20171231/'.format(location), 'file://{}/elsewhere/day=x/'.format(tmpdir)]]
+
+    options.prune = PrunePolicy(threshold=0.5)
+    run(src, version='v1', options=options)
+    assert catalog.operations[-1] == ('delete_partitions', 'dataset_v1', ['{}day=20180111/'.format(location)])
+    assert [p.values for p in catalog.partitions[('telemetry', 'dataset_v1')]] == [[day] for day in days]
+
+
+def test_run_all_versions(tmpdir):
+    schema = [SchemaElement(name='schema', num_children=1), SchemaElement(name='id', type=2, repetition_type=0)]
+    metadata = FileMetaData(version=1, schema=schema, num_rows=0, row_groups=[])
+    root = tmpdir.mkdir('dataset')
+    for version in ('v1', 'v2', 'v10'):
+        write_parquet_footer(root.join(version, 'day=20180101', 'part-0.parquet'), metadata)
+    src = 'file://{}/'.format(root)
+
+    catalog = MemoryCatalog()
+    run_all_versions(src, options=RunOptions(catalog=catalog), jobs=3)
+
+    assert sorted(catalog.tables) == [('telemetry', name) for name in
+                                      ('dataset', 'dataset_v1', 'dataset_v10', 'dataset_v2')]
+    assert catalog.tables[('telemetry', 'dataset')].location == src + 'v10/'
+
+
+def test_key_classifier():
+    prefix = 'dataset/v1/'
+    names = ['day=1', 'h=2', '_temporary', '_a=b', 'a=b=c', 'x=', 'plain', '', '_metadata', 'x_$folder$',
+             'ab_$folder$', 'k=__HIVE_DEFAULT_PARTITION__', 'part-0.parquet']
+    classifier = KeyClassifier(prefix, max_directories=4)
+    for first in names:
+        for second in names:
+            for third in names:
+                key = '{}{}/{}/{}'.format(prefix, first, second, third)
+                for size in (0, 100):
+                    expected = None
+                    if not IGNORED_MATCHER.match(key) and size >= 12 and '=__HIVE_DEFAULT_PARTITION__/' not in key:
+                        matches = PARTITION_MATCHER.match(key, len(prefix))
+                        expected = matches.group(1) + '/' if matches else ''
+                    assert classifier.classify(key, size) == expected, key
+
+
+def test_listing_store():
+    summaries = [
+        {'Key': u'ds/v1/d=2/b\u00e9.parquet', 'Size': 30, 'LastModified': UNIX_EPOCH + timedelta(days=2)},
+        {'Key': u'ds/v1/d=1/a.parquet', 'Size': 10, 'LastModified': UNIX_EPOCH + timedelta(seconds=1.5)},
+        {'Key': u'ds/v1/d=2/c.parquet', 'Size': 20, 'LastModified': UNIX_EPOCH + timedelta(days=2)},
+    ]
+    store = ListingStore()
+    for summary in summaries:
+        store.add(summary, summary['Key'][6:10])
+    assert len(store) == 3
+    assert list(store.summaries()) == summaries
+    assert [type(s['Size']) for s in store.summaries()] == [int] * 3
+    # python 2 arrays have no 64 bit integer typecode
+    assert [a.typecode for a in (store.ends, store.sizes, store.times, store.partitions)] == ['l', 'd', 'd', 'l']
+    assert store.order_by_last_modified() == [1, 0, 2]
+    assert store.latest() == 0
+    assert store.total_size() == 60
+    assert store.partition_totals() == {u'd=2/': (2, 50), u'd=1/': (1, 10)}
+    store.clear()
+    assert len(store) == 0 and store.latest() is None
+
+
+class ListingBody(object):
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+def list_result(keys, token=None):
+    contents = u''.join(
+        u'<Contents><Key>{}</Key><LastModified>2020-01-02T03:04:05.678Z</LastModified>'
+        u'<ETag>&quot;{:032x}&quot;</ETag><Size>{}</Size><StorageClass>STANDARD</StorageClass></Contents>'.format(
+            key, idx, 100 + idx) for idx, key in enumerate(keys))
+    return (u'<?xml version="1.0" encoding="UTF-8"?>\n'
+            u'<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/"><Name>bucket</Name>'
+            u'<Prefix>ds/v1/</Prefix><KeyCount>{}</KeyCount><MaxKeys>1000</MaxKeys><EncodingType>url</EncodingType>'
+            u'<IsTruncated>{}</IsTruncated>{}{}</ListBucketResult>'.format(
+                len(keys), 'true' if token else 'false',
+                u'<NextContinuationToken>{}</NextContinuationToken>'.format(token) if token else u'',
+                contents)).encode('utf-8')
+
+
+def test_fast_list(monkeypatch):
+    pages = {
+        None: list_result([u'ds/v1/d%3D1/a.parquet', u'ds/v1/d%3D1/b%20c.parquet'], token=u'next'),
+        u'next': list_result([u'ds/v1/d%3D2/%C3%A9.parquet']),
+    }
+
+    def before_send(request, **kwargs):
+        token = None
+        if 'continuation-token=' in request.url:
+            token = request.url.split('continuation-token=')[1].split('&')[0]
+        return AWSResponse(request.url, 200, {}, ListingBody(pages[token]))
+
+    client = botocore.session.get_session().create_client(
+        's3', region_name='us-east-1', aws_access_key_id='key', aws_secret_access_key='secret')
+    client.meta.events.register('before-send.s3.ListObjectsV2', before_send)
+    instrument_listing(client)
+    monkeypatch.setattr('pdsm.storage.get_client', lambda service_name: client)
+
+    storage = S3Storage()
+    expected = list(storage.list_objects('bucket', 'ds/v1/'))
+    configure_fast_list(True)
+    try:
+        summaries = list(storage.list_objects('bucket', 'ds/v1/'))
+        prefixes = client.list_objects_v2(Bucket='bucket', Prefix='ds/v1/')
+    finally:
+        configure_fast_list(False)
+    keys = [u'ds/v1/d=1/a.parquet', u'ds/v1/d=1/b c.parquet', u'ds/v1/d=2/\xe9.parquet']
+    assert [s['Key'] for s in summaries] == keys
+    assert summaries == [{k: s[k] for k in ('Key', 'Size', 'LastModified', 'ETag')} for s in expected]
+    assert prefixes['IsTruncated'] is True and prefixes['KeyCount'] == 2
+    assert prefixes['ResponseMetadata']['HTTPStatusCode'] == 200
+    assert parse_timestamp(u'2020-01-02T03:04:05.678Z') == parse_timestamp(u'2020-01-02T03:04:05.678000+00:00')